@@ -0,0 +1,109 @@
+"""工作流取消
+
+客户端断开连接或服务关闭时，通过 AgentState 中的 CancellationToken 通知整条工作流：
+尚未开始的 LLM 调用和代码执行直接放弃，进行中的 LLM 调用不再等待（流式调用在下一段到达时中止），
+进行中的代码执行由进程池终止对应的工作进程。
+"""
+import threading
+from typing import Any, Callable, List, Optional
+from app.core.logging_config import get_agent_logger
+
+logger = get_agent_logger('cancellation')
+
+
+class WorkflowCancelled(Exception):
+    """工作流已取消"""
+    pass
+
+
+class CancellationToken:
+    """可跨线程使用的取消令牌"""
+
+    def __init__(self, name: str = ""):
+        self.name = name
+        self.reason: Optional[str] = None
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._callbacks: List[Callable[[str], None]] = []
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def cancel(self, reason: str) -> bool:
+        """
+        取消工作流并依次调用已注册的回调
+
+        Returns:
+            本次调用是否触发了取消（重复取消返回 False）
+        """
+        with self._lock:
+            if self._event.is_set():
+                return False
+            self.reason = reason
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        logger.info(f"取消工作流{f' {self.name}' if self.name else ''}，原因: {reason}")
+        for callback in callbacks:
+            try:
+                callback(reason)
+            except Exception as e:
+                logger.warning(f"执行取消回调失败: {str(e)}")
+        return True
+
+    def add_callback(self, callback: Callable[[str], None]) -> Callable[[], None]:
+        """
+        注册取消时调用的回调（已取消时立即调用）
+
+        Returns:
+            注销该回调的函数
+        """
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+                return lambda: self._remove_callback(callback)
+        callback(self.reason)
+        return lambda: None
+
+    def _remove_callback(self, callback: Callable[[str], None]) -> None:
+        with self._lock:
+            if callback in self._callbacks:
+                self._callbacks.remove(callback)
+
+    def raise_if_cancelled(self) -> None:
+        """已取消时抛出 WorkflowCancelled"""
+        if self._event.is_set():
+            raise WorkflowCancelled(f"工作流已取消：{self.reason}")
+
+    def run(self, func: Callable[..., Any], *args: Any) -> Any:
+        """
+        在后台线程中执行阻塞调用（如 LLM 请求），取消时立即停止等待
+
+        已发出的请求无法撤回，取消后其结果被丢弃。
+
+        Raises:
+            WorkflowCancelled: 调用前或等待期间工作流被取消
+        """
+        self.raise_if_cancelled()
+        finished = threading.Event()
+        outcome: dict = {}
+
+        def target() -> None:
+            try:
+                outcome["value"] = func(*args)
+            except BaseException as e:
+                outcome["error"] = e
+            finally:
+                finished.set()
+
+        remove = self.add_callback(lambda reason: finished.set())
+        try:
+            threading.Thread(target=target, name="cancellable-call", daemon=True).start()
+            finished.wait()
+        finally:
+            remove()
+        if "error" in outcome:
+            raise outcome["error"]
+        if "value" not in outcome:
+            self.raise_if_cancelled()
+        return outcome["value"]
@@ -0,0 +1,54 @@
+"""代码块解析模块"""
+from typing import List
+
+
+class CodeFenceParser:
+    """增量解析 Markdown 代码块
+
+    流式接收模型输出，每当一个 ```<language> 代码块闭合就立即返回该代码块，
+    不必等待完整响应。按行解析，规则与一次性提取时相同：
+    以 ```<language> 开头的行开始代码块，内容仅为 ``` 的行结束代码块，未闭合的代码块被忽略。
+    """
+
+    def __init__(self, language: str = "python"):
+        self.language = language
+        self._pending = ""
+        self._in_block = False
+        self._current: List[str] = []
+
+    def feed(self, text: str) -> List[str]:
+        """
+        输入一段文本
+
+        Returns:
+            本次输入中闭合的代码块
+        """
+        self._pending += text
+        *lines, self._pending = self._pending.split('\n')
+        return self._process(lines)
+
+    def close(self) -> List[str]:
+        """输入结束，处理最后一行"""
+        lines = [self._pending] if self._pending else []
+        self._pending = ""
+        return self._process(lines)
+
+    def _process(self, lines: List[str]) -> List[str]:
+        blocks = []
+        for line in lines:
+            if line.strip().startswith(f'```{self.language}'):
+                self._in_block = True
+                self._current = []
+            elif line.strip() == '```' and self._in_block:
+                self._in_block = False
+                if self._current:
+                    blocks.append('\n'.join(self._current))
+            elif self._in_block:
+                self._current.append(line)
+        return blocks
+
+
+def extract_code_blocks(text: str, language: str = "python") -> List[str]:
+    """提取完整文本中指定语言的代码块"""
+    parser = CodeFenceParser(language)
+    return parser.feed(text) + parser.close()
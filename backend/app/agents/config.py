@@ -6,10 +6,11 @@ class AgentConfig:
     """Agent 配置类"""
     
     # LLM 提供商配置
-    LLM_PROVIDER: str = os.getenv("LLM_PROVIDER", "openai")  # 支持: openai, claude, local, mock
+    LLM_PROVIDER: str = os.getenv("LLM_PROVIDER", "openai")  # 支持: openai, claude, local, mock, replay
     LLM_MODEL: Optional[str] = os.getenv("LLM_MODEL")  # 如果为空则使用提供商默认模型
     LLM_TEMPERATURE: float = float(os.getenv("LLM_TEMPERATURE", "0.0"))
     LLM_FALLBACK_TO_MOCK: bool = os.getenv("LLM_FALLBACK_TO_MOCK", "true").lower() == "true"
+    LLM_PROMPT_CACHE_HINTS: bool = os.getenv("LLM_PROMPT_CACHE_HINTS", "true").lower() == "true"  # 是否发送提示词缓存提示
     
     # OpenAI API 配置
     OPENAI_API_KEY: Optional[str] = os.getenv("OPENAI_API_KEY")
@@ -21,9 +22,78 @@ class AgentConfig:
     # 本地 LLM 配置
     LOCAL_LLM_ENDPOINT: str = os.getenv("LOCAL_LLM_ENDPOINT", "http://localhost:8000")
     
+    # 录制/回放 LLM 配置（离线测试与压测）
+    REPLAY_FIXTURE_PATH: str = os.getenv("REPLAY_FIXTURE_PATH", "fixtures/llm_replay.json")
+    REPLAY_MODE: str = os.getenv("REPLAY_MODE", "replay")  # 支持: replay, record
+    REPLAY_RECORD_PROVIDER: str = os.getenv("REPLAY_RECORD_PROVIDER", "openai")  # 录制时实际调用的提供商
+    REPLAY_TTFT_MS: float = float(os.getenv("REPLAY_TTFT_MS", "0"))  # 模拟首 token 延迟（毫秒）
+    REPLAY_TTFT_JITTER_MS: float = float(os.getenv("REPLAY_TTFT_JITTER_MS", "0"))
+    REPLAY_LATENCY_DISTRIBUTION: str = os.getenv("REPLAY_LATENCY_DISTRIBUTION", "fixed")  # 支持: fixed, normal, lognormal
+    REPLAY_TOKENS_PER_SECOND: float = float(os.getenv("REPLAY_TOKENS_PER_SECOND", "0"))  # 0 表示不模拟生成耗时
+    REPLAY_SEED: int = int(os.getenv("REPLAY_SEED", "0"))
+    
     # 表格分析相关配置
     MAX_PREVIEW_ROWS: int = 21  # 包含表头的前21行
-    MAX_CODE_EXECUTION_TIME: int = 30  # 代码执行超时时间（秒）
+    MAX_CODE_EXECUTION_TIME: int = int(os.getenv("MAX_CODE_EXECUTION_TIME", "30"))  # 代码执行超时时间（秒）
+    STREAM_CODE_EXECUTION: bool = os.getenv("STREAM_CODE_EXECUTION", "true").lower() == "true"  # 流式接收分析响应，代码块闭合后立即执行
+    MAX_CODE_RETRIES: int = int(os.getenv("MAX_CODE_RETRIES", "1"))  # 代码执行失败后带错误信息和性能提示重新分析的次数
+    ANALYSIS_MODE: str = os.getenv("ANALYSIS_MODE", "code_fence")  # 支持: code_fence（从回答中提取代码块）, tools（结构化工具调用）
+    MAX_TOOL_ROUNDS: int = int(os.getenv("MAX_TOOL_ROUNDS", "4"))  # 工具调用模式下最多的调用轮数
+    MAX_PARALLEL_TOOL_CALLS: int = int(os.getenv("MAX_PARALLEL_TOOL_CALLS", "4"))  # 同一轮工具调用的最大并行数
+    
+    # 分析引擎：pandas（生成 Python 代码）、duckdb（生成 SQL，需要安装 duckdb）、polars（生成 Polars 代码，需要安装 polars）
+    ANALYSIS_ENGINE: str = os.getenv("ANALYSIS_ENGINE", "pandas")
+    DUCKDB_THREADS: int = int(os.getenv("DUCKDB_THREADS", "0"))  # 0 表示使用 DuckDB 默认值（CPU 核数）
+    DUCKDB_MEMORY_LIMIT: str = os.getenv("DUCKDB_MEMORY_LIMIT", "")  # 如 "2GB"，超出时溢出到临时目录
+    DUCKDB_TEMP_DIRECTORY: str = os.getenv("DUCKDB_TEMP_DIRECTORY", "")
+    DUCKDB_MAX_SESSIONS: int = int(os.getenv("DUCKDB_MAX_SESSIONS", "64"))  # 保留连接的会话数上限
+    SQL_MAX_RESULT_ROWS: int = int(os.getenv("SQL_MAX_RESULT_ROWS", "200"))  # SQL 结果最多展示的行数
+    
+    # 代码执行沙箱配置
+    CODE_EXECUTION_MODE: str = os.getenv("CODE_EXECUTION_MODE", "process")  # 支持: process, inline（仅用于调试）
+    CODE_EXECUTION_WORKERS: int = int(os.getenv("CODE_EXECUTION_WORKERS", "0"))  # 工作进程数，0 表示 CPU 核数
+    MAX_CODE_EXECUTION_CPU_TIME: int = int(os.getenv("MAX_CODE_EXECUTION_CPU_TIME", "30"))  # 单次执行 CPU 时间上限（秒）
+    MAX_CODE_EXECUTION_MEMORY_MB: int = int(os.getenv("MAX_CODE_EXECUTION_MEMORY_MB", "2048"))  # 工作进程内存上限，0 表示不限制
+    CODE_WORKER_MAX_TASKS: int = int(os.getenv("CODE_WORKER_MAX_TASKS", "200"))  # 工作进程执行多少个任务后回收
+    CODE_WORKER_RECYCLE_RSS_MB: int = int(os.getenv("CODE_WORKER_RECYCLE_RSS_MB", "1024"))  # 常驻内存超过该值时回收
+    SESSION_KERNELS_ENABLED: bool = os.getenv("SESSION_KERNELS_ENABLED", "true").lower() == "true"  # 保留会话中代码定义的变量供后续轮次使用
+    KERNEL_IDLE_TIMEOUT: int = int(os.getenv("KERNEL_IDLE_TIMEOUT", "1800"))  # 会话内核空闲超时（秒）
+    KERNEL_MAX_MEMORY_MB: int = int(os.getenv("KERNEL_MAX_MEMORY_MB", "512"))  # 单个会话内核保留变量的内存上限
+    KERNEL_MAX_PROMPT_VARIABLES: int = int(os.getenv("KERNEL_MAX_PROMPT_VARIABLES", "20"))  # 提示词中最多列出的变量数
+    EXECUTION_COPY_ON_WRITE: bool = os.getenv("EXECUTION_COPY_ON_WRITE", "true").lower() == "true"  # 使用 pandas 写时复制，执行前不深拷贝数据
+    COLUMN_PROJECTION_ENABLED: bool = os.getenv("COLUMN_PROJECTION_ENABLED", "true").lower() == "true"  # 执行时只加载代码引用的列
+    VECTORIZE_REWRITE_ENABLED: bool = os.getenv("VECTORIZE_REWRITE_ENABLED", "true").lower() == "true"  # 把逐行计算的写法改写为向量化写法
+    VECTORIZE_VERIFY_ROWS: int = int(os.getenv("VECTORIZE_VERIFY_ROWS", "1000"))  # 验证改写等价性的样本行数
+    PROGRESSIVE_EXECUTION_ENABLED: bool = os.getenv("PROGRESSIVE_EXECUTION_ENABLED", "true").lower() == "true"  # 大表先在样本上给出初步结果
+    PROGRESSIVE_MIN_ROWS: int = int(os.getenv("PROGRESSIVE_MIN_ROWS", "1000000"))  # 行数达到该值时先给出初步结果（0 表示不按行数判断）
+    PROGRESSIVE_MIN_SECONDS: float = float(os.getenv("PROGRESSIVE_MIN_SECONDS", "3"))  # 估计耗时达到该值时先给出初步结果再完整执行（0 表示不按耗时判断）
+    PROGRESSIVE_SAMPLE_ROWS: int = int(os.getenv("PROGRESSIVE_SAMPLE_ROWS", "100000"))  # 初步结果使用的样本行数
+    PROGRESSIVE_SAMPLE_SEED: int = int(os.getenv("PROGRESSIVE_SAMPLE_SEED", "0"))
+    PROGRESSIVE_MAX_OUTPUT_CHARS: int = 2000  # 初步结果最多展示的字符数
+    COST_ADMISSION_ENABLED: bool = os.getenv("COST_ADMISSION_ENABLED", "true").lower() == "true"  # 执行前估计代码耗时，决定直接执行、先给初步结果、只在样本上执行或拒绝
+    COST_MAX_SECONDS: float = float(os.getenv("COST_MAX_SECONDS", "0"))  # 估计耗时超过该值时只在样本上执行或拒绝执行（0 表示使用 MAX_CODE_EXECUTION_TIME）
+    PROMPT_CACHE_MAX_SESSIONS: int = 256  # 冻结的会话级数据上下文块最大数量
+    SPECULATIVE_DATA_CONTEXT: bool = os.getenv("SPECULATIVE_DATA_CONTEXT", "true").lower() == "true"  # 意图分类时推测性加载数据
+    SPECULATIVE_DATA_CONTEXT_WORKERS: int = int(os.getenv("SPECULATIVE_DATA_CONTEXT_WORKERS", "4"))
+    
+    # 代码执行结果缓存（按文件内容哈希 + 规范化代码哈希）
+    RESULT_CACHE_ENABLED: bool = os.getenv("RESULT_CACHE_ENABLED", "true").lower() == "true"
+    RESULT_CACHE_MAX_ENTRIES: int = int(os.getenv("RESULT_CACHE_MAX_ENTRIES", "512"))
+    RESULT_CACHE_MAX_MB: int = int(os.getenv("RESULT_CACHE_MAX_MB", "256"))  # 缓存总大小上限
+    RESULT_CACHE_MAX_OBJECT_MB: int = int(os.getenv("RESULT_CACHE_MAX_OBJECT_MB", "16"))  # 单个结果对象大小上限，超出时不保存该对象
+    
+    # 工作流并发调度（全局与单会话并发上限、有界等待队列，按会话轮转出队）
+    MAX_CONCURRENT_RUNS: int = int(os.getenv("MAX_CONCURRENT_RUNS", "8"))  # 同时执行的工作流数
+    MAX_RUNS_PER_SESSION: int = int(os.getenv("MAX_RUNS_PER_SESSION", "1"))  # 同一会话同时执行的工作流数（为 1 时同一会话的各轮按提交顺序依次执行）
+    MAX_QUEUED_RUNS: int = int(os.getenv("MAX_QUEUED_RUNS", "32"))  # 等待队列长度上限，队列已满时返回 429
+    SCHEDULER_RETRY_AFTER: int = int(os.getenv("SCHEDULER_RETRY_AFTER", "5"))  # 还没有耗时统计时建议的重试等待时间（秒）
+
+    # 批量问题（同一份数据一次提交多个问题，数据上下文只加载一次）
+    BATCH_MAX_CONCURRENCY: int = int(os.getenv("BATCH_MAX_CONCURRENCY", "4"))  # 一个批量请求同时执行的问题数（仍受 MAX_CONCURRENT_RUNS 限制）
+    BATCH_MAX_QUESTIONS: int = int(os.getenv("BATCH_MAX_QUESTIONS", "50"))  # 一个批量请求的问题数上限
+
+    # 简单查询快速回答（不调用 LLM）
+    QUICK_ANSWER_ENABLED: bool = os.getenv("QUICK_ANSWER_ENABLED", "true").lower() == "true"
     
     # 意图判断相关配置
     TABLE_RELATED_KEYWORDS = [
@@ -53,6 +123,8 @@ class AgentConfig:
         elif provider == "mock":
             print("使用模拟 LLM 提供商，AI 功能将受限")
             return False
+        elif provider == "replay":
+            print(f"使用回放 LLM 提供商（{cls.REPLAY_MODE} 模式），夹具: {cls.REPLAY_FIXTURE_PATH}")
         else:
             print(f"警告：不支持的 LLM 提供商 '{provider}'，将降级到模拟提供商")
             return False
@@ -67,6 +139,7 @@ class AgentConfig:
             "model": cls.LLM_MODEL,
             "temperature": cls.LLM_TEMPERATURE,
             "fallback_to_mock": cls.LLM_FALLBACK_TO_MOCK,
+            "prompt_cache_hints": cls.LLM_PROMPT_CACHE_HINTS,
             "openai_api_key": cls.OPENAI_API_KEY,
             "anthropic_api_key": cls.ANTHROPIC_API_KEY,
             "local_llm_endpoint": cls.LOCAL_LLM_ENDPOINT,
@@ -0,0 +1,32 @@
+"""
+代码执行模块
+
+模型生成的代码在预先创建的受限工作进程中执行。
+
+主要组件：
+- CodeExecutor: 代码执行器（process / inline 两种模式）
+- ExecutionContext: 执行上下文
+- WorkerPool: 工作进程池
+- ResultCache: 代码执行结果缓存
+- SessionKernels: 会话内核（保留各轮代码定义的变量）
+- DuckDBEngine: DuckDB SQL 执行引擎（ANALYSIS_ENGINE=duckdb）
+"""
+
+from .executor import CodeExecutor, ExecutionContext, code_executor, resolve_analysis_engine
+from .pool import WorkerPool, ExecutionPoolError
+from .result_cache import ResultCache
+from .kernel import SessionKernels
+from .sql_engine import DuckDBEngine, sql_engine
+
+__all__ = [
+    'CodeExecutor',
+    'ExecutionContext',
+    'code_executor',
+    'resolve_analysis_engine',
+    'WorkerPool',
+    'ExecutionPoolError',
+    'ResultCache',
+    'SessionKernels',
+    'DuckDBEngine',
+    'sql_engine'
+]
@@ -0,0 +1,299 @@
+"""代码执行耗时估计与准入控制
+
+执行前遍历代码的语法树，按数据规模、列的去重计数和代码中的写法粗略估计执行耗时：
+向量化运算按单元格数估计，逐行计算的写法按行数乘以每行的解释器开销估计，
+笛卡尔积合并、多对多合并和遍历 df 的嵌套循环按行数的平方估计。
+
+根据估计耗时决定执行方式：
+
+- run: 直接执行
+- background: 先在样本上给出初步结果，再在完整数据上执行
+- sample: 完整执行会超出时间上限，只在样本上执行并标明为估计值
+- reject: 样本上也无法在时间上限内完成，拒绝执行并把改写提示返回给模型
+"""
+import ast
+from dataclasses import dataclass, field
+from typing import Callable, List, Optional, Sequence
+from app.agents.execution.projection import referenced_columns
+from app.agents.execution.vectorize import (
+    vectorize,
+    performance_hints,
+    HINT_ITERROWS,
+    HINT_LOOP_FILTER,
+    HINT_ROW_APPLY,
+    HINT_ELEMENT_APPLY,
+    HINT_INDEX_LOOP,
+)
+
+HINT_CROSS_JOIN = "避免 how='cross' 的笛卡尔积合并（结果行数为两表行数之积），先筛选或用连接键合并"
+HINT_MANY_TO_MANY = "连接键的取值很少，合并结果会成倍膨胀；先按连接键 groupby 聚合后再合并"
+HINT_NESTED_LOOP = "避免在遍历 df 的循环中再次遍历或筛选整个 df（计算量为行数的平方），改用 merge、groupby 或向量化比较"
+
+ROUTE_RUN = "run"
+ROUTE_BACKGROUND = "background"
+ROUTE_SAMPLE = "sample"
+ROUTE_REJECT = "reject"
+
+# 向量化运算处理每个单元格的耗时（秒）
+CELL_SECONDS = 2e-8
+# 逐行写法每行的耗时（秒）
+ROW_SECONDS = {
+    HINT_ITERROWS: 5e-5,
+    HINT_INDEX_LOOP: 5e-5,
+    HINT_ROW_APPLY: 1e-5,
+    HINT_ELEMENT_APPLY: 5e-7,
+}
+# 循环内按值筛选：不知道循环次数时按 100 次估计
+LOOP_FILTER_SCANS = 100
+# 合并结果每行的耗时（秒）
+MERGE_ROW_SECONDS = 1e-7
+# 嵌套循环每次内层迭代的耗时（秒）
+PAIR_SECONDS = 1e-6
+
+# 调用后得到聚合结果（行数不超过分组数）的方法，合并这类结果不会膨胀
+AGGREGATING_METHODS = {
+    "groupby", "agg", "aggregate", "sum", "mean", "count", "size", "nunique", "value_counts",
+    "drop_duplicates", "unique", "pivot_table", "describe", "head", "tail", "nlargest", "nsmallest",
+}
+# 遍历 df 行的循环
+ROW_ITERATORS = {"iterrows", "itertuples"}
+# 遍历列的不同取值的循环
+VALUE_ITERATORS = {"unique", "drop_duplicates", "value_counts"}
+
+DistinctCounter = Callable[[str], Optional[int]]
+
+
+@dataclass
+class CostEstimate:
+    """估计耗时：linear·行数 + quadratic·行数²"""
+    linear: float = 0.0
+    quadratic: float = 0.0
+    hints: List[str] = field(default_factory=list)
+
+    def seconds(self, rows: int) -> float:
+        """在 rows 行数据上的估计耗时（秒）"""
+        return self.linear * rows + self.quadratic * rows * rows
+
+    def add_hint(self, hint: str) -> None:
+        if hint not in self.hints:
+            self.hints.append(hint)
+
+
+@dataclass
+class Admission:
+    """准入决定"""
+    route: str
+    # 在完整数据上的估计耗时（秒）
+    seconds: float = 0.0
+    hints: List[str] = field(default_factory=list)
+    # 拒绝或改为样本执行的原因
+    reason: str = ""
+
+
+def _uses_frame(node: ast.AST, frame_name: str = "df") -> bool:
+    return any(isinstance(n, ast.Name) and n.id == frame_name for n in ast.walk(node))
+
+
+def _is_raw_frame(node: ast.AST) -> bool:
+    """表达式是否为 df 本身或其行子集（而不是聚合结果）"""
+    if not _uses_frame(node):
+        return False
+    return not any(
+        isinstance(n, ast.Call) and isinstance(n.func, ast.Attribute) and n.func.attr in AGGREGATING_METHODS
+        for n in ast.walk(node)
+    )
+
+
+def _constant_names(node: Optional[ast.AST]) -> List[str]:
+    if isinstance(node, ast.Constant) and isinstance(node.value, str):
+        return [node.value]
+    if isinstance(node, (ast.List, ast.Tuple)):
+        return [e.value for e in node.elts if isinstance(e, ast.Constant) and isinstance(e.value, str)]
+    return []
+
+
+def _keyword(call: ast.Call, name: str) -> Optional[ast.AST]:
+    return next((k.value for k in call.keywords if k.arg == name), None)
+
+
+def _frame_column(node: ast.AST) -> Optional[str]:
+    """df['col'] 或 df.col 中的列名"""
+    if isinstance(node, ast.Subscript) and isinstance(node.value, ast.Name) and node.value.id == "df":
+        names = _constant_names(node.slice)
+        return names[0] if len(names) == 1 else None
+    if isinstance(node, ast.Attribute) and isinstance(node.value, ast.Name) and node.value.id == "df":
+        return node.attr
+    return None
+
+
+def _loop_kind(iterator: ast.AST):
+    """
+    循环遍历的对象
+
+    Returns:
+        ("rows", None) 遍历 df 的行；("values", 列名) 遍历某列的不同取值；其他为 None
+    """
+    if isinstance(iterator, ast.Call):
+        func = iterator.func
+        if isinstance(func, ast.Attribute) and func.attr in ROW_ITERATORS and _uses_frame(func.value):
+            return "rows", None
+        if isinstance(func, ast.Attribute) and func.attr in VALUE_ITERATORS:
+            return "values", _frame_column(func.value)
+        if isinstance(func, ast.Attribute) and func.attr == "tolist":
+            return _loop_kind(func.value)
+        if isinstance(func, ast.Name) and func.id == "range" and any(
+            isinstance(n, ast.Call) and isinstance(n.func, ast.Name) and n.func.id == "len" and _uses_frame(n)
+            for n in ast.walk(iterator)
+        ):
+            return "rows", None
+        if isinstance(func, ast.Name) and func.id in ("set", "sorted") and iterator.args:
+            column = _frame_column(iterator.args[0])
+            if column is not None:
+                return "values", column
+            return _loop_kind(iterator.args[0])
+        if isinstance(func, ast.Name) and func.id in ("zip", "enumerate") and iterator.args:
+            return _loop_kind(iterator.args[0])
+    if isinstance(iterator, ast.Attribute) and iterator.attr == "index" and _uses_frame(iterator.value):
+        return "rows", None
+    if _frame_column(iterator) is not None:
+        return "rows", None
+    return None
+
+
+def _filters_frame(body: List[ast.stmt], targets: List[str]) -> bool:
+    """循环体内是否以循环变量为条件筛选 df"""
+    for statement in body:
+        for node in ast.walk(statement):
+            if (isinstance(node, ast.Subscript) and _uses_frame(node.value)
+                    and isinstance(node.slice, (ast.Compare, ast.BinOp, ast.Call))
+                    and any(isinstance(n, ast.Name) and n.id in targets for n in ast.walk(node.slice))):
+                return True
+    return False
+
+
+def _estimate_loops(tree: ast.AST, estimate: CostEstimate, distinct: DistinctCounter) -> None:
+    for node in ast.walk(tree):
+        if not isinstance(node, ast.For):
+            continue
+        kind = _loop_kind(node.iter)
+        targets = [n.id for n in ast.walk(node.target) if isinstance(n, ast.Name)]
+        inner_rows = any(
+            isinstance(child, ast.For) and child is not node and (_loop_kind(child.iter) or ("",))[0] == "rows"
+            for statement in node.body for child in ast.walk(statement)
+        )
+        filters = _filters_frame(node.body, targets)
+
+        if kind is not None and kind[0] == "rows" and (inner_rows or filters):
+            # 每一行都要再遍历或扫描一次全部行
+            estimate.quadratic += PAIR_SECONDS if inner_rows else CELL_SECONDS
+            estimate.add_hint(HINT_NESTED_LOOP)
+        elif filters:
+            # 每次循环扫描一次全部行；遍历某列的不同取值时循环次数为该列的去重计数
+            count = distinct(kind[1]) if kind is not None and kind[1] else None
+            estimate.linear += CELL_SECONDS * (count or LOOP_FILTER_SCANS)
+            estimate.add_hint(HINT_LOOP_FILTER)
+
+
+def _estimate_merges(tree: ast.AST, estimate: CostEstimate, distinct: DistinctCounter) -> None:
+    for node in ast.walk(tree):
+        if not (isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute) and node.func.attr == "merge"):
+            continue
+        if isinstance(node.func.value, ast.Name) and node.func.value.id in ("pd", "pandas"):
+            operands = list(node.args[:2])
+            left_key, right_key = "left", "right"
+        else:
+            operands = [node.func.value] + list(node.args[:1])
+            left_key, right_key = None, "right"
+        for key in (left_key, right_key):
+            value = _keyword(node, key) if key else None
+            if value is not None:
+                operands.append(value)
+        # 只估计两边都是 df 原始行（而不是聚合结果）的合并
+        if len(operands) < 2 or not all(_is_raw_frame(operand) for operand in operands[:2]):
+            continue
+
+        how = _keyword(node, "how")
+        if isinstance(how, ast.Constant) and how.value == "cross":
+            estimate.quadratic += MERGE_ROW_SECONDS
+            estimate.add_hint(HINT_CROSS_JOIN)
+            continue
+
+        keys = _constant_names(_keyword(node, "on")) or _constant_names(_keyword(node, "left_on"))
+        counts = [count for count in (distinct(key) for key in keys) if count]
+        if counts:
+            # 每个键值平均匹配 行数/去重数 行，结果约为 行数²/去重数
+            estimate.quadratic += MERGE_ROW_SECONDS / max(counts)
+            estimate.linear += MERGE_ROW_SECONDS
+            estimate.add_hint(HINT_MANY_TO_MANY)
+        else:
+            estimate.linear += MERGE_ROW_SECONDS
+
+
+def estimate_cost(
+    code: str,
+    columns: Optional[Sequence[str]] = None,
+    distinct: Optional[DistinctCounter] = None
+) -> CostEstimate:
+    """
+    估计代码的执行耗时
+
+    Args:
+        code: Python 代码（按自动向量化改写后的代码估计）
+        columns: 数据的全部列名（用于估计代码实际读取的列数）
+        distinct: 列名 -> 去重计数（来自列概要），未知时返回 None
+
+    Returns:
+        估计耗时与对应的改写提示
+    """
+    distinct = distinct or (lambda column: None)
+    column_count = len(columns) if columns else 1
+    if columns:
+        projection = referenced_columns(code, columns)
+        if projection:
+            column_count = len(projection)
+
+    rewritten = vectorize(code).code
+    estimate = CostEstimate(linear=column_count * CELL_SECONDS)
+    for hint in performance_hints(rewritten):
+        # 循环内筛选的次数在 _estimate_loops 中估计
+        if hint != HINT_LOOP_FILTER:
+            estimate.linear += ROW_SECONDS.get(hint, 0.0)
+            estimate.add_hint(hint)
+
+    try:
+        tree = ast.parse(rewritten)
+    except SyntaxError:
+        return estimate
+    _estimate_loops(tree, estimate, distinct)
+    _estimate_merges(tree, estimate, distinct)
+    return estimate
+
+
+def admit(
+    estimate: CostEstimate,
+    rows: int,
+    sample_rows: int,
+    background_seconds: float,
+    max_seconds: float,
+    can_sample: Callable[[], bool]
+) -> Admission:
+    """
+    根据估计耗时决定执行方式
+
+    Args:
+        estimate: 估计耗时
+        rows: 数据行数
+        sample_rows: 样本行数
+        background_seconds: 估计耗时达到该值时先给出样本上的初步结果（0 表示不启用）
+        max_seconds: 执行时间上限
+        can_sample: 代码能否在样本上执行
+    """
+    seconds = estimate.seconds(rows)
+    if seconds <= max_seconds:
+        route = ROUTE_BACKGROUND if background_seconds and seconds >= background_seconds else ROUTE_RUN
+        return Admission(route, seconds, list(estimate.hints))
+
+    reason = f"估计在 {rows:,} 行数据上需要约 {seconds:,.0f} 秒，超过 {max_seconds:g} 秒的执行时间上限"
+    if sample_rows < rows and estimate.seconds(sample_rows) <= max_seconds and can_sample():
+        return Admission(ROUTE_SAMPLE, seconds, list(estimate.hints), reason)
+    return Admission(ROUTE_REJECT, seconds, list(estimate.hints), reason)
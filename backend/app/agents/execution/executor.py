@@ -0,0 +1,436 @@
+"""代码执行器"""
+import os
+import ast
+import time
+import threading
+import pandas as pd
+from dataclasses import dataclass
+from typing import Dict, Any, List, Optional, Tuple
+from app.agents.config import AgentConfig
+from app.core.config import settings
+from app.agents.execution.kernel import SessionKernels
+from app.agents.execution.pool import WorkerPool, ExecutionPoolError
+from app.agents.execution.projection import referenced_columns
+from app.agents.execution.result_cache import ResultCache, parse_code, find_uncacheable_reason
+from app.agents.execution.sql_engine import sql_engine, is_duckdb_available
+from app.agents.execution.runner import (
+    build_namespace, build_polars_namespace, run_code, verify_rewrite, is_polars_available, load_profile
+)
+from app.agents.execution.sampling import stratified_sample, sample_summary
+from app.agents.execution.cost import Admission, ROUTE_RUN, admit, estimate_cost
+from app.agents.cancellation import CancellationToken
+from app.agents.execution.vectorize import VectorizeResult, vectorize, performance_hints
+from app.core.logging_config import get_agent_logger
+
+logger = get_agent_logger('execution.executor')
+
+
+def resolve_analysis_engine() -> str:
+    """获取实际使用的分析引擎，依赖未安装时退回 pandas"""
+    engine = AgentConfig.ANALYSIS_ENGINE.lower()
+    if engine == "duckdb" and not is_duckdb_available():
+        logger.warning("ANALYSIS_ENGINE=duckdb 但未安装 duckdb，使用 pandas")
+        return "pandas"
+    if engine == "polars" and not is_polars_available():
+        logger.warning("ANALYSIS_ENGINE=polars 但未安装 polars，使用 pandas")
+        return "pandas"
+    if engine not in ("pandas", "duckdb", "polars"):
+        logger.warning(f"不支持的分析引擎 '{engine}'，使用 pandas")
+        return "pandas"
+    return engine
+
+
+@dataclass
+class ExecutionContext:
+    """一次代码执行所需的上下文"""
+    session_id: Optional[str] = None
+    filepath: Optional[str] = None
+    # 仅内联模式使用；进程模式下由工作进程自行加载 filepath
+    dataframe: Optional[pd.DataFrame] = None
+    # Python 代码的执行环境：pandas（df）或 polars（lf）
+    engine: str = "pandas"
+    # 数据的全部列名，用于列投影分析
+    columns: Optional[List[str]] = None
+    # 数据行数，用于执行前的耗时估计
+    rows: Optional[int] = None
+    # 工作流的取消令牌，取消时终止执行中的工作进程
+    cancel_token: Optional[CancellationToken] = None
+
+
+class CodeExecutor:
+    """代码执行器
+
+    process 模式下代码在受限的工作进程中执行（墙钟时间、CPU 时间、内存上限），
+    inline 模式下在当前进程中直接执行，仅用于调试。
+    启用会话内核时，同一会话的代码共享变量，执行器记录每个会话内核的变量摘要供提示词使用。
+    """
+
+    def __init__(self, mode: Optional[str] = None):
+        self.mode = (mode or AgentConfig.CODE_EXECUTION_MODE).lower()
+        self._pool: Optional[WorkerPool] = None
+        self._lock = threading.Lock()
+        # inline 模式的会话内核
+        self._kernels = SessionKernels(AgentConfig.KERNEL_IDLE_TIMEOUT, AgentConfig.KERNEL_MAX_MEMORY_MB)
+        # 会话ID -> (最近使用时间, 内核变量摘要)
+        self._kernel_variables: Dict[str, Tuple[float, List[Dict[str, Any]]]] = {}
+
+    def _get_pool(self) -> WorkerPool:
+        with self._lock:
+            if self._pool is None:
+                self._pool = WorkerPool(
+                    size=AgentConfig.CODE_EXECUTION_WORKERS or os.cpu_count() or 1,
+                    memory_mb=AgentConfig.MAX_CODE_EXECUTION_MEMORY_MB,
+                    max_tasks_per_worker=AgentConfig.CODE_WORKER_MAX_TASKS,
+                    recycle_rss_mb=AgentConfig.CODE_WORKER_RECYCLE_RSS_MB
+                )
+            return self._pool
+
+    def start(self) -> None:
+        """预先启动工作进程"""
+        if self.mode == "process":
+            self._get_pool().start()
+
+    def shutdown(self) -> None:
+        """关闭工作进程和 SQL 连接"""
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown()
+        sql_engine.shutdown()
+
+    def release_session(self, session_id: str) -> None:
+        """释放会话占用的执行资源（SQL 连接、会话内核）"""
+        sql_engine.close_session(session_id)
+        with self._lock:
+            self._kernel_variables.pop(session_id, None)
+            pool = self._pool
+        self._kernels.drop(session_id)
+        if pool is not None and pool.has_session(session_id):
+            try:
+                pool.submit({"op": "drop_kernel", "session_id": session_id}, AgentConfig.MAX_CODE_EXECUTION_TIME)
+            except ExecutionPoolError as e:
+                logger.debug(f"释放会话内核失败: {str(e)}")
+            pool.forget_session(session_id)
+
+    def get_kernel_variables(self, session_id: Optional[str]) -> List[Dict[str, Any]]:
+        """
+        获取会话内核中保留的变量摘要
+
+        Returns:
+            变量摘要列表；内核不存在、已空闲超时或所在进程已被回收时为空
+        """
+        if not session_id or not AgentConfig.SESSION_KERNELS_ENABLED:
+            return []
+        with self._lock:
+            entry = self._kernel_variables.get(session_id)
+            pool = self._pool
+        if entry is None:
+            return []
+        last_used, variables = entry
+        if AgentConfig.KERNEL_IDLE_TIMEOUT > 0 and time.monotonic() - last_used > AgentConfig.KERNEL_IDLE_TIMEOUT:
+            return []
+        if self.mode == "process" and (pool is None or not pool.has_session(session_id)):
+            return []
+        return variables
+
+    def _record_kernel_variables(self, session_id: str, result: Dict[str, Any]) -> None:
+        variables = result.pop("variables", None)
+        if variables is not None:
+            with self._lock:
+                self._kernel_variables[session_id] = (time.monotonic(), variables)
+
+    def _inject_objects(self, context: ExecutionContext, objects: Dict[str, bytes]) -> None:
+        """结果缓存命中时，把缓存的变量注入会话内核"""
+        if self.mode == "process":
+            try:
+                result = self._get_pool().submit(
+                    {"op": "inject", "session_id": context.session_id, "objects": objects},
+                    AgentConfig.MAX_CODE_EXECUTION_TIME
+                )
+            except ExecutionPoolError as e:
+                logger.warning(f"注入缓存变量失败: {str(e)}")
+                return
+        else:
+            result = {"variables": self._kernels.inject(context.session_id, objects)}
+        self._record_kernel_variables(context.session_id, result)
+
+    def preload(self, context: ExecutionContext) -> None:
+        """让工作进程预先加载会话数据（启用列投影时按需加载，不预先加载全部列）"""
+        if self.mode != "process" or not context.filepath or AgentConfig.COLUMN_PROJECTION_ENABLED:
+            return
+        pool = self._get_pool()
+        if pool.has_loaded(context.filepath):
+            return
+        try:
+            pool.submit(
+                {"op": "preload", "filepath": context.filepath},
+                AgentConfig.MAX_CODE_EXECUTION_TIME
+            )
+        except ExecutionPoolError as e:
+            logger.debug(f"预加载会话数据失败: {str(e)}")
+
+    def execute(self, code: str, context: ExecutionContext, language: str = "python") -> Dict[str, Any]:
+        """
+        执行一个代码块
+
+        Args:
+            code: 代码
+            context: 执行上下文
+            language: python 或 sql
+
+        Returns:
+            执行结果，格式与 code_execution_results 中的条目一致
+        """
+        if context.cancel_token is not None and context.cancel_token.cancelled:
+            return {"code": code, "language": language, "output": "执行已取消", "success": False, "cancelled": True}
+
+        if language == "sql":
+            result = sql_engine.execute(code, context.session_id, context.filepath, context.dataframe)
+            return {"code": code, "language": language, **result}
+
+        use_kernel = AgentConfig.SESSION_KERNELS_ENABLED and bool(context.session_id)
+
+        cache_key = None
+        max_object_bytes = 0
+        if AgentConfig.RESULT_CACHE_ENABLED:
+            cache_key = ResultCache.make_key(code, context.filepath, context.engine)
+            if cache_key:
+                cached = ResultCache.get(cache_key)
+                # 使用会话内核时，缓存中缺少部分变量的结果需要重新执行
+                if cached is not None and (not use_kernel or cached["complete"]):
+                    logger.info("代码执行结果命中缓存")
+                    if use_kernel and cached["objects"]:
+                        self._inject_objects(context, cached["objects"])
+                    return {
+                        "code": code,
+                        "language": language,
+                        "output": cached["output"],
+                        "success": True,
+                        "cached": True
+                    }
+                max_object_bytes = AgentConfig.RESULT_CACHE_MAX_OBJECT_MB * 1024 * 1024
+
+        projection = self._projection(code, context)
+        rewritten = self._vectorize(code) if context.engine == "pandas" else None
+
+        if self.mode == "process":
+            try:
+                result = self._get_pool().submit(
+                    {
+                        "op": "execute",
+                        "code": code,
+                        "rewritten_code": rewritten.code if rewritten else None,
+                        "verify_rows": AgentConfig.VECTORIZE_VERIFY_ROWS,
+                        "filepath": context.filepath,
+                        "columns": projection,
+                        "engine": context.engine,
+                        "session_id": context.session_id if use_kernel else None,
+                        "cpu_seconds": AgentConfig.MAX_CODE_EXECUTION_CPU_TIME,
+                        "max_object_bytes": max_object_bytes
+                    },
+                    AgentConfig.MAX_CODE_EXECUTION_TIME,
+                    context.cancel_token
+                )
+            except ExecutionPoolError as e:
+                result = {"output": f"执行错误：{str(e)}", "success": False}
+        else:
+            if context.engine == "polars":
+                namespace = build_polars_namespace(context.filepath, context.dataframe)
+            else:
+                df = context.dataframe
+                profile = load_profile(code, context.filepath, df)
+                if df is not None and projection:
+                    df = df[projection]
+                namespace = build_namespace(df, profile)
+            executed = code
+            if rewritten and verify_rewrite(
+                code, rewritten.code, namespace.get("df"), AgentConfig.VECTORIZE_VERIFY_ROWS, namespace.get("profile")
+            ):
+                executed = rewritten.code
+            if use_kernel:
+                self._kernels.purge_idle()
+                namespace = self._kernels.namespace(context.session_id, namespace)
+            result = run_code(executed, namespace, max_object_bytes)
+            result["vectorized"] = executed is not code
+            result.pop("memory_error", None)
+            if use_kernel:
+                result["variables"] = self._kernels.save(context.session_id, namespace)
+
+        if cache_key:
+            ResultCache.put(cache_key, result)
+        result.pop("objects", None)
+        result.pop("objects_complete", None)
+        if use_kernel:
+            self._record_kernel_variables(context.session_id, result)
+
+        vectorized = result.pop("vectorized", False)
+        if context.engine == "pandas":
+            self._attach_performance_notes(code, rewritten if vectorized else None, result)
+
+        return {"code": code, "language": language, **result}
+
+    def supports_sampling(self, code: str, context: ExecutionContext) -> bool:
+        """
+        代码能否先在样本上执行
+
+        只支持 pandas 环境下自包含且结果确定的代码（样本执行不使用会话内核）；
+        结果缓存命中时完整结果立即可得，也不需要样本。
+        """
+        if context.engine != "pandas" or not (context.filepath or context.dataframe is not None):
+            return False
+        tree = parse_code(code)
+        if tree is None or find_uncacheable_reason(tree) is not None:
+            return False
+        # 只读取列概要等、不扫描 df 的代码本身就很快
+        if not any(isinstance(node, ast.Name) and node.id == "df" for node in ast.walk(tree)):
+            return False
+        return not self._is_cached(code, context)
+
+    @staticmethod
+    def _is_cached(code: str, context: ExecutionContext) -> bool:
+        """结果缓存中是否已有代码的执行结果"""
+        if not AgentConfig.RESULT_CACHE_ENABLED:
+            return False
+        cache_key = ResultCache.make_key(code, context.filepath, context.engine)
+        return bool(cache_key) and ResultCache.get(cache_key) is not None
+
+    @staticmethod
+    def _distinct_counter(context: ExecutionContext):
+        """列名 -> 去重计数：优先使用列概要，内联模式下没有数据文件时直接计算"""
+        def distinct(column: str) -> Optional[int]:
+            if context.filepath and settings.column_profile_enabled:
+                from app.services.profile_service import ProfileService
+                try:
+                    profile = ProfileService.get_profile(context.filepath)
+                except Exception as e:
+                    logger.debug(f"读取列概要失败: {str(e)}")
+                    return None
+                return profile[column].distinct() if column in profile else None
+            df = context.dataframe
+            if df is not None and not context.filepath and column in df.columns:
+                return int(df[column].nunique())
+            return None
+        return distinct
+
+    def admit(self, code: str, context: ExecutionContext) -> Admission:
+        """
+        执行前估计代码耗时，决定执行方式
+
+        只估计 pandas 环境的代码；结果缓存命中的代码总是直接执行。
+
+        Returns:
+            准入决定：run 直接执行，background 先给出样本上的初步结果，
+            sample 只在样本上执行，reject 拒绝执行（附带改写提示）
+        """
+        if not AgentConfig.COST_ADMISSION_ENABLED or context.engine != "pandas" or not context.rows:
+            return Admission(ROUTE_RUN)
+        if self._is_cached(code, context):
+            return Admission(ROUTE_RUN)
+
+        estimate = estimate_cost(code, context.columns, self._distinct_counter(context))
+        decision = admit(
+            estimate,
+            context.rows,
+            sample_rows=AgentConfig.PROGRESSIVE_SAMPLE_ROWS,
+            background_seconds=AgentConfig.PROGRESSIVE_MIN_SECONDS,
+            max_seconds=AgentConfig.COST_MAX_SECONDS or AgentConfig.MAX_CODE_EXECUTION_TIME,
+            can_sample=lambda: AgentConfig.PROGRESSIVE_EXECUTION_ENABLED and self.supports_sampling(code, context)
+        )
+        if decision.route != ROUTE_RUN:
+            logger.info(f"执行准入: {decision.route}，估计耗时 {decision.seconds:.1f}s")
+        return decision
+
+    def execute_sample(
+        self,
+        code: str,
+        context: ExecutionContext,
+        sample_rows: int,
+        strata: Optional[List[str]] = None
+    ) -> Dict[str, Any]:
+        """
+        在分层样本上执行代码，得到初步结果
+
+        样本执行不读写会话内核，也不写入结果缓存，只用于在完整结果之前先给出近似结果。
+
+        Args:
+            code: Python 代码（仅 pandas 环境）
+            context: 执行上下文
+            sample_rows: 样本行数
+            strata: 分层列
+
+        Returns:
+            执行结果，sample 为样本信息（样本行数、总行数、误差估计）
+        """
+        projection = self._projection(code, context)
+        sample = {"rows": sample_rows, "strata": strata or [], "seed": AgentConfig.PROGRESSIVE_SAMPLE_SEED}
+
+        if self.mode == "process":
+            try:
+                result = self._get_pool().submit(
+                    {
+                        "op": "execute",
+                        "code": code,
+                        "filepath": context.filepath,
+                        "columns": projection,
+                        "engine": "pandas",
+                        "sample": sample,
+                        "cpu_seconds": AgentConfig.MAX_CODE_EXECUTION_CPU_TIME
+                    },
+                    AgentConfig.MAX_CODE_EXECUTION_TIME,
+                    context.cancel_token
+                )
+            except ExecutionPoolError as e:
+                result = {"output": f"执行错误：{str(e)}", "success": False}
+        else:
+            df = context.dataframe
+            if df is None:
+                return {"code": code, "output": "执行错误：没有可用的数据", "success": False}
+            if projection:
+                df = df[projection]
+            profile = load_profile(code, context.filepath, df)
+            sampled = stratified_sample(df, sample_rows, strata, sample["seed"])
+            result = run_code(code, build_namespace(sampled, profile))
+            result["sample"] = sample_summary(sampled, len(df), strata)
+
+        result.pop("memory_error", None)
+        return {"code": code, "language": "python", **result}
+
+    @staticmethod
+    def _projection(code: str, context: ExecutionContext) -> Optional[List[str]]:
+        """pandas 环境下只加载代码引用的列（polars 的 LazyFrame 自带投影下推）"""
+        if not (AgentConfig.COLUMN_PROJECTION_ENABLED and context.engine == "pandas" and context.columns):
+            return None
+        projection = referenced_columns(code, context.columns)
+        if projection:
+            logger.debug(f"列投影: {len(projection)}/{len(context.columns)} 列")
+        return projection
+
+    @staticmethod
+    def _vectorize(code: str) -> Optional[VectorizeResult]:
+        """
+        生成向量化改写的候选代码
+
+        只改写自包含且结果确定的代码：验证时原代码与改写后的代码分别在样本上独立执行，
+        引用会话内核变量或带随机因素的代码无法这样比较。
+        """
+        if not AgentConfig.VECTORIZE_REWRITE_ENABLED:
+            return None
+        tree = parse_code(code)
+        if tree is None or find_uncacheable_reason(tree) is not None:
+            return None
+        rewritten = vectorize(code)
+        return rewritten if rewritten.changed else None
+
+    @staticmethod
+    def _attach_performance_notes(code: str, applied: Optional[VectorizeResult], result: Dict[str, Any]) -> None:
+        """记录已应用的向量化改写，并为仍然逐行计算的写法附加性能提示"""
+        if applied is not None:
+            logger.info(f"使用向量化改写后的代码: {', '.join(applied.rewrites)}")
+            result["rewrites"] = applied.rewrites
+        hints = performance_hints(applied.code if applied is not None else code)
+        if hints:
+            result["hints"] = hints
+
+
+# 全局代码执行器
+code_executor = CodeExecutor()
@@ -0,0 +1,164 @@
+"""会话级分析内核
+
+每个会话保留前几轮代码定义的变量，后续轮次的代码可以直接使用，
+无需从原始数据重新计算。内核有空闲超时和内存上限：超时的内核被整体丢弃，
+超出内存上限时从最大的变量开始丢弃。
+"""
+import sys
+import time
+import types
+import pickle
+import threading
+import numpy as np
+import pandas as pd
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional
+from app.agents.execution.runner import BASE_NAMES
+
+
+def estimate_size(value: Any) -> int:
+    """估算变量占用的内存（字节）"""
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(index=True, deep=False).sum())
+    if isinstance(value, pd.Series):
+        return int(value.memory_usage(index=True, deep=False))
+    if isinstance(value, np.ndarray):
+        return int(value.nbytes)
+    estimated_size = getattr(value, "estimated_size", None)
+    if callable(estimated_size):
+        # polars DataFrame / Series
+        try:
+            return int(estimated_size())
+        except Exception:
+            pass
+    return sys.getsizeof(value)
+
+
+def summarize_variable(name: str, value: Any) -> Dict[str, Any]:
+    """生成变量摘要（名称、类型、形状或取值）"""
+    summary = {"name": name, "type": type(value).__name__}
+    shape = getattr(value, "shape", None)
+    if isinstance(value, (bool, int, float, str, np.generic)):
+        text = repr(value.item() if isinstance(value, np.generic) else value)
+        summary["value"] = text if len(text) <= 60 else text[:57] + "..."
+    elif isinstance(shape, tuple):
+        summary["shape"] = list(shape)
+    elif isinstance(value, (list, tuple, dict, set)):
+        summary["length"] = len(value)
+    return summary
+
+
+def _is_kept(name: str, value: Any) -> bool:
+    """变量是否保留到内核中"""
+    if name.startswith('_') or name in BASE_NAMES:
+        return False
+    return not isinstance(value, types.ModuleType)
+
+
+class _Kernel:
+    def __init__(self):
+        self.variables: Dict[str, Any] = {}
+        self.last_used = time.monotonic()
+
+
+class SessionKernels:
+    """会话内核集合（工作进程内或内联模式下使用）"""
+
+    def __init__(self, idle_timeout: float, max_memory_mb: int):
+        self.idle_timeout = idle_timeout
+        self.max_memory_bytes = max_memory_mb * 1024 * 1024
+        self._kernels: "OrderedDict[str, _Kernel]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def purge_idle(self) -> List[str]:
+        """丢弃空闲超时的内核，返回被丢弃的会话ID"""
+        if self.idle_timeout <= 0:
+            return []
+        now = time.monotonic()
+        with self._lock:
+            expired = [sid for sid, k in self._kernels.items() if now - k.last_used > self.idle_timeout]
+            for session_id in expired:
+                del self._kernels[session_id]
+        return expired
+
+    def _get(self, session_id: str) -> _Kernel:
+        kernel = self._kernels.get(session_id)
+        if kernel is None:
+            kernel = self._kernels[session_id] = _Kernel()
+        kernel.last_used = time.monotonic()
+        self._kernels.move_to_end(session_id)
+        return kernel
+
+    def namespace(self, session_id: str, base: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        构建会话的执行环境：内核变量 + 本轮的预置变量（df 等每轮重新提供）
+        """
+        with self._lock:
+            kernel = self._get(session_id)
+            namespace = dict(kernel.variables)
+        namespace.update(base)
+        return namespace
+
+    def save(self, session_id: str, namespace: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """
+        保存执行后的变量到内核
+
+        Returns:
+            内核变量摘要
+        """
+        variables = {name: value for name, value in namespace.items() if _is_kept(name, value)}
+        with self._lock:
+            kernel = self._get(session_id)
+            kernel.variables = variables
+            self._enforce_memory_limit(kernel)
+            return self._summarize(kernel)
+
+    def inject(self, session_id: str, objects: Dict[str, bytes]) -> List[Dict[str, Any]]:
+        """
+        注入变量（结果缓存命中时恢复该代码本应定义的变量）
+
+        Args:
+            objects: 变量名 -> pickle 字节
+        """
+        restored = {}
+        for name, data in objects.items():
+            try:
+                restored[name] = pickle.loads(data)
+            except Exception:
+                continue
+        with self._lock:
+            kernel = self._get(session_id)
+            kernel.variables.update(restored)
+            self._enforce_memory_limit(kernel)
+            return self._summarize(kernel)
+
+    def variables(self, session_id: str) -> Optional[List[Dict[str, Any]]]:
+        """内核变量摘要，内核不存在时返回 None"""
+        with self._lock:
+            kernel = self._kernels.get(session_id)
+            return self._summarize(kernel) if kernel is not None else None
+
+    def drop(self, session_id: str) -> None:
+        """丢弃会话内核"""
+        with self._lock:
+            self._kernels.pop(session_id, None)
+
+    def _enforce_memory_limit(self, kernel: _Kernel) -> None:
+        """超出内存上限时从最大的变量开始丢弃"""
+        if self.max_memory_bytes <= 0:
+            return
+        sizes = {name: estimate_size(value) for name, value in kernel.variables.items()}
+        total = sum(sizes.values())
+        for name in sorted(sizes, key=sizes.get, reverse=True):
+            if total <= self.max_memory_bytes:
+                break
+            del kernel.variables[name]
+            total -= sizes[name]
+
+    @staticmethod
+    def _summarize(kernel: _Kernel) -> List[Dict[str, Any]]:
+        return [
+            summarize_variable(name, value)
+            for name, value in kernel.variables.items()
+            if not isinstance(value, type)
+        ]
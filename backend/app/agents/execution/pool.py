@@ -0,0 +1,293 @@
+"""代码执行工作进程池"""
+import time
+import threading
+import multiprocessing
+from typing import Dict, Any, List, Optional
+from app.agents.execution.worker import worker_main
+from app.agents.cancellation import CancellationToken
+from app.core.logging_config import get_agent_logger
+
+logger = get_agent_logger('execution.pool')
+
+
+class ExecutionPoolError(Exception):
+    """进程池错误"""
+    pass
+
+
+class _Worker:
+    """单个工作进程的句柄"""
+
+    def __init__(self, ctx, index: int, memory_mb: int):
+        self.index = index
+        self.conn, child_conn = ctx.Pipe()
+        self.process = ctx.Process(
+            target=worker_main,
+            args=(child_conn, memory_mb),
+            name=f"code-worker-{index}",
+            daemon=True
+        )
+        self.process.start()
+        child_conn.close()
+        self.tasks = 0
+        self.loaded_files = set()
+
+    def request(self, message: Dict[str, Any], timeout: float) -> Optional[Dict[str, Any]]:
+        """
+        发送任务并等待结果
+
+        Returns:
+            结果字典；超时返回 None
+
+        Raises:
+            EOFError: 工作进程已退出
+        """
+        self.conn.send(message)
+        if not self.conn.poll(timeout):
+            return None
+        return self.conn.recv()
+
+    def is_alive(self) -> bool:
+        return self.process.is_alive()
+
+    def stop(self, graceful: bool = True) -> None:
+        """停止工作进程"""
+        if graceful and self.process.is_alive():
+            try:
+                self.conn.send({"op": "shutdown"})
+                self.process.join(1)
+            except (BrokenPipeError, OSError):
+                pass
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join(1)
+        self.conn.close()
+
+
+class WorkerPool:
+    """预先创建的代码执行工作进程池
+
+    每个工作进程一次只执行一个任务；超时、超出资源限制或执行次数过多的进程会被回收并重新创建。
+    同一文件的任务优先分配给已加载该文件的进程，避免重复解析。
+    带会话ID的任务始终分配给该会话第一次使用的进程（会话内核保存在进程内），
+    进程被回收后会话内核随之丢失，下次任务重新分配。
+    """
+
+    def __init__(
+        self,
+        size: int,
+        memory_mb: int = 0,
+        max_tasks_per_worker: int = 0,
+        recycle_rss_mb: int = 0
+    ):
+        self.size = max(1, size)
+        self.memory_mb = memory_mb
+        self.max_tasks_per_worker = max_tasks_per_worker
+        self.recycle_rss_mb = recycle_rss_mb
+        self._ctx = self._get_context()
+        self._condition = threading.Condition()
+        self._idle: List[_Worker] = []
+        self._workers: Dict[int, _Worker] = {}
+        # 会话ID -> 工作进程编号
+        self._session_workers: Dict[str, int] = {}
+        self._started = False
+        self._closed = False
+
+    @staticmethod
+    def _get_context():
+        """优先使用 forkserver：服务进程预先导入 pandas，工作进程从中 fork，启动快且不继承主进程的线程状态"""
+        if "forkserver" in multiprocessing.get_all_start_methods():
+            ctx = multiprocessing.get_context("forkserver")
+            ctx.set_forkserver_preload(["pandas", "app.agents.execution.worker"])
+            return ctx
+        return multiprocessing.get_context("spawn")
+
+    def start(self) -> None:
+        """启动全部工作进程"""
+        with self._condition:
+            if self._started or self._closed:
+                return
+            for index in range(self.size):
+                worker = _Worker(self._ctx, index, self.memory_mb)
+                self._workers[index] = worker
+                self._idle.append(worker)
+            self._started = True
+        logger.info(f"代码执行进程池已启动，进程数: {self.size}")
+
+    def shutdown(self) -> None:
+        """关闭进程池"""
+        with self._condition:
+            self._closed = True
+            workers = list(self._workers.values())
+            self._workers.clear()
+            self._idle.clear()
+            self._condition.notify_all()
+        for worker in workers:
+            worker.stop()
+        logger.info("代码执行进程池已关闭")
+
+    def has_loaded(self, filepath: str) -> bool:
+        """是否已有工作进程加载了该文件"""
+        with self._condition:
+            return any(filepath in w.loaded_files for w in self._workers.values())
+
+    def has_session(self, session_id: str) -> bool:
+        """会话是否已分配到存活的工作进程"""
+        with self._condition:
+            return session_id in self._session_workers
+
+    def forget_session(self, session_id: str) -> None:
+        """解除会话与工作进程的绑定"""
+        with self._condition:
+            self._session_workers.pop(session_id, None)
+
+    def _choose(self, filepath: Optional[str], session_id: Optional[str]) -> Optional[_Worker]:
+        """选择空闲工作进程；会话绑定的进程忙碌时返回 None"""
+        if session_id and session_id in self._session_workers:
+            index = self._session_workers[session_id]
+            if index in self._workers:
+                return next((w for w in self._idle if w.index == index), None)
+            # 绑定的进程已不存在
+            del self._session_workers[session_id]
+
+        if not self._idle:
+            return None
+
+        if session_id:
+            # 新会话分配给绑定会话最少的进程，优先已加载该文件的进程
+            load = {}
+            for index in self._session_workers.values():
+                load[index] = load.get(index, 0) + 1
+            return min(
+                self._idle,
+                key=lambda w: (load.get(w.index, 0), not (filepath and filepath in w.loaded_files))
+            )
+
+        return next(
+            (w for w in self._idle if filepath and filepath in w.loaded_files),
+            self._idle[0]
+        )
+
+    def _acquire(self, filepath: Optional[str], timeout: float, session_id: Optional[str] = None) -> _Worker:
+        """获取空闲工作进程，会话任务使用绑定的进程，其他任务优先选择已加载该文件的进程"""
+        self.start()
+        deadline = time.monotonic() + timeout
+        with self._condition:
+            while True:
+                if self._closed:
+                    raise ExecutionPoolError("代码执行进程池已关闭")
+                chosen = self._choose(filepath, session_id)
+                if chosen is not None:
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise ExecutionPoolError("代码执行进程繁忙，请稍后重试")
+                self._condition.wait(remaining)
+
+            self._idle.remove(chosen)
+            if session_id:
+                self._session_workers[session_id] = chosen.index
+            return chosen
+
+    def _release(self, worker: _Worker, recycle: bool = False, reason: str = "") -> None:
+        """归还工作进程，必要时回收并创建新进程"""
+        if self.max_tasks_per_worker and worker.tasks >= self.max_tasks_per_worker:
+            recycle, reason = True, reason or f"已执行 {worker.tasks} 个任务"
+
+        if recycle or not worker.is_alive():
+            logger.info(f"回收代码执行进程 {worker.index}: {reason or '进程已退出'}")
+            worker.stop(graceful=False)
+            index, worker = worker.index, None
+            with self._condition:
+                # 进程内的会话内核已丢失
+                self._session_workers = {
+                    sid: i for sid, i in self._session_workers.items() if i != index
+                }
+            if not self._closed:
+                try:
+                    worker = _Worker(self._ctx, index, self.memory_mb)
+                except Exception as e:
+                    logger.error(f"创建代码执行进程失败: {str(e)}", exc_info=True)
+
+        with self._condition:
+            if worker is None:
+                self._workers.pop(index, None)
+                # 等待该进程的会话任务需要重新分配
+                self._condition.notify_all()
+                return
+            if self._closed:
+                worker.stop()
+                return
+            self._workers[worker.index] = worker
+            self._idle.append(worker)
+            # 会话任务只能使用绑定的进程，需要唤醒全部等待者
+            self._condition.notify_all()
+
+    def submit(
+        self,
+        message: Dict[str, Any],
+        timeout: float,
+        cancel_token: Optional[CancellationToken] = None
+    ) -> Dict[str, Any]:
+        """
+        在工作进程中执行任务
+
+        Args:
+            message: 任务消息
+            timeout: 墙钟时间上限（秒）
+            cancel_token: 取消令牌，取消时终止执行中的工作进程
+
+        Returns:
+            执行结果
+        """
+        if cancel_token is not None and cancel_token.cancelled:
+            return {"output": "执行已取消", "success": False, "cancelled": True}
+
+        filepath = message.get("filepath")
+        worker = self._acquire(filepath, timeout, message.get("session_id"))
+        started = time.perf_counter()
+
+        remove_callback = None
+        if cancel_token is not None:
+            # 进程被终止后管道关闭，request 随即以 EOFError 返回
+            remove_callback = cancel_token.add_callback(lambda reason: worker.process.kill())
+
+        try:
+            result = worker.request(message, timeout)
+        except (EOFError, BrokenPipeError, OSError):
+            if cancel_token is not None and cancel_token.cancelled:
+                self._release(worker, recycle=True, reason=f"执行已取消 ({cancel_token.reason})")
+                return {"output": "执行已取消", "success": False, "cancelled": True}
+            exitcode = worker.process.exitcode
+            self._release(worker, recycle=True, reason=f"进程异常退出 (exitcode={exitcode})")
+            return {
+                "output": "执行错误：执行进程异常退出，可能超出了 CPU 或内存限制",
+                "success": False
+            }
+        finally:
+            if remove_callback is not None:
+                remove_callback()
+
+        if result is None:
+            self._release(worker, recycle=True, reason=f"执行超时 ({timeout} 秒)")
+            return {
+                "output": f"执行错误：执行超时（超过 {timeout} 秒），已终止",
+                "success": False
+            }
+
+        worker.tasks += 1
+        if filepath:
+            worker.loaded_files.add(filepath)
+
+        rss_mb = result.pop("rss_mb", 0)
+        recycle, reason = False, ""
+        if result.pop("memory_error", False):
+            recycle, reason = True, "超出内存限制"
+        elif self.recycle_rss_mb and rss_mb > self.recycle_rss_mb:
+            recycle, reason = True, f"常驻内存 {rss_mb:.0f}MB 超过阈值"
+
+        logger.debug(
+            f"进程 {worker.index} 完成任务，耗时: {time.perf_counter() - started:.2f}s, 内存: {rss_mb:.0f}MB"
+        )
+        self._release(worker, recycle=recycle, reason=reason)
+        return result
@@ -0,0 +1,219 @@
+"""列投影分析
+
+分析生成代码中 df 的使用方式，找出实际引用的列，执行时只加载这些列。
+只识别以下可以确定列范围的用法，遇到其他用法一律退回加载全部列：
+
+- df["col"]、df[["a", "b"]]、df.col
+- df[条件]、df.loc[条件]、df.head(n) 等保留列集合的操作之后再选列
+- df.dropna(subset=[...])、df.drop_duplicates([...])（未指定 subset 时会用到全部列）
+- df.loc[条件, "col"]、df.loc[:, ["a", "b"]]
+- df.groupby("key")["col"]、df.sort_values("col")[...]
+- len(df)
+"""
+import ast
+import pandas as pd
+from typing import List, Optional, Set, Sequence
+
+# 不改变列集合的方法（参数中的列名会被计入）
+FRAME_PRESERVING_METHODS = {
+    "head", "tail", "copy", "sort_values", "dropna", "drop_duplicates", "nlargest", "nsmallest", "sample"
+}
+# 上述方法中指定列名的参数
+COLUMN_ARGUMENTS = {"by", "subset", "columns"}
+# 未指定 subset 时按全部列判断的方法，裁剪列后结果会改变
+SUBSET_METHODS = {"dropna", "drop_duplicates"}
+
+
+class _Unsupported(Exception):
+    """遇到无法确定列范围的用法"""
+    pass
+
+
+def _parents(tree: ast.AST) -> dict:
+    parents = {}
+    for node in ast.walk(tree):
+        for child in ast.iter_child_nodes(node):
+            parents[child] = node
+    return parents
+
+
+def _constant_columns(node: ast.AST) -> Optional[Set[str]]:
+    """解析常量列名（字符串或字符串列表），不是常量时返回 None"""
+    if isinstance(node, ast.Constant) and isinstance(node.value, str):
+        return {node.value}
+    if isinstance(node, (ast.List, ast.Tuple)) and node.elts:
+        columns = set()
+        for element in node.elts:
+            if not (isinstance(element, ast.Constant) and isinstance(element.value, str)):
+                return None
+            columns.add(element.value)
+        return columns
+    return None
+
+
+def _is_row_selector(node: ast.AST) -> bool:
+    """是否为行选择（切片或条件表达式），而不是列选择"""
+    if isinstance(node, ast.Slice):
+        return True
+    return _constant_columns(node) is None
+
+
+class _ProjectionVisitor:
+    def __init__(self, tree: ast.AST, frame_name: str, all_columns: Sequence[str]):
+        self.tree = tree
+        self.parents = _parents(tree)
+        self.frame_name = frame_name
+        self.all_columns = set(all_columns)
+        self.columns: Set[str] = set()
+        # 代码中新建的列
+        self.assigned: Set[str] = set()
+
+    def _method_columns(self, call: ast.Call) -> Set[str]:
+        """方法调用参数中的列名"""
+        columns = set()
+        for keyword in call.keywords:
+            if keyword.arg in COLUMN_ARGUMENTS:
+                names = _constant_columns(keyword.value)
+                if names is None:
+                    raise _Unsupported()
+                columns |= names
+        return columns
+
+    def _subset_columns(self, call: ast.Call, method: str) -> Set[str]:
+        """dropna / drop_duplicates 的 subset 列名，没有常量 subset 时无法裁剪列"""
+        subset = next((keyword.value for keyword in call.keywords if keyword.arg == "subset"), None)
+        if method == "drop_duplicates" and call.args:
+            # drop_duplicates 的第一个位置参数是 subset
+            if subset is not None or len(call.args) > 1:
+                raise _Unsupported()
+            subset = call.args[0]
+        elif call.args:
+            # dropna 的位置参数为 axis 等，可能按列删除
+            raise _Unsupported()
+        if any(keyword.arg == "axis" for keyword in call.keywords):
+            raise _Unsupported()
+        names = _constant_columns(subset) if subset is not None else None
+        if names is None:
+            raise _Unsupported()
+        return names
+
+    def _frame_usage(self, node: ast.AST) -> None:
+        """分析一个 DataFrame 表达式（列集合与 df 相同）如何被使用"""
+        parent = self.parents.get(node)
+
+        if isinstance(parent, ast.Subscript) and parent.value is node:
+            names = _constant_columns(parent.slice)
+            if names is not None:
+                if isinstance(parent.ctx, ast.Load):
+                    self.columns |= names
+                else:
+                    # 赋值新列不需要读取；覆盖已有列时仍然加载该列
+                    self.assigned |= names - self.all_columns
+                return
+            if isinstance(parent.ctx, ast.Load):
+                # 按条件或切片选行，列集合不变
+                return self._frame_usage(parent)
+            raise _Unsupported()
+
+        if isinstance(parent, ast.Attribute) and parent.value is node:
+            grandparent = self.parents.get(parent)
+
+            if parent.attr == "loc" and isinstance(grandparent, ast.Subscript) and isinstance(grandparent.ctx, ast.Load):
+                selector = grandparent.slice
+                if isinstance(selector, ast.Tuple) and len(selector.elts) == 2:
+                    names = _constant_columns(selector.elts[1])
+                    if names is None:
+                        raise _Unsupported()
+                    self.columns |= names
+                    return
+                if _is_row_selector(selector):
+                    return self._frame_usage(grandparent)
+                raise _Unsupported()
+
+            if isinstance(grandparent, ast.Call) and grandparent.func is parent:
+                if parent.attr in FRAME_PRESERVING_METHODS:
+                    if parent.attr in SUBSET_METHODS:
+                        self.columns |= self._subset_columns(grandparent, parent.attr)
+                    self.columns |= self._method_columns(grandparent)
+                    if parent.attr in ("sort_values", "nlargest", "nsmallest"):
+                        positional = grandparent.args[1:] if parent.attr != "sort_values" else grandparent.args[:1]
+                        for argument in positional:
+                            names = _constant_columns(argument)
+                            if names is None:
+                                raise _Unsupported()
+                            self.columns |= names
+                    return self._frame_usage(grandparent)
+
+                if parent.attr == "groupby":
+                    keys = set()
+                    for argument in grandparent.args[:1]:
+                        names = _constant_columns(argument)
+                        if names is None:
+                            raise _Unsupported()
+                        keys |= names
+                    for keyword in grandparent.keywords:
+                        if keyword.arg == "by":
+                            names = _constant_columns(keyword.value)
+                            if names is None:
+                                raise _Unsupported()
+                            keys |= names
+                    # 分组后必须紧跟选列，否则聚合会用到全部列
+                    selection = self.parents.get(grandparent)
+                    if (isinstance(selection, ast.Subscript) and selection.value is grandparent
+                            and _constant_columns(selection.slice) is not None):
+                        self.columns |= keys | _constant_columns(selection.slice)
+                        return
+                    raise _Unsupported()
+
+            # 与 DataFrame 属性同名时 df.xxx 取到的是属性而不是列
+            if parent.attr in self.all_columns and not hasattr(pd.DataFrame, parent.attr):
+                self.columns.add(parent.attr)
+                return
+            raise _Unsupported()
+
+        if (isinstance(parent, ast.Call) and isinstance(parent.func, ast.Name)
+                and parent.func.id == "len" and parent.args == [node]):
+            return
+
+        raise _Unsupported()
+
+    def analyze(self) -> Set[str]:
+        for node in ast.walk(self.tree):
+            if isinstance(node, ast.Name) and node.id == self.frame_name:
+                if not isinstance(node.ctx, ast.Load):
+                    # 重新绑定 df 后无法跟踪
+                    raise _Unsupported()
+                self._frame_usage(node)
+        return self.columns - self.assigned
+
+
+def referenced_columns(code: str, columns: Sequence[str], frame_name: str = "df") -> Optional[List[str]]:
+    """
+    分析代码引用的列
+
+    Args:
+        code: Python 代码
+        columns: 数据的全部列名
+        frame_name: 数据变量名
+
+    Returns:
+        需要加载的列（按原始顺序）；需要全部列或无法确定时返回 None
+    """
+    if not columns or not all(isinstance(col, str) for col in columns):
+        return None
+
+    try:
+        tree = ast.parse(code)
+        used = _ProjectionVisitor(tree, frame_name, columns).analyze()
+    except (SyntaxError, _Unsupported):
+        return None
+
+    # 引用了不存在的列时按原样执行，由代码自身报错
+    if used - set(columns):
+        return None
+
+    projected = [col for col in columns if col in used]
+    if len(projected) == len(columns):
+        return None
+    # 只用到行数时保留第一列
+    return projected or [columns[0]]
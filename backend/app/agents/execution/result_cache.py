@@ -0,0 +1,198 @@
+"""代码执行结果缓存
+
+同一份数据上重复执行相同代码（用户重复提问、重新生成回答）时直接返回上次的结果。
+缓存键由文件内容哈希和规范化后的代码哈希组成：代码先解析为 AST 再序列化，
+因此空白、注释等差异不影响命中。包含随机数、当前时间等不确定因素的代码，
+以及引用了执行环境之外变量的代码不会被缓存。
+"""
+import ast
+import builtins
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, Optional, Set
+from app.agents.config import AgentConfig
+from app.agents.execution.runner import BASE_NAMES
+from app.core.logging_config import get_agent_logger
+
+logger = get_agent_logger('execution.result_cache')
+
+# 结果不确定的模块
+NONDETERMINISTIC_MODULES = {"random", "time", "uuid", "secrets", "os", "sys", "subprocess", "socket", "requests"}
+# 结果不确定的属性调用（如 datetime.now()、np.random.rand()）
+NONDETERMINISTIC_ATTRIBUTES = {
+    "now", "today", "utcnow", "random", "rand", "randn", "randint",
+    "choice", "shuffle", "permutation", "default_rng", "urandom"
+}
+# 读取外部状态的内置函数
+NONDETERMINISTIC_BUILTINS = {"open", "input", "id", "hash", "globals", "locals", "vars"}
+
+_BUILTIN_NAMES = frozenset(dir(builtins))
+
+
+def parse_code(code: str) -> Optional[ast.Module]:
+    """解析代码，语法错误时返回 None"""
+    try:
+        return ast.parse(code)
+    except SyntaxError:
+        return None
+
+
+def _defined_names(tree: ast.AST) -> Set[str]:
+    """代码中定义的名称（赋值、导入、函数/类定义、循环变量、参数等）"""
+    names = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Name) and isinstance(node.ctx, (ast.Store, ast.Del)):
+            names.add(node.id)
+        elif isinstance(node, (ast.Import, ast.ImportFrom)):
+            for alias in node.names:
+                names.add((alias.asname or alias.name).split(".")[0])
+        elif isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            names.add(node.name)
+        elif isinstance(node, ast.arg):
+            names.add(node.arg)
+        elif isinstance(node, ast.ExceptHandler) and node.name:
+            names.add(node.name)
+    return names
+
+
+def find_uncacheable_reason(tree: ast.Module) -> Optional[str]:
+    """
+    检查代码是否可以缓存
+
+    Returns:
+        不可缓存的原因；可以缓存时返回 None
+    """
+    defined = _defined_names(tree)
+
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            for alias in node.names:
+                if alias.name.split(".")[0] in NONDETERMINISTIC_MODULES:
+                    return f"导入了 {alias.name}"
+        elif isinstance(node, ast.ImportFrom):
+            if (node.module or "").split(".")[0] in NONDETERMINISTIC_MODULES:
+                return f"导入了 {node.module}"
+            for alias in node.names:
+                if alias.name in NONDETERMINISTIC_ATTRIBUTES:
+                    return f"导入了 {alias.name}"
+        elif isinstance(node, ast.Attribute) and node.attr in NONDETERMINISTIC_ATTRIBUTES:
+            return f"调用了 {node.attr}"
+        elif isinstance(node, ast.Call):
+            func = node.func
+            if isinstance(func, ast.Name) and func.id in NONDETERMINISTIC_BUILTINS and func.id not in defined:
+                return f"调用了 {func.id}"
+            # 未指定 random_state 的抽样
+            if (isinstance(func, ast.Attribute) and func.attr == "sample"
+                    and not any(k.arg == "random_state" for k in node.keywords)):
+                return "抽样未指定 random_state"
+
+    # 引用了执行环境之外的变量（如上一轮代码定义的变量）时结果取决于外部状态
+    free = {
+        node.id for node in ast.walk(tree)
+        if isinstance(node, ast.Name) and isinstance(node.ctx, ast.Load)
+    } - defined - BASE_NAMES - _BUILTIN_NAMES
+    if free:
+        return f"引用了外部变量 {', '.join(sorted(free))}"
+
+    return None
+
+
+class ResultCache:
+    """代码执行结果缓存
+
+    按最近使用顺序淘汰，条目数和总大小均有上限。
+    条目包含标准输出以及执行后产生的结果对象（pickle 序列化）。
+    """
+
+    _entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+    _total_bytes: int = 0
+    _lock = threading.Lock()
+
+    @classmethod
+    def make_key(cls, code: str, filepath: Optional[str], engine: str = "pandas") -> Optional[str]:
+        """
+        生成缓存键
+
+        Returns:
+            缓存键；代码不可缓存或无法确定数据版本时返回 None
+        """
+        if not filepath:
+            return None
+
+        tree = parse_code(code)
+        if tree is None:
+            return None
+
+        reason = find_uncacheable_reason(tree)
+        if reason:
+            logger.debug(f"代码不可缓存: {reason}")
+            return None
+
+        try:
+            from app.services.file_service import FileService
+            data_version = FileService.get_content_hash(filepath)
+        except OSError:
+            return None
+
+        code_hash = hashlib.sha256(ast.dump(tree).encode("utf-8")).hexdigest()
+        return f"{data_version}:{engine}:{code_hash}"
+
+    @classmethod
+    def get(cls, key: str) -> Optional[Dict[str, Any]]:
+        """获取缓存的执行结果"""
+        with cls._lock:
+            entry = cls._entries.get(key)
+            if entry is not None:
+                cls._entries.move_to_end(key)
+            return entry
+
+    @classmethod
+    def put(cls, key: str, result: Dict[str, Any]) -> None:
+        """
+        保存执行结果（仅保存成功的结果）
+
+        Args:
+            key: 缓存键
+            result: 执行结果，objects 为结果对象名 -> pickle 字节
+        """
+        if not result.get("success"):
+            return
+
+        output = result.get("output", "")
+        objects = dict(result.get("objects") or {})
+        size = len(output.encode("utf-8")) + sum(len(data) for data in objects.values())
+
+        max_bytes = AgentConfig.RESULT_CACHE_MAX_MB * 1024 * 1024
+        if size > max_bytes:
+            logger.debug(f"执行结果过大，不缓存: {size} 字节")
+            return
+
+        # complete 为 False 表示部分变量未能保存（函数、无法序列化或过大的对象）
+        entry = {
+            "output": output,
+            "objects": objects,
+            "complete": result.get("objects_complete", True),
+            "size": size
+        }
+
+        with cls._lock:
+            previous = cls._entries.pop(key, None)
+            if previous is not None:
+                cls._total_bytes -= previous["size"]
+            cls._entries[key] = entry
+            cls._total_bytes += size
+
+            while cls._entries and (
+                len(cls._entries) > AgentConfig.RESULT_CACHE_MAX_ENTRIES
+                or cls._total_bytes > max_bytes
+            ):
+                _, evicted = cls._entries.popitem(last=False)
+                cls._total_bytes -= evicted["size"]
+
+    @classmethod
+    def clear(cls) -> None:
+        """清空缓存"""
+        with cls._lock:
+            cls._entries.clear()
+            cls._total_bytes = 0
@@ -0,0 +1,308 @@
+"""代码运行模块（主进程内联执行与工作进程共用）"""
+import io
+import os
+import ast
+import codecs
+import types
+import pickle
+import threading
+import contextlib
+import pandas as pd
+from typing import Dict, Any, Optional, Tuple
+from app.agents.config import AgentConfig
+from app.core.config import settings
+
+# 执行环境预置的变量（pandas 与 polars 两种环境的并集）
+BASE_NAMES = frozenset({
+    'df', 'pd', 'pandas', 'lf', 'pl', 'collect',
+    'profile', 'HyperLogLog', 'TDigest', 'ReservoirSample'
+})
+
+# LazyFrame 缓存：文件路径 -> (修改时间, LazyFrame)，进程内复用扫描计划
+_lazy_frames: Dict[str, Tuple[float, Any]] = {}
+_lazy_frames_lock = threading.Lock()
+
+
+def enable_copy_on_write() -> bool:
+    """
+    启用 pandas 写时复制
+
+    pandas >= 3.0 始终启用；2.x 通过选项启用；更早的版本不支持。
+
+    Returns:
+        写时复制是否生效
+    """
+    if int(pd.__version__.split('.')[0]) >= 3:
+        return True
+    try:
+        pd.set_option("mode.copy_on_write", True)
+        return True
+    except (KeyError, ValueError):
+        return False
+
+
+# 写时复制生效时，执行环境中的 df 是共享数据的浅拷贝：
+# 代码修改列或原地操作时只复制被修改的部分，不会影响缓存的数据
+COPY_ON_WRITE = AgentConfig.EXECUTION_COPY_ON_WRITE and enable_copy_on_write()
+
+
+def is_polars_available() -> bool:
+    """polars 是否已安装"""
+    try:
+        import polars  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def uses_profile(code: str) -> bool:
+    """代码是否读取了 profile 变量"""
+    if "profile" not in code:
+        return False
+    try:
+        tree = ast.parse(code)
+    except SyntaxError:
+        return False
+    return any(isinstance(node, ast.Name) and node.id == "profile" for node in ast.walk(tree))
+
+
+def load_profile(code: str, filepath: Optional[str], df: Optional[pd.DataFrame] = None):
+    """
+    获取代码需要的列概要
+
+    Returns:
+        代码读取 profile 时返回数据文件的 TableProfile（没有文件时由 df 临时构建），否则为 None
+    """
+    if not settings.column_profile_enabled or not uses_profile(code):
+        return None
+    from app.services.profile_service import ProfileService
+    if filepath:
+        return ProfileService.get_profile(filepath)
+    return ProfileService.build_profile(df) if df is not None else None
+
+
+def build_namespace(df: Optional[pd.DataFrame], profile: Any = None) -> Dict[str, Any]:
+    """
+    构建代码执行环境
+
+    Args:
+        df: 会话数据（在多次执行间共享，这里传入副本；写时复制生效时为浅拷贝）
+        profile: 会话数据的列概要（TableProfile）
+
+    Returns:
+        执行环境的全局变量
+    """
+    from app.services.sketches import HyperLogLog, TDigest, ReservoirSample
+
+    return {
+        'df': df.copy(deep=not COPY_ON_WRITE) if df is not None else None,
+        'pd': pd,
+        'pandas': pd,
+        'profile': profile,
+        'HyperLogLog': HyperLogLog,
+        'TDigest': TDigest,
+        'ReservoirSample': ReservoirSample,
+    }
+
+
+def _collect_streaming(query):
+    """以流式引擎执行 LazyFrame 查询，兼容不同版本的 polars"""
+    try:
+        return query.collect(engine="streaming")
+    except TypeError:
+        return query.collect(streaming=True)
+
+
+def _pandas_to_polars(df: pd.DataFrame):
+    """转换为 polars DataFrame；未安装 pyarrow 时逐列转换"""
+    import polars as pl
+
+    try:
+        return pl.from_pandas(df)
+    except ImportError:
+        return pl.DataFrame([
+            pl.Series(str(col), df[col].astype(object).where(df[col].notna(), None).tolist(), strict=False)
+            for col in df.columns
+        ])
+
+
+def _is_utf8(filepath: str) -> bool:
+    """文件是否为 UTF-8 编码（scan_csv 只支持 UTF-8）"""
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    try:
+        with open(filepath, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                decoder.decode(chunk)
+            decoder.decode(b"", final=True)
+    except UnicodeDecodeError:
+        return False
+    return True
+
+
+def get_lazy_frame(filepath: Optional[str], df: Optional[pd.DataFrame] = None):
+    """
+    获取会话数据的 LazyFrame
+
+    CSV 文件直接扫描（不加载到内存，查询时做投影/谓词下推）；
+    其他格式或 polars 无法解析的 CSV（如 GBK 编码）从 DataFrame 转换。
+    """
+    import polars as pl
+
+    if not filepath:
+        return _pandas_to_polars(df).lazy() if df is not None else None
+
+    mtime = os.path.getmtime(filepath)
+    with _lazy_frames_lock:
+        cached = _lazy_frames.get(filepath)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+
+    lf = None
+    if os.path.splitext(filepath)[1].lower() == ".csv" and _is_utf8(filepath):
+        try:
+            lf = pl.scan_csv(filepath)
+            lf.collect_schema()
+        except Exception:
+            lf = None
+
+    if lf is None:
+        if df is None:
+            from app.services.file_service import FileService
+            df = FileService.get_cached_dataframe(filepath)
+        lf = _pandas_to_polars(df).lazy()
+
+    with _lazy_frames_lock:
+        _lazy_frames[filepath] = (mtime, lf)
+        while len(_lazy_frames) > settings.dataframe_cache_size:
+            _lazy_frames.pop(next(iter(_lazy_frames)))
+    return lf
+
+
+def build_polars_namespace(filepath: Optional[str], df: Optional[pd.DataFrame] = None) -> Dict[str, Any]:
+    """
+    构建 polars 代码执行环境
+
+    Args:
+        filepath: 会话数据文件
+        df: 已加载的 DataFrame（无法直接扫描文件时使用）
+
+    Returns:
+        执行环境的全局变量：lf 为会话数据的 LazyFrame，collect 以流式引擎执行查询
+    """
+    import polars as pl
+
+    return {
+        'lf': get_lazy_frame(filepath, df),
+        'pl': pl,
+        'pd': pd,
+        'pandas': pd,
+        'collect': _collect_streaming,
+    }
+
+
+def collect_objects(
+    namespace: Dict[str, Any],
+    max_object_bytes: int,
+    before: Optional[Dict[str, int]] = None
+) -> Tuple[Dict[str, bytes], bool]:
+    """
+    收集代码执行后产生的结果对象
+
+    Args:
+        namespace: 执行后的环境
+        max_object_bytes: 单个对象序列化后的大小上限，超出的对象被忽略
+        before: 执行前的变量名 -> id，只收集新建或重新赋值的变量
+
+    Returns:
+        (变量名 -> pickle 字节, 是否收集了全部变量)
+    """
+    objects = {}
+    complete = True
+    for name, value in namespace.items():
+        if name.startswith('_') or name in BASE_NAMES:
+            continue
+        if before is not None and before.get(name) == id(value):
+            continue
+        if isinstance(value, types.ModuleType):
+            continue
+        if isinstance(value, (types.FunctionType, type)):
+            complete = False
+            continue
+        try:
+            data = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        except Exception:
+            complete = False
+            continue
+        if len(data) <= max_object_bytes:
+            objects[name] = data
+        else:
+            complete = False
+    return objects, complete
+
+
+def verify_rewrite(
+    code: str,
+    rewritten: str,
+    df: Optional[pd.DataFrame],
+    sample_rows: int,
+    profile: Any = None
+) -> bool:
+    """
+    在样本数据上分别执行原代码和改写后的代码，输出完全一致时才认为改写等价
+
+    只用于不引用会话内核变量的代码：两次执行各自使用独立的执行环境。
+
+    Args:
+        code: 原代码
+        rewritten: 改写后的代码
+        df: 会话数据
+        sample_rows: 样本行数
+        profile: 会话数据的列概要
+    """
+    if df is None:
+        return False
+    sample = df.head(sample_rows)
+    original = run_code(code, build_namespace(sample, profile))
+    if not original["success"]:
+        return False
+    candidate = run_code(rewritten, build_namespace(sample, profile))
+    return candidate["success"] and candidate["output"] == original["output"]
+
+
+def run_code(code: str, namespace: Dict[str, Any], max_object_bytes: int = 0) -> Dict[str, Any]:
+    """
+    执行代码并捕获标准输出
+
+    Args:
+        code: Python 代码
+        namespace: 执行环境
+        max_object_bytes: 大于 0 时收集结果对象（用于结果缓存）
+
+    Returns:
+        执行结果：output 为输出或错误信息，success 表示是否成功，
+        收集结果对象时 objects 为变量名 -> pickle 字节，objects_complete 表示是否收集了全部变量
+    """
+    before = {name: id(value) for name, value in namespace.items()}
+    output_buffer = io.StringIO()
+    try:
+        with contextlib.redirect_stdout(output_buffer):
+            exec(code, namespace)
+    except MemoryError:
+        return {
+            "output": "执行错误：超出内存限制",
+            "success": False,
+            "memory_error": True
+        }
+    except Exception as e:
+        return {
+            "output": f"执行错误：{str(e)}",
+            "success": False
+        }
+
+    result = {
+        "output": output_buffer.getvalue(),
+        "success": True
+    }
+    if max_object_bytes > 0:
+        result["objects"], result["objects_complete"] = collect_objects(namespace, max_object_bytes, before)
+    return result
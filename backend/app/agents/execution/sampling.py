@@ -0,0 +1,112 @@
+"""分层抽样
+
+大表上先用样本执行代码给出初步结果。代码按某些列分组时按这些列分层抽样：
+每层按相同比例抽取且至少保留一行，分组结果中不会缺少任何分组。
+"""
+import ast
+import math
+import numpy as np
+import pandas as pd
+from typing import Dict, Any, List, Optional, Sequence
+
+# 分层数超过样本行数的该比例时，分层没有意义，改为简单随机抽样
+MAX_STRATA_RATIO = 0.5
+
+
+def group_keys(code: str, columns: Sequence[str], frame_name: str = "df") -> List[str]:
+    """
+    找出代码中 df.groupby(...) 使用的常量分组列
+
+    Returns:
+        分组列（按出现顺序去重）；没有分组或分组键不是常量列名时为空
+    """
+    try:
+        tree = ast.parse(code)
+    except SyntaxError:
+        return []
+
+    keys: List[str] = []
+    for node in ast.walk(tree):
+        if not (isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute) and node.func.attr == "groupby"):
+            continue
+        if not (isinstance(node.func.value, ast.Name) and node.func.value.id == frame_name):
+            continue
+        arguments = list(node.args[:1]) + [k.value for k in node.keywords if k.arg == "by"]
+        for argument in arguments:
+            elements = argument.elts if isinstance(argument, (ast.List, ast.Tuple)) else [argument]
+            for element in elements:
+                if (isinstance(element, ast.Constant) and element.value in columns
+                        and element.value not in keys):
+                    keys.append(element.value)
+    return keys
+
+
+def stratified_sample(
+    df: pd.DataFrame,
+    rows: int,
+    strata: Optional[List[str]] = None,
+    seed: int = 0
+) -> pd.DataFrame:
+    """
+    抽取约 rows 行的样本（保持原有行顺序）
+
+    每行以相同概率独立入选；指定分层列时每层额外保留一行，保证每层都出现在样本中。
+
+    Args:
+        df: 完整数据
+        rows: 目标样本行数
+        strata: 分层列
+        seed: 随机种子（固定种子使同一问题的初步结果可复现）
+    """
+    if rows >= len(df):
+        return df
+    fraction = rows / len(df)
+    draws = np.random.default_rng(seed).random(len(df))
+    keep = draws < fraction
+
+    if strata:
+        keys = [df[column] for column in strata]
+        grouped = pd.Series(draws, index=df.index).groupby(keys, dropna=False, sort=False)
+        if grouped.ngroups <= rows * MAX_STRATA_RATIO:
+            keep |= (draws == grouped.transform("min").to_numpy())
+
+    return df[keep]
+
+
+def sample_summary(
+    sample: pd.DataFrame,
+    total_rows: int,
+    strata: Optional[List[str]] = None
+) -> Dict[str, Any]:
+    """
+    估计样本结果的误差
+
+    对样本中的每个数值列估计均值的 95% 相对误差（含有限总体校正）。
+    有分层列时按最小的层计算，作为分组结果的保守估计。
+
+    Returns:
+        sample_rows、total_rows、strata，以及 margins（列名 -> 相对误差）
+    """
+    sample_rows = len(sample)
+    effective_rows = sample_rows
+    if strata and sample_rows:
+        effective_rows = int(sample.groupby(strata, dropna=False, sort=False).size().min())
+
+    margins = {}
+    if effective_rows > 1:
+        correction = math.sqrt(max(0.0, 1 - sample_rows / total_rows)) if total_rows else 1.0
+        for column in sample.select_dtypes(include="number").columns:
+            values = sample[column].dropna()
+            mean = values.mean()
+            if len(values) < 2 or not mean:
+                continue
+            margin = 1.96 * values.std() / (abs(mean) * math.sqrt(effective_rows)) * correction
+            if np.isfinite(margin):
+                margins[str(column)] = float(margin)
+
+    return {
+        "sample_rows": sample_rows,
+        "total_rows": total_rows,
+        "strata": list(strata or []),
+        "margins": margins,
+    }
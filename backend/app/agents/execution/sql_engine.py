@@ -0,0 +1,214 @@
+"""DuckDB SQL 执行引擎
+
+ANALYSIS_ENGINE=duckdb 时模型生成 SQL，在进程内的 DuckDB 连接中执行。
+每个会话一个连接：CSV 文件通过 read_csv_auto 视图直接扫描（支持投影/谓词下推和多线程），
+Excel 等无法直接扫描的文件复制已加载的 DataFrame。duckdb 为可选依赖，按需导入。
+"""
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, Optional, Tuple
+from app.agents.config import AgentConfig
+from app.core.logging_config import get_agent_logger
+
+logger = get_agent_logger('execution.sql_engine')
+
+# 查询中使用的表名
+SQL_TABLE_NAME = "data"
+
+
+def is_duckdb_available() -> bool:
+    """duckdb 是否已安装"""
+    try:
+        import duckdb  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def _quote_literal(value: str) -> str:
+    return "'" + value.replace("'", "''") + "'"
+
+
+class _SessionConnection:
+    """会话的 DuckDB 连接及其数据版本"""
+
+    def __init__(self, connection, filepath: str, version: Tuple[float, int]):
+        self.connection = connection
+        self.filepath = filepath
+        self.version = version
+
+
+class DuckDBEngine:
+    """DuckDB SQL 执行引擎
+
+    连接按会话缓存，数据文件变化时重建。连接只允许访问会话数据文件，
+    并禁止修改配置，模型生成的 SQL 仅允许查询语句。
+    """
+
+    def __init__(self, max_sessions: Optional[int] = None):
+        self.max_sessions = max_sessions or AgentConfig.DUCKDB_MAX_SESSIONS
+        self._connections: "OrderedDict[str, _SessionConnection]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _connect(self, filepath: str, dataframe=None):
+        """创建连接并注册数据表"""
+        import duckdb
+
+        config = {}
+        if AgentConfig.DUCKDB_THREADS > 0:
+            config["threads"] = AgentConfig.DUCKDB_THREADS
+        if AgentConfig.DUCKDB_MEMORY_LIMIT:
+            config["memory_limit"] = AgentConfig.DUCKDB_MEMORY_LIMIT
+        if AgentConfig.DUCKDB_TEMP_DIRECTORY:
+            config["temp_directory"] = AgentConfig.DUCKDB_TEMP_DIRECTORY
+
+        connection = duckdb.connect(database=":memory:", config=config)
+        try:
+            file_ext = os.path.splitext(filepath)[1].lower()
+            registered = False
+            if file_ext == ".csv":
+                try:
+                    connection.execute(
+                        f"CREATE VIEW {SQL_TABLE_NAME} AS "
+                        f"SELECT * FROM read_csv_auto({_quote_literal(os.path.abspath(filepath))})"
+                    )
+                    connection.execute(f"DESCRIBE {SQL_TABLE_NAME}")
+                    registered = True
+                except duckdb.Error as e:
+                    # 非 UTF-8 编码等情况退回到 pandas 读取的结果
+                    logger.warning(f"DuckDB 无法直接读取 CSV，改为注册 DataFrame: {str(e)}")
+                    connection.execute(f"DROP VIEW IF EXISTS {SQL_TABLE_NAME}")
+
+            if not registered:
+                if dataframe is None:
+                    from app.services.file_service import FileService
+                    dataframe = FileService.get_cached_dataframe(filepath)
+                # 关闭外部访问后无法再扫描 Python 对象，这里复制为 DuckDB 表
+                connection.register("_source_frame", dataframe)
+                connection.execute(f"CREATE TABLE {SQL_TABLE_NAME} AS SELECT * FROM _source_frame")
+                connection.unregister("_source_frame")
+
+            # 只允许访问会话数据文件，并锁定配置防止查询中修改
+            connection.execute(f"SET allowed_paths=[{_quote_literal(os.path.abspath(filepath))}]")
+            connection.execute("SET enable_external_access=false")
+            connection.execute("SET lock_configuration=true")
+        except Exception:
+            connection.close()
+            raise
+
+        return connection
+
+    def _get_connection(self, session_id: str, filepath: str, dataframe=None):
+        """获取会话连接，数据文件变化时重建"""
+        stat = os.stat(filepath)
+        version = (stat.st_mtime, stat.st_size)
+
+        with self._lock:
+            entry = self._connections.get(session_id)
+            if entry is not None and entry.filepath == filepath and entry.version == version:
+                self._connections.move_to_end(session_id)
+                return entry.connection
+
+        connection = self._connect(filepath, dataframe)
+        logger.info(f"创建 DuckDB 连接，会话: {session_id}")
+
+        stale = []
+        with self._lock:
+            previous = self._connections.pop(session_id, None)
+            if previous is not None:
+                stale.append(previous)
+            self._connections[session_id] = _SessionConnection(connection, filepath, version)
+            while len(self._connections) > self.max_sessions:
+                stale.append(self._connections.popitem(last=False)[1])
+
+        for entry in stale:
+            entry.connection.close()
+        return connection
+
+    @staticmethod
+    def _validate_statements(sql: str) -> Optional[str]:
+        """检查 SQL 是否只包含查询语句，返回错误信息"""
+        import duckdb
+
+        statements = duckdb.extract_statements(sql)
+        if not statements:
+            return "SQL 为空"
+        for statement in statements:
+            if statement.type != duckdb.StatementType.SELECT:
+                return f"只允许执行查询语句，不支持: {statement.type.name}"
+        return None
+
+    def execute(self, sql: str, session_id: Optional[str], filepath: Optional[str], dataframe=None) -> Dict[str, Any]:
+        """
+        执行 SQL 查询
+
+        Args:
+            sql: SQL 语句，表名为 data
+            session_id: 会话ID
+            filepath: 会话数据文件
+            dataframe: 已加载的 DataFrame（无法直接扫描文件时使用）
+
+        Returns:
+            执行结果：output 为查询结果表格或错误信息，success 表示是否成功
+        """
+        if not is_duckdb_available():
+            return {"output": "执行错误：未安装 duckdb，无法执行 SQL", "success": False}
+        if not filepath:
+            return {"output": "执行错误：会话没有数据文件", "success": False}
+
+        import duckdb
+
+        try:
+            error = self._validate_statements(sql)
+            if error:
+                return {"output": f"执行错误：{error}", "success": False}
+            connection = self._get_connection(session_id or filepath, filepath, dataframe)
+        except (duckdb.Error, OSError) as e:
+            return {"output": f"执行错误：{str(e)}", "success": False}
+
+        # 每次查询使用独立游标，同一会话的并发查询互不影响
+        cursor = connection.cursor()
+        timer = threading.Timer(AgentConfig.MAX_CODE_EXECUTION_TIME, cursor.interrupt)
+        timer.daemon = True
+        timer.start()
+        try:
+            relation = cursor.sql(sql)
+            if relation is None:
+                return {"output": "执行成功", "success": True}
+            max_rows = AgentConfig.SQL_MAX_RESULT_ROWS
+            result_df = relation.limit(max_rows + 1).df()
+        except duckdb.InterruptException:
+            return {
+                "output": f"执行错误：执行超时（超过 {AgentConfig.MAX_CODE_EXECUTION_TIME} 秒），已终止",
+                "success": False
+            }
+        except duckdb.Error as e:
+            return {"output": f"执行错误：{str(e)}", "success": False}
+        finally:
+            timer.cancel()
+            cursor.close()
+
+        output = result_df.head(max_rows).to_string(index=False)
+        if len(result_df) > max_rows:
+            output += f"\n...（仅显示前 {max_rows} 行）"
+        return {"output": output, "success": True}
+
+    def close_session(self, session_id: str) -> None:
+        """关闭会话连接"""
+        with self._lock:
+            entry = self._connections.pop(session_id, None)
+        if entry is not None:
+            entry.connection.close()
+
+    def shutdown(self) -> None:
+        """关闭全部连接"""
+        with self._lock:
+            entries = list(self._connections.values())
+            self._connections.clear()
+        for entry in entries:
+            entry.connection.close()
+
+
+# 全局 SQL 执行引擎
+sql_engine = DuckDBEngine()
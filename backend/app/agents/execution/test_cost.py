@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""测试执行耗时估计与准入控制"""
+
+import os
+import sys
+# 添加项目根目录到 Python 路径
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '../../..'))
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from app.agents.config import AgentConfig
+from app.agents.execution import cost
+from app.agents.execution.executor import CodeExecutor, ExecutionContext
+
+COLUMNS = ["region", "price", "qty"]
+DISTINCT = {"region": 4, "price": 10 ** 6, "qty": 9}
+
+
+def estimate(code):
+    return cost.estimate_cost(code, COLUMNS, DISTINCT.get)
+
+
+@pytest.mark.parametrize("code, hint", [
+    ("print(len(df.merge(df, how='cross')))", cost.HINT_CROSS_JOIN),
+    ("print(len(pd.merge(df, df[df['qty'] > 3], on='region')))", cost.HINT_MANY_TO_MANY),
+    ("for i in range(len(df)):\n    for j in range(len(df)):\n        pass", cost.HINT_NESTED_LOOP),
+    ("for _, r in df.iterrows():\n    print(len(df[df['qty'] == r['qty']]))", cost.HINT_NESTED_LOOP),
+])
+def test_super_linear_patterns(code, hint):
+    """笛卡尔积、多对多合并和嵌套遍历 df 的估计耗时按行数的平方增长"""
+    result = estimate(code)
+    assert result.quadratic > 0
+    assert hint in result.hints
+    assert result.seconds(2 * 10 ** 5) > 3 * result.seconds(10 ** 5)
+
+
+def test_linear_patterns():
+    """聚合结果的合并和按不同取值的循环仍是线性的，循环次数取自去重计数"""
+    merge = estimate("m = df.merge(df.groupby('region')['price'].mean().reset_index(), on='region')")
+    assert merge.quadratic == 0
+
+    loop = estimate("for r in df['region'].unique():\n    print(df[df['region'] == r]['price'].sum())")
+    fixed = estimate("for r in ['a', 'b']:\n    print(df[df['region'] == r]['price'].sum())")
+    assert loop.quadratic == 0 and loop.linear < fixed.linear
+
+    assert estimate("print(df.apply(lambda r: str(r['region']) + '!', axis=1))").linear > 100 * cost.CELL_SECONDS
+
+
+@pytest.mark.parametrize("seconds, sample_seconds, can_sample, route", [
+    (1, 0.1, True, cost.ROUTE_RUN),
+    (10, 1, True, cost.ROUTE_BACKGROUND),
+    (100, 10, True, cost.ROUTE_SAMPLE),
+    (100, 10, False, cost.ROUTE_REJECT),
+    (10 ** 6, 10 ** 4, True, cost.ROUTE_REJECT),
+])
+def test_admit_routes(seconds, sample_seconds, can_sample, route):
+    """按估计耗时选择执行方式"""
+    rows, sample_rows = 10 ** 6, 10 ** 5
+    # 构造在 rows 行上耗时 seconds、在 sample_rows 行上耗时 sample_seconds 的估计
+    quadratic = (seconds / rows - sample_seconds / sample_rows) / (rows - sample_rows)
+    estimate = cost.CostEstimate(linear=seconds / rows - quadratic * rows, quadratic=quadratic)
+    decision = cost.admit(estimate, rows, sample_rows, background_seconds=3, max_seconds=30,
+                          can_sample=lambda: can_sample)
+    assert decision.route == route
+
+
+def test_executor_rejects_and_samples(monkeypatch):
+    """执行器按数据行数和列的去重计数给出准入决定"""
+    monkeypatch.setattr(AgentConfig, "PROGRESSIVE_SAMPLE_ROWS", 10 ** 5)
+    monkeypatch.setattr(AgentConfig, "COST_MAX_SECONDS", 30)
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame({"region": rng.choice(["a", "b"], 20000), "price": rng.random(20000)})
+    executor = CodeExecutor(mode="inline")
+    context = ExecutionContext(dataframe=df, columns=list(df.columns), rows=2 * 10 ** 6)
+
+    assert executor.admit("print(df['price'].sum())", context).route == cost.ROUTE_RUN
+    rejected = executor.admit("print(len(df.merge(df, on='region')))", context)
+    assert rejected.route == cost.ROUTE_REJECT
+    assert cost.HINT_MANY_TO_MANY in rejected.hints
+    sampled = executor.admit("t = 0\nfor _, r in df.iterrows():\n    t += r['price']\nprint(t)", context)
+    assert sampled.route == cost.ROUTE_SAMPLE
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""测试会话内核"""
+
+import os
+import sys
+import time
+# 添加项目根目录到 Python 路径
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '../../..'))
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from app.agents.config import AgentConfig
+from app.agents.execution import CodeExecutor, ExecutionContext, ResultCache
+from app.agents.execution.kernel import SessionKernels
+from app.agents.prompts import build_kernel_variables_block
+
+
+@pytest.fixture
+def context(tmp_path):
+    path = tmp_path / "data.csv"
+    pd.DataFrame({"region": ["east", "west", "east"], "price": [1, 2, 3]}).to_csv(path, index=False)
+    return ExecutionContext(session_id="s1", filepath=str(path), dataframe=pd.read_csv(path))
+
+
+@pytest.fixture
+def executor(monkeypatch):
+    monkeypatch.setattr(AgentConfig, "SESSION_KERNELS_ENABLED", True)
+    ResultCache.clear()
+    executor = CodeExecutor(mode="inline")
+    yield executor
+    executor.shutdown()
+    ResultCache.clear()
+
+
+def test_variables_persist_between_turns(executor, context):
+    first = executor.execute("by_region = df.groupby('region')['price'].sum()\ntotal = int(by_region.sum())", context)
+    assert first["success"], first["output"]
+
+    second = executor.execute("print(by_region['east'], total)", context)
+    assert second["output"].strip() == "4 6"
+
+    variables = {v["name"]: v for v in executor.get_kernel_variables("s1")}
+    assert variables["by_region"]["shape"] == [2]
+    assert variables["total"]["value"] == "6"
+    assert "df" not in variables
+
+    block = build_kernel_variables_block(executor.get_kernel_variables("s1"))
+    assert "by_region: Series" in block and "total: int = 6" in block
+
+
+def test_sessions_are_isolated(executor, context):
+    executor.execute("x = 1", context)
+    other = ExecutionContext(session_id="s2", filepath=context.filepath, dataframe=context.dataframe)
+    result = executor.execute("print(x)", other)
+    assert not result["success"]
+
+
+def test_cache_hit_restores_variables(executor, context):
+    code = "by_region = df.groupby('region')['price'].sum()"
+    executor.execute(code, context)
+    executor.release_session("s1")
+    assert executor.get_kernel_variables("s1") == []
+
+    hit = executor.execute(code, context)
+    assert hit.get("cached") is True
+    assert executor.execute("print(by_region['west'])", context)["output"].strip() == "2"
+
+
+def test_memory_cap_drops_largest_variables():
+    kernels = SessionKernels(idle_timeout=0, max_memory_mb=1)
+    summary = kernels.save("s", {"big": np.zeros(500_000), "small": 1})
+    assert [v["name"] for v in summary] == ["small"]
+
+
+def test_idle_kernels_are_purged():
+    kernels = SessionKernels(idle_timeout=0.01, max_memory_mb=0)
+    kernels.save("s", {"x": 1})
+    time.sleep(0.02)
+    assert kernels.purge_idle() == ["s"]
+    assert kernels.variables("s") is None
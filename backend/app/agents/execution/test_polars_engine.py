@@ -0,0 +1,40 @@
+#!/usr/bin/env python3
+"""测试 Polars 执行环境"""
+
+import os
+import sys
+# 添加项目根目录到 Python 路径
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '../../..'))
+
+import pandas as pd
+import pytest
+
+pytest.importorskip("polars")
+
+from app.agents.execution import CodeExecutor, ExecutionContext
+
+CODE = 'print(collect(lf.group_by("region").agg(pl.col("price").sum()).sort("region")))'
+
+
+@pytest.fixture
+def executor():
+    executor = CodeExecutor(mode="inline")
+    yield executor
+    executor.shutdown()
+
+
+def test_scan_csv(executor, tmp_path):
+    path = tmp_path / "data.csv"
+    pd.DataFrame({"region": ["east", "west", "east"], "price": [1, 2, 3]}).to_csv(path, index=False)
+    result = executor.execute(CODE, ExecutionContext(filepath=str(path), engine="polars"))
+    assert result["success"], result["output"]
+    assert "east" in result["output"] and "4" in result["output"]
+
+
+def test_non_utf8_csv_uses_dataframe(executor, tmp_path):
+    path = tmp_path / "gbk.csv"
+    pd.DataFrame({"region": ["华东", "华北", "华东"], "price": [1, 2, 3]}).to_csv(path, index=False, encoding="gbk")
+    df = pd.read_csv(path, encoding="gbk")
+    result = executor.execute(CODE, ExecutionContext(filepath=str(path), dataframe=df, engine="polars"))
+    assert result["success"], result["output"]
+    assert "华东" in result["output"]
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""测试代码执行工作进程池"""
+
+import os
+import sys
+import signal
+# 添加项目根目录到 Python 路径
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '../../..'))
+
+import pytest
+
+from app.agents.config import AgentConfig
+from app.agents.execution import CodeExecutor, ExecutionContext, ResultCache
+from app.agents.execution.pool import WorkerPool
+
+
+def _task(code, session_id=None):
+    return {"op": "execute", "code": code, "session_id": session_id}
+
+
+def _pids(pool):
+    return {index: worker.process.pid for index, worker in pool._workers.items()}
+
+
+@pytest.fixture
+def pool():
+    pool = WorkerPool(size=1)
+    yield pool
+    pool.shutdown()
+
+
+def test_timeout_kills_worker_and_respawns(monkeypatch):
+    """执行超过 MAX_CODE_EXECUTION_TIME 时终止工作进程，新进程继续处理后续任务"""
+    monkeypatch.setattr(AgentConfig, "MAX_CODE_EXECUTION_TIME", 1)
+    monkeypatch.setattr(AgentConfig, "CODE_EXECUTION_WORKERS", 1)
+    ResultCache.clear()
+    executor = CodeExecutor(mode="process")
+    try:
+        executor.start()
+        pool = executor._get_pool()
+        stuck = pool._workers[0]
+
+        result = executor.execute("while True:\n    pass", ExecutionContext())
+        assert not result["success"] and "执行超时（超过 1 秒）" in result["output"]
+        assert not stuck.is_alive()
+
+        result = executor.execute("print(1 + 1)", ExecutionContext())
+        assert result["success"] and result["output"].strip() == "2"
+        assert pool._workers[0] is not stuck
+    finally:
+        executor.shutdown()
+
+
+def test_memory_limit_rejects_allocation_and_recycles():
+    """超出 RLIMIT_DATA 的分配在工作进程内失败，进程随后被回收"""
+    pool = WorkerPool(size=1, memory_mb=1024)
+    try:
+        pool.start()
+        before = _pids(pool)
+
+        result = pool.submit(_task("data = bytearray(4 * 1024 ** 3)"), 10)
+        assert not result["success"] and "超出内存限制" in result["output"]
+        assert "memory_error" not in result
+        assert _pids(pool) != before
+
+        assert pool.submit(_task("print('ok')"), 10)["success"]
+    finally:
+        pool.shutdown()
+
+
+def test_worker_recycled_after_max_tasks():
+    """工作进程执行 max_tasks_per_worker 个任务后回收并重新创建"""
+    pool = WorkerPool(size=1, max_tasks_per_worker=2)
+    try:
+        pool.start()
+        first = _pids(pool)
+        assert pool.submit(_task("print(1)"), 10)["success"]
+        assert _pids(pool) == first
+        assert pool.submit(_task("print(2)"), 10)["success"]
+        assert _pids(pool) != first
+        assert pool._workers[0].is_alive() and pool._workers[0].tasks == 0
+    finally:
+        pool.shutdown()
+
+
+def test_session_pin_dropped_when_worker_dies(pool):
+    """会话绑定的工作进程退出后解除绑定，下次任务在新进程中使用新的会话内核"""
+    assert pool.submit(_task("total = 42", "s1"), 10)["success"]
+    assert pool.has_session("s1")
+
+    pinned = pool._workers[pool._session_workers["s1"]]
+    os.kill(pinned.process.pid, signal.SIGKILL)
+    pinned.process.join(5)
+    result = pool.submit(_task("print(total)", "s1"), 10)
+    assert not result["success"] and "异常退出" in result["output"]
+    assert not pool.has_session("s1")
+
+    result = pool.submit(_task("print(total)", "s1"), 10)
+    assert not result["success"] and "total" in result["output"]
+    assert pool.has_session("s1")
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""测试列投影分析"""
+
+import os
+import sys
+# 添加项目根目录到 Python 路径
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '../../..'))
+
+import pandas as pd
+import pytest
+
+from app.agents.execution import CodeExecutor, ExecutionContext
+from app.agents.execution.projection import referenced_columns
+from app.services.file_service import FileService
+
+COLUMNS = ["region", "price", "销售额", "qty", "count"]
+
+
+@pytest.mark.parametrize("code, expected", [
+    ('print(df.groupby("region")["price"].sum())', ["region", "price"]),
+    ('print(df[df["price"] > 3]["销售额"].mean())', ["price", "销售额"]),
+    ("print(df.price.max())", ["price"]),
+    ('print(df.loc[df.qty > 1, ["region"]])', ["region", "qty"]),
+    ('print(df.sort_values("qty").head(3)["region"])', ["region", "qty"]),
+    ('df["x"] = df["price"] * 2\nprint(df["x"].sum())', ["price"]),
+    ("print(len(df))", ["region"]),
+    ('print(df.dropna(subset=["qty"])["price"].sum())', ["price", "qty"]),
+    ('print(len(df.drop_duplicates(["region", "qty"])))', ["region", "qty"]),
+])
+def test_projected_columns(code, expected):
+    assert referenced_columns(code, COLUMNS) == expected
+
+
+@pytest.mark.parametrize("code", [
+    "print(df.describe())",
+    "print(df.count())",
+    'print(df.groupby("region").sum())',
+    "df = df.dropna()\nprint(df.price)",
+    "print(len(df.drop_duplicates()))",
+    'print(df.dropna()["price"].sum())',
+    'print(df.dropna(axis=1, subset=["qty"]).head())',
+    'print(df[df["price"] > 3])',
+    'print(df[["region", "missing"]])',
+    "print(df[",
+])
+def test_falls_back_to_all_columns(code):
+    assert referenced_columns(code, COLUMNS) is None
+
+
+def test_whole_row_methods_keep_all_columns():
+    """未指定 subset 的 dropna / drop_duplicates 按全部列判断，结果与不裁剪列时一致"""
+    df = pd.DataFrame({"a": [1, 1, 2, 3], "b": [1, 2, 3, None], "c": [1, 2, 3, 4]})
+    executor = CodeExecutor(mode="inline")
+    for code, expected in (
+        ("print(len(df.drop_duplicates()))", "4"),
+        ('print(df.dropna()["a"].sum())', "4"),
+    ):
+        assert referenced_columns(code, df.columns.tolist()) is None
+        result = executor.execute(code, ExecutionContext(dataframe=df, columns=df.columns.tolist()))
+        assert result["output"].strip() == expected
+
+
+def test_executor_loads_only_referenced_columns(tmp_path):
+    path = tmp_path / "wide.csv"
+    pd.DataFrame({col: range(5) for col in COLUMNS}).to_csv(path, index=False)
+    FileService.evict_cached_dataframe(str(path))
+
+    projected = FileService.get_projected_dataframe(str(path), ["region", "price"])
+    assert projected.columns.tolist() == ["region", "price"]
+
+    executor = CodeExecutor(mode="inline")
+    df = pd.read_csv(path)
+    result = executor.execute(
+        "print(len(df.columns))",
+        ExecutionContext(filepath=str(path), dataframe=df, columns=COLUMNS)
+    )
+    assert result["output"].strip() == str(len(COLUMNS))
+
+    result = executor.execute(
+        'print(df.groupby("region")["price"].sum().sum())',
+        ExecutionContext(filepath=str(path), dataframe=df, columns=COLUMNS)
+    )
+    assert result["success"] and result["output"].strip() == "10"
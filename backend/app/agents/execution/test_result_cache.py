@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""测试代码执行结果缓存"""
+
+import os
+import sys
+# 添加项目根目录到 Python 路径
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '../../..'))
+
+import pandas as pd
+import pytest
+
+from app.agents.config import AgentConfig
+from app.agents.execution import CodeExecutor, ExecutionContext, ResultCache
+
+
+@pytest.fixture
+def data_file(tmp_path):
+    path = tmp_path / "data.csv"
+    pd.DataFrame({"region": ["east", "west", "east"], "price": [1, 2, 3]}).to_csv(path, index=False)
+    return str(path)
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    ResultCache.clear()
+    yield
+    ResultCache.clear()
+
+
+def test_key_ignores_formatting_and_comments(data_file):
+    key = ResultCache.make_key("print(df.groupby('region')['price'].sum())", data_file)
+    same = ResultCache.make_key("# 按地区汇总\nprint( df.groupby( 'region' )['price'].sum() )\n", data_file)
+    other = ResultCache.make_key("print(df['price'].sum())", data_file)
+    assert key and key == same
+    assert key != other
+
+
+def test_key_changes_with_file_content(data_file):
+    key = ResultCache.make_key("print(df.shape)", data_file)
+    with open(data_file, "a") as f:
+        f.write("north,4\n")
+    os.utime(data_file, (0, 0))
+    assert ResultCache.make_key("print(df.shape)", data_file) != key
+
+
+@pytest.mark.parametrize("code", [
+    "import random\nprint(random.random())",
+    "import numpy as np\nprint(np.random.rand(3))",
+    "from datetime import datetime\nprint(datetime.now())",
+    "print(df.sample(2))",
+    "print(result)",
+    "print(df[",
+])
+def test_uncacheable_code(data_file, code):
+    assert ResultCache.make_key(code, data_file) is None
+
+
+def test_sample_with_random_state_is_cacheable(data_file):
+    assert ResultCache.make_key("print(df.sample(2, random_state=0))", data_file)
+
+
+def test_executor_returns_cached_result(data_file, monkeypatch):
+    monkeypatch.setattr(AgentConfig, "RESULT_CACHE_ENABLED", True)
+    executor = CodeExecutor(mode="inline")
+    context = ExecutionContext(filepath=data_file, dataframe=pd.read_csv(data_file))
+
+    first = executor.execute("total = df['price'].sum()\nprint(total)", context)
+    assert first["success"] and "cached" not in first
+    assert "objects" not in first
+
+    second = executor.execute("total = df['price'].sum()\nprint(total)", context)
+    assert second["cached"] is True
+    assert second["output"] == first["output"]
+
+
+def test_eviction_by_size(monkeypatch):
+    monkeypatch.setattr(AgentConfig, "RESULT_CACHE_MAX_MB", 1)
+    payload = "x" * (600 * 1024)
+    ResultCache.put("a", {"success": True, "output": payload})
+    ResultCache.put("b", {"success": True, "output": payload})
+    assert ResultCache.get("a") is None
+    assert ResultCache.get("b") is not None
@@ -0,0 +1,40 @@
+#!/usr/bin/env python3
+"""测试代码运行环境"""
+
+import os
+import sys
+# 添加项目根目录到 Python 路径
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '../../..'))
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from app.agents.execution import runner
+
+
+@pytest.fixture
+def shared_df():
+    return pd.DataFrame({"region": ["east", "west", None], "price": [1.0, 2.0, 3.0]})
+
+
+def test_mutations_do_not_leak(shared_df):
+    code = "\n".join([
+        "df['price'] = df['price'] * 10",
+        "df.dropna(inplace=True)",
+        "df.loc[0, 'region'] = 'changed'",
+        "df.drop(columns=['region'], inplace=True)",
+        "print(df.shape)",
+    ])
+    result = runner.run_code(code, runner.build_namespace(shared_df))
+    assert result["success"], result["output"]
+    assert result["output"].strip() == "(2, 1)"
+    assert shared_df["price"].tolist() == [1.0, 2.0, 3.0]
+    assert shared_df["region"].tolist()[:2] == ["east", "west"]
+    assert len(shared_df) == 3
+
+
+@pytest.mark.skipif(not runner.COPY_ON_WRITE, reason="写时复制未启用")
+def test_namespace_shares_buffers(shared_df):
+    namespace = runner.build_namespace(shared_df)
+    assert np.shares_memory(namespace["df"]["price"].to_numpy(), shared_df["price"].to_numpy())
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""测试分层抽样与初步结果"""
+
+import os
+import sys
+# 添加项目根目录到 Python 路径
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '../../..'))
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from app.agents.execution import sampling
+from app.agents.execution.cost import estimate_cost
+from app.agents.execution.executor import CodeExecutor, ExecutionContext
+
+
+@pytest.fixture
+def df():
+    rng = np.random.default_rng(1)
+    rows = 20000
+    # 'rare' 只有 3 行，简单随机抽样很可能漏掉
+    region = np.where(np.arange(rows) < 3, "rare", rng.choice(["east", "west", "north"], rows))
+    return pd.DataFrame({
+        "region": region,
+        "price": rng.uniform(1, 100, rows),
+        "qty": rng.integers(1, 10, rows),
+    })
+
+
+def test_group_keys(df):
+    """只识别 df.groupby 中的常量列名"""
+    columns = list(df.columns)
+    assert sampling.group_keys("print(df.groupby('region')['price'].mean())", columns) == ["region"]
+    assert sampling.group_keys("df.groupby(by=['region', 'qty']).size()", columns) == ["region", "qty"]
+    assert sampling.group_keys("key = 'region'\ndf.groupby(key).size()", columns) == []
+    assert sampling.group_keys("df.groupby('missing').size()", columns) == []
+
+
+def test_stratified_sample_keeps_every_stratum(df):
+    """分层抽样保留每一层，样本大小接近目标行数"""
+    sample = sampling.stratified_sample(df, 1000, ["region"])
+    assert set(sample["region"]) == set(df["region"])
+    assert 850 <= len(sample) <= 1150
+    assert sample.index.is_monotonic_increasing
+    assert sampling.stratified_sample(df, len(df)) is df
+
+
+def test_sample_summary_margins(df):
+    """误差随样本增大而减小，样本即全体时为 0"""
+    small = sampling.sample_summary(sampling.stratified_sample(df, 500), len(df))
+    large = sampling.sample_summary(sampling.stratified_sample(df, 5000), len(df))
+    assert 0 < large["margins"]["price"] < small["margins"]["price"]
+    assert sampling.sample_summary(df, len(df))["margins"]["price"] == 0
+
+
+def test_execute_sample(df):
+    """样本执行返回样本信息，分组结果包含全部分组"""
+    executor = CodeExecutor(mode="inline")
+    code = "print(sorted(df.groupby('region')['price'].mean().index))"
+    context = ExecutionContext(dataframe=df)
+    assert executor.supports_sampling(code, context)
+
+    result = executor.execute_sample(code, context, 1000, ["region"])
+    assert result["success"]
+    assert result["output"].strip() == str(sorted(set(df["region"])))
+    assert result["sample"]["total_rows"] == len(df)
+    assert result["sample"]["strata"] == ["region"]
+
+
+def test_estimated_cost_counts_row_loops():
+    """逐行写法的估计耗时远高于向量化写法"""
+    columns = ["region", "price", "qty"]
+    vectorized = estimate_cost("print(df['price'].sum())", columns).seconds(10 ** 6)
+    row_loop = estimate_cost("for _, r in df.iterrows():\n    print(r['price'])", columns).seconds(10 ** 6)
+    assert row_loop > 100 * vectorized
@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""测试 DuckDB SQL 执行引擎"""
+
+import os
+import sys
+# 添加项目根目录到 Python 路径
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '../../..'))
+
+import pandas as pd
+import pytest
+
+pytest.importorskip("duckdb")
+
+from app.agents.execution import CodeExecutor, ExecutionContext, DuckDBEngine
+
+
+@pytest.fixture
+def data_file(tmp_path):
+    path = tmp_path / "data.csv"
+    pd.DataFrame({"region": ["east", "west", "east"], "销售额": [1, 2, 3]}).to_csv(path, index=False)
+    return str(path)
+
+
+@pytest.fixture
+def engine():
+    engine = DuckDBEngine(max_sessions=2)
+    yield engine
+    engine.shutdown()
+
+
+def test_query_csv(engine, data_file):
+    result = engine.execute(
+        'SELECT region, SUM("销售额") AS total FROM data GROUP BY region ORDER BY region',
+        "s1", data_file
+    )
+    assert result["success"], result["output"]
+    assert "east" in result["output"] and "4" in result["output"]
+
+
+def test_non_utf8_csv_falls_back_to_dataframe(engine, tmp_path):
+    path = tmp_path / "gbk.csv"
+    pd.DataFrame({"地区": ["华东", "华北"], "数量": [1, 2]}).to_csv(path, index=False, encoding="gbk")
+    df = pd.read_csv(path, encoding="gbk")
+    result = engine.execute('SELECT SUM("数量") AS n FROM data', "s1", str(path), df)
+    assert result["success"], result["output"]
+    assert "3" in result["output"]
+
+
+@pytest.mark.parametrize("sql", [
+    "CREATE TABLE t AS SELECT 1",
+    "COPY data TO '/tmp/out.csv'",
+    "SELECT * FROM read_csv_auto('/etc/passwd')",
+])
+def test_rejects_writes_and_external_files(engine, data_file, sql):
+    result = engine.execute(sql, "s1", data_file)
+    assert not result["success"]
+
+
+def test_executor_marks_sql_results(data_file):
+    executor = CodeExecutor(mode="inline")
+    result = executor.execute("SELECT COUNT(*) AS n FROM data", ExecutionContext("s1", data_file), "sql")
+    assert result["language"] == "sql"
+    assert result["success"], result["output"]
+    executor.shutdown()
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""测试向量化改写"""
+
+import os
+import sys
+# 添加项目根目录到 Python 路径
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '../../..'))
+
+import pandas as pd
+import pytest
+
+from app.agents.execution import vectorize as vec
+from app.agents.execution.executor import CodeExecutor, ExecutionContext
+from app.agents.execution.runner import build_namespace, run_code
+
+
+@pytest.fixture
+def df():
+    return pd.DataFrame({
+        "region": ["east", "west", "north", "east", "south"],
+        "price": [1.5, 2.0, 7.5, 4.0, 10.0],
+        "qty": [3, 1, 2, 5, 4],
+    })
+
+
+@pytest.mark.parametrize("code, expected", [
+    ("print(df['price'].apply(lambda x: x * 2 + 1))", "df['price'] * 2 + 1"),
+    ("print(df['price'].apply(lambda x: x > 2 and not x > 8))", "(df['price'] > 2) & ~(df['price'] > 8)"),
+    ("print(df[df['region'].apply(lambda x: x in ['east', 'west'])])", "df['region'].isin(['east', 'west'])"),
+    ("print(df[df['region'].apply(lambda x: x not in ('east',))])", "~df['region'].isin(('east',))"),
+    ("m = {'east': 1, 'west': 2}\nprint(df['region'].apply(m.get))", "df['region'].map(m)"),
+    ("m = {'east': 1, 'west': 2}\nprint(df['region'].apply(lambda x: m.get(x)))", "df['region'].map(m)"),
+    ("print(df.apply(lambda row: row['price'] * row['qty'], axis=1))", "df['price'] * df['qty']"),
+    ("print(df.apply(lambda r: 'high' if r['price'] > 3 else 'low', axis=1))", "_np.where(df['price'] > 3, 'high', 'low')"),
+    ("print(df['price'].apply(lambda x: 1 if x > 3 else 0).sum())", "_np.where(df['price'] > 3, 1, 0)"),
+])
+def test_rewrites_produce_identical_output(df, code, expected):
+    """改写后的代码与原代码输出一致"""
+    result = vec.vectorize(code)
+    assert result.changed
+    assert expected in result.code
+    assert "apply" not in result.code
+
+    original = run_code(code, build_namespace(df))
+    rewritten = run_code(result.code, build_namespace(df))
+    assert original["success"] and rewritten["success"]
+    assert rewritten["output"] == original["output"]
+
+
+@pytest.mark.parametrize("code", [
+    "print(df['region'].apply(lambda x: x.upper()))",
+    "print(df.apply(lambda row: row.sum(), axis=1))",
+    "print(df['price'].apply(lambda x: 1 < x < 5))",
+    "print(df.apply(lambda col: col.max()))",
+    "print(df['price'].apply(lambda x: 3))",
+])
+def test_unsupported_patterns_are_kept(code):
+    """无法确定等价的写法保持不变"""
+    assert not vec.vectorize(code).changed
+
+
+def test_performance_hints():
+    """无法改写的逐行写法给出对应提示"""
+    code = (
+        "rows = []\n"
+        "for _, row in df.iterrows():\n"
+        "    rows.append(row['price'])\n"
+        "for r in df['region'].unique():\n"
+        "    print(r, df[df['region'] == r]['price'].sum())\n"
+        "for i in range(len(df)):\n"
+        "    print(df.iloc[i]['qty'])\n"
+        "print(df['region'].apply(lambda x: x.upper()))\n"
+    )
+    assert set(vec.performance_hints(code)) == {
+        vec.HINT_ITERROWS, vec.HINT_LOOP_FILTER, vec.HINT_INDEX_LOOP, vec.HINT_ELEMENT_APPLY
+    }
+    assert vec.performance_hints("print(df.groupby('region')['price'].sum())") == []
+
+
+def test_executor_uses_verified_rewrite(df):
+    """样本验证通过时执行改写后的代码，原代码仍作为结果中的代码"""
+    executor = CodeExecutor(mode="inline")
+    code = "print(df.apply(lambda row: row['price'] * row['qty'], axis=1).sum())"
+    result = executor.execute(code, ExecutionContext(dataframe=df))
+
+    assert result["success"]
+    assert result["code"] == code
+    assert result["rewrites"] == ["apply(lambda row: ..., axis=1) → 列运算"]
+    assert float(result["output"]) == pytest.approx((df["price"] * df["qty"]).sum())
+    assert "hints" not in result
+
+
+def test_executor_rejects_rewrite_with_different_output(df):
+    """改写后的代码在样本上报错或输出不一致时执行原代码，并给出性能提示"""
+    executor = CodeExecutor(mode="inline")
+    # Python 整数可以取负整数次幂，整数列整体运算时报错
+    code = "print(df['qty'].apply(lambda x: x ** -1).round(2).tolist())"
+    result = executor.execute(code, ExecutionContext(dataframe=df))
+
+    assert result["success"]
+    assert result["output"].strip() == "[0.33, 1.0, 0.5, 0.2, 0.25]"
+    assert "rewrites" not in result
+    assert result["hints"] == [vec.HINT_ELEMENT_APPLY]
@@ -0,0 +1,335 @@
+"""生成代码的向量化改写
+
+模型生成的 pandas 代码经常逐行计算，数据量大时比向量化写法慢几个数量级。
+这里把能确定等价的写法改写为向量化形式：
+
+- s.apply(lambda x: 算术/比较表达式) → 对整列运算
+- s.apply(lambda x: x in [...]) → s.isin([...])
+- s.apply(lambda x: d[x]) / s.apply(lambda x: d.get(x)) / s.apply(d.get) → s.map(d)
+- df.apply(lambda row: 基于 row["列"] 的表达式, axis=1) → 列运算
+- 条件表达式 A if 条件 else B → np.where(条件, A, B)
+
+改写后的代码由执行方在样本数据上与原代码比较输出，一致时才使用。
+无法改写的逐行写法（iterrows 循环、循环内按值筛选等）生成性能提示，重试时提供给模型。
+"""
+import ast
+from dataclasses import dataclass, field
+from typing import Callable, List, Optional
+
+# 改写后代码中 numpy 的别名（下划线开头，不会保存到会话内核）
+NUMPY_ALIAS = "_np"
+
+HINT_ITERROWS = "避免用 iterrows()/itertuples() 逐行循环，改用整列的向量化运算、groupby 或 merge"
+HINT_LOOP_FILTER = "避免在循环中反复用 df[df[列] == 值] 筛选，改用 groupby(列) 一次完成分组计算"
+HINT_ROW_APPLY = "避免 apply(..., axis=1) 逐行计算，改用列运算、np.where 或 Series.map"
+HINT_ELEMENT_APPLY = "避免 apply(lambda ...) 逐元素计算，改用向量化运算、Series.map、isin 或 .str/.dt 访问器"
+HINT_INDEX_LOOP = "避免 for i in range(len(df)) 配合 iloc/loc 逐行访问，改用向量化运算"
+
+_ARITHMETIC_OPS = (ast.Add, ast.Sub, ast.Mult, ast.Div, ast.FloorDiv, ast.Mod, ast.Pow)
+_COMPARE_OPS = (ast.Eq, ast.NotEq, ast.Lt, ast.LtE, ast.Gt, ast.GtE)
+
+
+@dataclass
+class VectorizeResult:
+    """改写结果"""
+    # 改写后的代码（没有改写时与原代码相同）
+    code: str
+    # 已应用的改写说明
+    rewrites: List[str] = field(default_factory=list)
+
+    @property
+    def changed(self) -> bool:
+        return bool(self.rewrites)
+
+
+def _contains_call(node: ast.AST) -> bool:
+    return any(isinstance(child, ast.Call) for child in ast.walk(node))
+
+
+def _name(identifier: str) -> ast.Name:
+    return ast.Name(id=identifier, ctx=ast.Load())
+
+
+def _column(receiver: ast.AST, column: ast.Constant) -> ast.Subscript:
+    return ast.Subscript(value=receiver, slice=ast.Constant(column.value), ctx=ast.Load())
+
+
+class _ElementwiseConverter:
+    """把作用于单个元素（或单行）的 lambda 表达式转换为作用于整列的表达式
+
+    只接受算术、比较、逻辑运算和条件表达式；param_replacer 负责把对参数的引用
+    替换为整列，返回 None 表示该引用方式无法向量化。
+    """
+
+    def __init__(self, param: str, param_replacer: Callable[[ast.AST], Optional[ast.AST]]):
+        self.param = param
+        self.param_replacer = param_replacer
+        self.uses_param = False
+        self.uses_numpy = False
+
+    def convert(self, node: ast.AST) -> Optional[ast.AST]:
+        replaced = self.param_replacer(node)
+        if replaced is not None:
+            self.uses_param = True
+            return replaced
+
+        if isinstance(node, ast.Constant) and isinstance(node.value, (int, float, str, bool)):
+            return node
+        if isinstance(node, ast.Name):
+            # 引用参数本身但无法替换时放弃；其他名称视为标量
+            return None if node.id == self.param else node
+        if isinstance(node, ast.Attribute) and isinstance(node.value, ast.Name) and node.value.id != self.param:
+            return node
+
+        if isinstance(node, ast.BinOp) and isinstance(node.op, _ARITHMETIC_OPS):
+            left, right = self.convert(node.left), self.convert(node.right)
+            if left is None or right is None:
+                return None
+            return ast.BinOp(left=left, op=node.op, right=right)
+
+        if isinstance(node, ast.UnaryOp):
+            operand = self.convert(node.operand)
+            if operand is None:
+                return None
+            if isinstance(node.op, (ast.USub, ast.UAdd)):
+                return ast.UnaryOp(op=node.op, operand=operand)
+            if isinstance(node.op, ast.Not) and self._is_boolean(node.operand):
+                return ast.UnaryOp(op=ast.Invert(), operand=operand)
+            return None
+
+        if isinstance(node, ast.Compare) and len(node.ops) == 1 and isinstance(node.ops[0], _COMPARE_OPS):
+            left, right = self.convert(node.left), self.convert(node.comparators[0])
+            if left is None or right is None:
+                return None
+            return ast.Compare(left=left, ops=node.ops, comparators=[right])
+
+        if isinstance(node, ast.BoolOp) and all(self._is_boolean(value) for value in node.values):
+            values = [self.convert(value) for value in node.values]
+            if any(value is None for value in values):
+                return None
+            op = ast.BitAnd() if isinstance(node.op, ast.And) else ast.BitOr()
+            result = values[0]
+            for value in values[1:]:
+                result = ast.BinOp(left=result, op=op, right=value)
+            return result
+
+        if isinstance(node, ast.IfExp):
+            test, body, orelse = self.convert(node.test), self.convert(node.body), self.convert(node.orelse)
+            if test is None or body is None or orelse is None:
+                return None
+            self.uses_numpy = True
+            return ast.Call(
+                func=ast.Attribute(value=_name(NUMPY_ALIAS), attr="where", ctx=ast.Load()),
+                args=[test, body, orelse],
+                keywords=[]
+            )
+
+        return None
+
+    @staticmethod
+    def _is_boolean(node: ast.AST) -> bool:
+        """逻辑运算的操作数必须本身是布尔表达式，& / | 才与 and / or 等价"""
+        if isinstance(node, ast.Compare):
+            return True
+        if isinstance(node, ast.BoolOp):
+            return all(_ElementwiseConverter._is_boolean(value) for value in node.values)
+        if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.Not):
+            return _ElementwiseConverter._is_boolean(node.operand)
+        return False
+
+
+def _wrap_series(expression: ast.AST, receiver: ast.AST, keep_name: bool) -> ast.AST:
+    """np.where 返回数组，包装为与 apply 结果相同索引的 Series"""
+    keywords = [ast.keyword(arg="index", value=ast.Attribute(value=receiver, attr="index", ctx=ast.Load()))]
+    if keep_name:
+        keywords.append(ast.keyword(arg="name", value=ast.Attribute(value=receiver, attr="name", ctx=ast.Load())))
+    return ast.Call(
+        func=ast.Attribute(value=_name("pd"), attr="Series", ctx=ast.Load()),
+        args=[expression],
+        keywords=keywords
+    )
+
+
+class _Rewriter(ast.NodeTransformer):
+    def __init__(self):
+        self.rewrites: List[str] = []
+        self.uses_numpy = False
+
+    def visit_Call(self, node: ast.Call) -> ast.AST:
+        self.generic_visit(node)
+        if not (isinstance(node.func, ast.Attribute) and node.func.attr == "apply" and len(node.args) == 1):
+            return node
+        receiver = node.func.value
+        # 接收者会在改写后的表达式中出现多次，只接受没有函数调用的简单表达式
+        if _contains_call(receiver):
+            return node
+
+        keywords = {keyword.arg: keyword.value for keyword in node.keywords}
+        axis = keywords.pop("axis", None)
+        if keywords:
+            return node
+
+        func = node.args[0]
+        if axis is not None:
+            if isinstance(axis, ast.Constant) and axis.value in (1, "columns"):
+                return self._rewrite_row_apply(node, receiver, func)
+            return node
+        return self._rewrite_element_apply(node, receiver, func)
+
+    def _single_param_lambda(self, func: ast.AST) -> Optional[str]:
+        if not isinstance(func, ast.Lambda):
+            return None
+        args = func.args
+        if args.posonlyargs or args.kwonlyargs or args.vararg or args.kwarg or args.defaults or len(args.args) != 1:
+            return None
+        return args.args[0].arg
+
+    def _rewrite_element_apply(self, node: ast.Call, receiver: ast.AST, func: ast.AST) -> ast.AST:
+        # s.apply(d.get) → s.map(d)
+        if (isinstance(func, ast.Attribute) and func.attr == "get" and isinstance(func.value, ast.Name)):
+            return self._to_map(receiver, func.value)
+
+        param = self._single_param_lambda(func)
+        if param is None:
+            return node
+        body = func.body
+
+        # lambda x: d[x] / lambda x: d.get(x) → s.map(d)
+        if (isinstance(body, ast.Subscript) and isinstance(body.value, ast.Name)
+                and isinstance(body.slice, ast.Name) and body.slice.id == param and body.value.id != param):
+            return self._to_map(receiver, body.value)
+        if (isinstance(body, ast.Call) and isinstance(body.func, ast.Attribute) and body.func.attr == "get"
+                and isinstance(body.func.value, ast.Name) and body.func.value.id != param
+                and len(body.args) == 1 and not body.keywords
+                and isinstance(body.args[0], ast.Name) and body.args[0].id == param):
+            return self._to_map(receiver, body.func.value)
+
+        # lambda x: x in [...] → s.isin([...])
+        if (isinstance(body, ast.Compare) and len(body.ops) == 1 and isinstance(body.ops[0], (ast.In, ast.NotIn))
+                and isinstance(body.left, ast.Name) and body.left.id == param
+                and not any(isinstance(n, ast.Name) and n.id == param for n in ast.walk(body.comparators[0]))):
+            isin = ast.Call(
+                func=ast.Attribute(value=receiver, attr="isin", ctx=ast.Load()),
+                args=[body.comparators[0]],
+                keywords=[]
+            )
+            self.rewrites.append("apply(lambda x: x in ...) → isin")
+            return ast.UnaryOp(op=ast.Invert(), operand=isin) if isinstance(body.ops[0], ast.NotIn) else isin
+
+        converter = _ElementwiseConverter(
+            param,
+            lambda n: receiver if isinstance(n, ast.Name) and n.id == param else None
+        )
+        expression = converter.convert(body)
+        if expression is None or not converter.uses_param:
+            return node
+        if converter.uses_numpy:
+            self.uses_numpy = True
+            expression = _wrap_series(expression, receiver, keep_name=True)
+        self.rewrites.append("apply(lambda x: ...) → 整列运算")
+        return expression
+
+    def _rewrite_row_apply(self, node: ast.Call, receiver: ast.AST, func: ast.AST) -> ast.AST:
+        param = self._single_param_lambda(func)
+        if param is None:
+            return node
+
+        def replace_row_access(n: ast.AST) -> Optional[ast.AST]:
+            # row["列"] → df["列"]
+            if (isinstance(n, ast.Subscript) and isinstance(n.value, ast.Name) and n.value.id == param
+                    and isinstance(n.slice, ast.Constant) and isinstance(n.slice.value, str)):
+                return _column(receiver, n.slice)
+            return None
+
+        converter = _ElementwiseConverter(param, replace_row_access)
+        expression = converter.convert(func.body)
+        if expression is None or not converter.uses_param:
+            return node
+        if converter.uses_numpy:
+            self.uses_numpy = True
+            expression = _wrap_series(expression, receiver, keep_name=False)
+        self.rewrites.append("apply(lambda row: ..., axis=1) → 列运算")
+        return expression
+
+    def _to_map(self, receiver: ast.AST, mapping: ast.Name) -> ast.AST:
+        self.rewrites.append("apply(字典查找) → map")
+        return ast.Call(
+            func=ast.Attribute(value=receiver, attr="map", ctx=ast.Load()),
+            args=[_name(mapping.id)],
+            keywords=[]
+        )
+
+
+def vectorize(code: str) -> VectorizeResult:
+    """
+    把代码中可以确定等价的逐行写法改写为向量化写法
+
+    Returns:
+        改写结果；无法解析或没有可改写的写法时 code 为原代码
+    """
+    try:
+        tree = ast.parse(code)
+    except SyntaxError:
+        return VectorizeResult(code=code)
+
+    rewriter = _Rewriter()
+    tree = rewriter.visit(tree)
+    if not rewriter.rewrites:
+        return VectorizeResult(code=code)
+
+    if rewriter.uses_numpy:
+        tree.body.insert(0, ast.Import(names=[ast.alias(name="numpy", asname=NUMPY_ALIAS)]))
+    ast.fix_missing_locations(tree)
+    return VectorizeResult(code=ast.unparse(tree), rewrites=rewriter.rewrites)
+
+
+def _uses_name(node: ast.AST, name: str) -> bool:
+    return any(isinstance(child, ast.Name) and child.id == name for child in ast.walk(node))
+
+
+def performance_hints(code: str) -> List[str]:
+    """
+    检查代码中无法自动改写的逐行写法
+
+    Returns:
+        性能提示（去重，按发现顺序）
+    """
+    try:
+        tree = ast.parse(code)
+    except SyntaxError:
+        return []
+
+    hints: List[str] = []
+
+    def add(hint: str) -> None:
+        if hint not in hints:
+            hints.append(hint)
+
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute):
+            if node.func.attr in ("iterrows", "itertuples"):
+                add(HINT_ITERROWS)
+            elif node.func.attr == "apply":
+                axis = next((k.value for k in node.keywords if k.arg == "axis"), None)
+                if isinstance(axis, ast.Constant) and axis.value in (1, "columns"):
+                    add(HINT_ROW_APPLY)
+                elif node.args and isinstance(node.args[0], ast.Lambda):
+                    add(HINT_ELEMENT_APPLY)
+
+        elif isinstance(node, ast.For):
+            targets = [n.id for n in ast.walk(node.target) if isinstance(n, ast.Name)]
+            iterator = node.iter
+            if (isinstance(iterator, ast.Call) and isinstance(iterator.func, ast.Name) and iterator.func.id == "range"
+                    and any(isinstance(n, ast.Call) and isinstance(n.func, ast.Name) and n.func.id == "len"
+                            for n in ast.walk(iterator))):
+                if any(isinstance(n, ast.Attribute) and n.attr in ("iloc", "loc", "at", "iat")
+                       for statement in node.body for n in ast.walk(statement)):
+                    add(HINT_INDEX_LOOP)
+            for statement in node.body:
+                for child in ast.walk(statement):
+                    # 循环体内以循环变量为条件的布尔筛选
+                    if (isinstance(child, ast.Subscript) and isinstance(child.slice, ast.Compare)
+                            and any(_uses_name(child.slice, target) for target in targets)):
+                        add(HINT_LOOP_FILTER)
+
+    return hints
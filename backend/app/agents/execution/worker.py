@@ -0,0 +1,150 @@
+"""代码执行工作进程
+
+工作进程由进程池预先创建，启动时已导入 pandas，并在进程内缓存会话数据和会话内核，
+主进程通过管道发送任务并等待结果。
+"""
+import os
+import resource
+from typing import Dict, Any
+from app.agents.config import AgentConfig
+from app.agents.execution.kernel import SessionKernels
+from app.agents.execution.runner import (
+    build_namespace, build_polars_namespace, run_code, verify_rewrite, load_profile
+)
+from app.agents.execution.sampling import stratified_sample, sample_summary
+from app.services.file_service import FileService
+
+# 本进程中的会话内核（进程池保证同一会话总是分配到同一进程）
+_kernels = SessionKernels(AgentConfig.KERNEL_IDLE_TIMEOUT, AgentConfig.KERNEL_MAX_MEMORY_MB)
+
+
+def _apply_memory_limit(memory_mb: int) -> None:
+    """限制工作进程可用内存（0 表示不限制）"""
+    if memory_mb <= 0:
+        return
+    limit = memory_mb * 1024 * 1024
+    # RLIMIT_DATA 不统计线程栈等仅保留未使用的地址空间，比 RLIMIT_AS 更贴近实际占用
+    which = getattr(resource, "RLIMIT_DATA", resource.RLIMIT_AS)
+    _, hard = resource.getrlimit(which)
+    if hard != resource.RLIM_INFINITY:
+        limit = min(limit, hard)
+    resource.setrlimit(which, (limit, hard))
+
+
+def _apply_cpu_limit(cpu_seconds: int) -> None:
+    """限制本次任务可用的 CPU 时间，超出时进程收到 SIGXCPU 并退出"""
+    if cpu_seconds <= 0:
+        return
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    used = int(usage.ru_utime + usage.ru_stime) + 1
+    _, hard = resource.getrlimit(resource.RLIMIT_CPU)
+    soft = used + cpu_seconds
+    if hard != resource.RLIM_INFINITY:
+        soft = min(soft, hard)
+    resource.setrlimit(resource.RLIMIT_CPU, (soft, hard))
+
+
+def current_rss_mb() -> float:
+    """获取当前进程常驻内存（MB）"""
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError, IndexError):
+        # 非 Linux 平台退化为峰值常驻内存
+        maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return maxrss / 1024 if os.uname().sysname != "Darwin" else maxrss / (1024 * 1024)
+
+
+def handle_task(task: Dict[str, Any]) -> Dict[str, Any]:
+    """处理一个任务"""
+    op = task.get("op")
+
+    if op == "preload":
+        FileService.get_cached_dataframe(task["filepath"])
+        return {"success": True, "output": ""}
+
+    if op == "execute":
+        _apply_cpu_limit(task.get("cpu_seconds", 0))
+        filepath = task.get("filepath")
+        if task.get("engine") == "polars":
+            namespace = build_polars_namespace(filepath)
+        else:
+            columns = task.get("columns")
+            if filepath and columns:
+                df = FileService.get_projected_dataframe(filepath, columns)
+            else:
+                df = FileService.get_cached_dataframe(filepath) if filepath else None
+            profile = load_profile(task["code"], filepath, df)
+            sample = task.get("sample")
+            if sample and df is not None:
+                # 初步结果：在分层样本上独立执行，不使用会话内核
+                sampled = stratified_sample(df, sample["rows"], sample.get("strata"), sample.get("seed", 0))
+                result = run_code(task["code"], build_namespace(sampled, profile))
+                result["sample"] = sample_summary(sampled, len(df), sample.get("strata"))
+                return result
+            namespace = build_namespace(df, profile)
+
+        # 向量化改写在样本上验证通过后才执行改写后的代码
+        code, vectorized = task["code"], False
+        rewritten = task.get("rewritten_code")
+        if rewritten and verify_rewrite(
+            code, rewritten, namespace.get("df"), task.get("verify_rows", 0), namespace.get("profile")
+        ):
+            code, vectorized = rewritten, True
+
+        session_id = task.get("session_id")
+        if session_id:
+            namespace = _kernels.namespace(session_id, namespace)
+        result = run_code(code, namespace, task.get("max_object_bytes", 0))
+        result["vectorized"] = vectorized
+        if session_id:
+            result["variables"] = _kernels.save(session_id, namespace)
+        return result
+
+    if op == "inject":
+        variables = _kernels.inject(task["session_id"], task.get("objects", {}))
+        return {"success": True, "output": "", "variables": variables}
+
+    if op == "drop_kernel":
+        _kernels.drop(task["session_id"])
+        return {"success": True, "output": ""}
+
+    return {"success": False, "output": f"未知的任务类型: {op}"}
+
+
+def worker_main(conn, memory_mb: int) -> None:
+    """
+    工作进程入口
+
+    Args:
+        conn: 与主进程通信的管道
+        memory_mb: 内存上限（MB）
+    """
+    _apply_memory_limit(memory_mb)
+
+    while True:
+        try:
+            task = conn.recv()
+        except (EOFError, KeyboardInterrupt):
+            break
+
+        if task.get("op") == "shutdown":
+            break
+
+        _kernels.purge_idle()
+
+        try:
+            result = handle_task(task)
+        except MemoryError:
+            result = {"success": False, "output": "执行错误：超出内存限制", "memory_error": True}
+        except Exception as e:
+            result = {"success": False, "output": f"执行错误：{str(e)}"}
+
+        result["rss_mb"] = current_rss_mb()
+        try:
+            conn.send(result)
+        except (BrokenPipeError, EOFError):
+            break
+
+    conn.close()
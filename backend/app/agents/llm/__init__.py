@@ -7,7 +7,9 @@ LLM 模块 - 提供可替换的 LLM 接口
 - LLMProvider: 抽象基类，定义 LLM 提供商接口
 - LLMFactory: 工厂类，用于创建 LLM 实例
 - LLMMessage, LLMResponse: 消息和响应的数据类
+- ToolCall: 模型发起的工具调用
 - MessageRole: 消息角色枚举
+- LLMUsageTracker: 用量统计（含提示词缓存命中）
 - 各种具体的 LLM 提供商实现
 """
 
@@ -16,7 +18,8 @@ from .llm_interface import (
     LLMProvider,
     LLMMessage,
     LLMResponse,
-    MessageRole
+    MessageRole,
+    ToolCall
 )
 
 # 导入具体实现
@@ -24,12 +27,17 @@ from .llm_providers import (
     OpenAIProvider,
     MockLLMProvider,
     ClaudeProvider,
-    LocalLLMProvider
+    LocalLLMProvider,
+    ReplayLLMProvider,
+    LatencyModel
 )
 
 # 导入工厂类
 from .llm_factory import LLMFactory
 
+# 导入用量统计
+from .usage_tracker import LLMUsageTracker, usage_tracker
+
 # 定义公开的 API
 __all__ = [
     # 核心接口
@@ -37,15 +45,22 @@ __all__ = [
     'LLMMessage',
     'LLMResponse',
     'MessageRole',
+    'ToolCall',
     
     # 具体实现
     'OpenAIProvider',
     'MockLLMProvider',
     'ClaudeProvider',
     'LocalLLMProvider',
+    'ReplayLLMProvider',
+    'LatencyModel',
     
     # 工厂类
-    'LLMFactory'
+    'LLMFactory',
+    
+    # 用量统计
+    'LLMUsageTracker',
+    'usage_tracker'
 ]
 
 # 版本信息
@@ -7,6 +7,8 @@ from .llm_providers import (
     MockLLMProvider,
     ClaudeProvider,
     LocalLLMProvider,
+    ReplayLLMProvider,
+    LatencyModel,
 )
 from app.core.logging_config import get_agent_logger
 
@@ -22,6 +24,7 @@ class LLMFactory:
         "claude": ClaudeProvider,
         "local": LocalLLMProvider,
         "mock": MockLLMProvider,
+        "replay": ReplayLLMProvider,
     }
 
     @classmethod
@@ -37,7 +40,7 @@ class LLMFactory:
         创建 LLM 提供商实例
 
         Args:
-            provider: 提供商名称 (openai, claude, local, mock)
+            provider: 提供商名称 (openai, claude, local, mock, replay)
             model: 模型名称，如果为 None 则使用默认模型
             temperature: 温度参数
             fallback_to_mock: 当主要提供商不可用时是否降级到模拟提供商
@@ -102,6 +105,7 @@ class LLMFactory:
             "claude": "claude-3-sonnet",
             "local": "local",
             "mock": "mock",
+            "replay": "replay",
         }
         return defaults.get(provider, "gpt-4")
 
@@ -158,6 +162,9 @@ class LLMFactory:
             api_key = getattr(config, "OPENAI_API_KEY", None)
             if api_key:
                 provider_config["api_key"] = api_key
+            provider_config["prompt_cache_hints"] = getattr(
+                config, "LLM_PROMPT_CACHE_HINTS", True
+            )
         elif provider == "claude":
             api_key = getattr(config, "ANTHROPIC_API_KEY", None)
             if api_key:
@@ -166,6 +173,22 @@ class LLMFactory:
             endpoint = getattr(config, "LOCAL_LLM_ENDPOINT", None)
             if endpoint:
                 provider_config["endpoint"] = endpoint
+        elif provider == "replay":
+            provider_config["fixture_path"] = getattr(
+                config, "REPLAY_FIXTURE_PATH", None
+            )
+            provider_config["mode"] = getattr(config, "REPLAY_MODE", None)
+            provider_config["record_provider"] = getattr(
+                config, "REPLAY_RECORD_PROVIDER", None
+            )
+            provider_config["record_model"] = model
+            provider_config["latency"] = LatencyModel(
+                ttft_ms=getattr(config, "REPLAY_TTFT_MS", 0.0),
+                ttft_jitter_ms=getattr(config, "REPLAY_TTFT_JITTER_MS", 0.0),
+                distribution=getattr(config, "REPLAY_LATENCY_DISTRIBUTION", "fixed"),
+                tokens_per_second=getattr(config, "REPLAY_TOKENS_PER_SECOND", 0.0),
+                seed=getattr(config, "REPLAY_SEED", 0),
+            )
 
         return cls.create_llm(
             provider=provider,
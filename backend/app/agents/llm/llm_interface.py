@@ -1,8 +1,8 @@
 """LLM 接口抽象层"""
 
 from abc import ABC, abstractmethod
-from typing import List, Dict, Any, Optional
-from dataclasses import dataclass
+from typing import List, Dict, Any, Iterator, Optional
+from dataclasses import dataclass, field
 from enum import Enum
 
 
@@ -12,6 +12,20 @@ class MessageRole(Enum):
     SYSTEM = "system"
     USER = "user"
     ASSISTANT = "assistant"
+    TOOL = "tool"
+
+
+@dataclass
+class ToolCall:
+    """模型发起的工具调用"""
+
+    id: str
+    name: str
+    arguments: Dict[str, Any] = field(default_factory=dict)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """转换为字典格式"""
+        return {"id": self.id, "name": self.name, "arguments": self.arguments}
 
 
 @dataclass
@@ -20,10 +34,21 @@ class LLMMessage:
 
     role: MessageRole
     content: str
-
-    def to_dict(self) -> Dict[str, str]:
+    # 标记可缓存前缀的末尾，提供商据此发出提示词缓存提示
+    cache_hint: bool = False
+    # 助手消息中的工具调用
+    tool_calls: Optional[List[ToolCall]] = None
+    # 工具消息对应的调用ID
+    tool_call_id: Optional[str] = None
+
+    def to_dict(self) -> Dict[str, Any]:
         """转换为字典格式"""
-        return {"role": self.role.value, "content": self.content}
+        data = {"role": self.role.value, "content": self.content}
+        if self.tool_calls:
+            data["tool_calls"] = [call.to_dict() for call in self.tool_calls]
+        if self.tool_call_id:
+            data["tool_call_id"] = self.tool_call_id
+        return data
 
 
 @dataclass
@@ -33,12 +58,40 @@ class LLMResponse:
     content: str
     model: Optional[str] = None
     usage: Optional[Dict[str, Any]] = None
+    # 模型请求的工具调用，为空表示模型直接给出了回答
+    tool_calls: List[ToolCall] = field(default_factory=list)
 
     @property
     def text(self) -> str:
         """获取响应文本内容"""
         return self.content
 
+    @property
+    def input_tokens(self) -> int:
+        """获取输入 token 数"""
+        if not self.usage:
+            return 0
+        return int(self.usage.get("input_tokens") or self.usage.get("prompt_tokens") or 0)
+
+    @property
+    def output_tokens(self) -> int:
+        """获取输出 token 数"""
+        if not self.usage:
+            return 0
+        return int(
+            self.usage.get("output_tokens") or self.usage.get("completion_tokens") or 0
+        )
+
+    @property
+    def cached_tokens(self) -> int:
+        """获取命中提示词缓存的输入 token 数"""
+        if not self.usage:
+            return 0
+        if self.usage.get("cached_tokens") is not None:
+            return int(self.usage["cached_tokens"])
+        details = self.usage.get("input_token_details") or {}
+        return int(details.get("cache_read") or 0)
+
 
 class LLMProvider(ABC):
     """LLM 提供商抽象基类"""
@@ -64,6 +117,37 @@ class LLMProvider(ABC):
         """
         pass
 
+    def stream(self, messages: List[LLMMessage]) -> Iterator[str]:
+        """
+        流式调用 LLM，逐段返回生成的文本
+
+        默认实现调用 invoke 并一次性返回全部内容，支持流式输出的提供商应覆盖此方法。
+
+        Args:
+            messages: 消息列表
+
+        Yields:
+            文本增量
+        """
+        yield self.invoke(messages).content
+
+    def invoke_with_tools(
+        self, messages: List[LLMMessage], tools: List[Dict[str, Any]]
+    ) -> LLMResponse:
+        """
+        调用 LLM 并允许其发起工具调用
+
+        默认实现忽略工具直接调用 invoke，支持工具调用的提供商应覆盖此方法。
+
+        Args:
+            messages: 消息列表（可包含助手的工具调用消息和工具结果消息）
+            tools: OpenAI function calling 格式的工具定义
+
+        Returns:
+            LLM 响应，tool_calls 不为空时需要执行工具并把结果返回给模型
+        """
+        return self.invoke(messages)
+
     @abstractmethod
     def is_available(self) -> bool:
         """
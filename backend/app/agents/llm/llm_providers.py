@@ -1,18 +1,28 @@
 """LLM 提供商具体实现"""
 
 import os
-from typing import List, Optional
+import json
+import math
+import time
+import random
+import hashlib
+import threading
+from dataclasses import dataclass
+from typing import List, Optional, Dict, Any, Iterator
 from langchain_openai import ChatOpenAI
 from langchain.schema import HumanMessage, SystemMessage, AIMessage
+from langchain_core.messages import ToolMessage
 from .llm_interface import (
     LLMProvider,
     LLMMessage,
     LLMResponse,
     MessageRole,
+    ToolCall,
     LLMError,
     LLMUnavailableError,
     LLMAPIError,
 )
+from .usage_tracker import usage_tracker
 from app.core.logging_config import get_agent_logger
 
 logger = get_agent_logger("llm_providers")
@@ -26,10 +36,12 @@ class OpenAIProvider(LLMProvider):
         model: str = "gpt-4",
         temperature: float = 0.0,
         api_key: Optional[str] = None,
+        prompt_cache_hints: bool = True,
         **kwargs,
     ):
         super().__init__(model, temperature, **kwargs)
         self.api_key = api_key or os.getenv("OPENAI_API_KEY")
+        self.prompt_cache_hints = prompt_cache_hints
         self._client = None
 
     def _get_client(self) -> ChatOpenAI:
@@ -51,42 +63,162 @@ class OpenAIProvider(LLMProvider):
 
         return self._client
 
+    @staticmethod
+    def _to_langchain_messages(messages: List[LLMMessage]) -> list:
+        """转换消息格式"""
+        langchain_messages = []
+        for msg in messages:
+            if msg.role == MessageRole.SYSTEM:
+                langchain_messages.append(SystemMessage(content=msg.content))
+            elif msg.role == MessageRole.USER:
+                langchain_messages.append(HumanMessage(content=msg.content))
+            elif msg.role == MessageRole.ASSISTANT:
+                tool_calls = [
+                    {"id": call.id, "name": call.name, "args": call.arguments}
+                    for call in msg.tool_calls or []
+                ]
+                langchain_messages.append(AIMessage(content=msg.content, tool_calls=tool_calls))
+            elif msg.role == MessageRole.TOOL:
+                langchain_messages.append(
+                    ToolMessage(content=msg.content, tool_call_id=msg.tool_call_id)
+                )
+        return langchain_messages
+
     def invoke(self, messages: List[LLMMessage]) -> LLMResponse:
         """调用 OpenAI API"""
+        return self._invoke(messages)
+
+    def invoke_with_tools(
+        self, messages: List[LLMMessage], tools: List[Dict[str, Any]]
+    ) -> LLMResponse:
+        """调用 OpenAI API 并允许模型发起（并行）工具调用"""
+        return self._invoke(messages, tools)
+
+    def _invoke(
+        self, messages: List[LLMMessage], tools: Optional[List[Dict[str, Any]]] = None
+    ) -> LLMResponse:
         try:
             client = self._get_client()
+            if tools:
+                client = client.bind_tools(tools)
 
             # 转换消息格式
-            langchain_messages = []
-            for msg in messages:
-                if msg.role == MessageRole.SYSTEM:
-                    langchain_messages.append(SystemMessage(content=msg.content))
-                elif msg.role == MessageRole.USER:
-                    langchain_messages.append(HumanMessage(content=msg.content))
-                elif msg.role == MessageRole.ASSISTANT:
-                    langchain_messages.append(AIMessage(content=msg.content))
+            langchain_messages = self._to_langchain_messages(messages)
 
             logger.debug(
                 f"调用 OpenAI API - 模型: {self.model}, 消息数: {len(langchain_messages)}"
             )
 
             # 调用 API
-            response = client.invoke(langchain_messages)
+            started = time.perf_counter()
+            response = client.invoke(langchain_messages, **self._cache_kwargs(messages))
+            latency = time.perf_counter() - started
 
             logger.debug(
                 f"OpenAI API 响应成功 - 响应长度: {len(response.content)} 字符"
             )
 
-            return LLMResponse(
+            llm_response = LLMResponse(
                 content=response.content,
                 model=self.model,
-                usage=getattr(response, "usage_metadata", None),
+                usage=self._extract_usage(response),
+                tool_calls=[
+                    ToolCall(id=call["id"], name=call["name"], arguments=call.get("args") or {})
+                    for call in getattr(response, "tool_calls", None) or []
+                ],
+            )
+            if llm_response.tool_calls:
+                logger.debug(
+                    f"OpenAI API 请求工具调用: {[call.name for call in llm_response.tool_calls]}"
+                )
+            usage_tracker.record(self.model, llm_response, latency)
+            logger.debug(
+                f"OpenAI API 用量 - 输入: {llm_response.input_tokens}, "
+                f"缓存命中: {llm_response.cached_tokens}, 耗时: {latency:.2f}s"
             )
 
+            return llm_response
+
         except Exception as e:
             logger.error(f"OpenAI API 调用失败: {str(e)}")
             raise LLMAPIError(f"OpenAI API 调用失败: {str(e)}")
 
+    def stream(self, messages: List[LLMMessage]) -> Iterator[str]:
+        """流式调用 OpenAI API"""
+        try:
+            client = self._get_client()
+            langchain_messages = self._to_langchain_messages(messages)
+
+            logger.debug(
+                f"流式调用 OpenAI API - 模型: {self.model}, 消息数: {len(langchain_messages)}"
+            )
+
+            started = time.perf_counter()
+            aggregated = None
+            for chunk in client.stream(
+                langchain_messages, stream_usage=True, **self._cache_kwargs(messages)
+            ):
+                aggregated = chunk if aggregated is None else aggregated + chunk
+                if chunk.content:
+                    yield chunk.content
+            latency = time.perf_counter() - started
+
+            if aggregated is not None:
+                llm_response = LLMResponse(
+                    content=aggregated.content,
+                    model=self.model,
+                    usage=self._extract_usage(aggregated),
+                )
+                usage_tracker.record(self.model, llm_response, latency)
+                logger.debug(
+                    f"OpenAI API 流式响应完成 - 响应长度: {len(aggregated.content)} 字符, "
+                    f"缓存命中: {llm_response.cached_tokens}, 耗时: {latency:.2f}s"
+                )
+
+        except Exception as e:
+            logger.error(f"OpenAI API 流式调用失败: {str(e)}")
+            raise LLMAPIError(f"OpenAI API 流式调用失败: {str(e)}")
+
+    def _cache_kwargs(self, messages: List[LLMMessage]) -> Dict[str, Any]:
+        """
+        根据消息中的缓存标记生成提示词缓存参数
+
+        OpenAI 会自动缓存足够长的前缀，这里额外传入由稳定前缀计算出的
+        prompt_cache_key，使同一会话的请求被路由到同一缓存。
+        """
+        if not self.prompt_cache_hints:
+            return {}
+
+        prefix_end = max(
+            (i for i, msg in enumerate(messages) if msg.cache_hint), default=-1
+        )
+        if prefix_end < 0:
+            return {}
+
+        digest = hashlib.sha256()
+        for msg in messages[: prefix_end + 1]:
+            digest.update(msg.role.value.encode("utf-8"))
+            digest.update(b"\0")
+            digest.update(msg.content.encode("utf-8"))
+            digest.update(b"\0")
+        return {"extra_body": {"prompt_cache_key": digest.hexdigest()[:32]}}
+
+    @staticmethod
+    def _extract_usage(response) -> Optional[Dict[str, Any]]:
+        """提取用量信息，并补充缓存命中的 token 数"""
+        usage = getattr(response, "usage_metadata", None)
+        if not usage:
+            return None
+
+        usage = dict(usage)
+        token_usage = (getattr(response, "response_metadata", None) or {}).get(
+            "token_usage"
+        ) or {}
+        details = token_usage.get("prompt_tokens_details") or {}
+        if details.get("cached_tokens") is not None:
+            usage["cached_tokens"] = details["cached_tokens"]
+        return usage
+
     def is_available(self) -> bool:
         """检查 OpenAI 是否可用"""
         try:
@@ -178,3 +310,271 @@ class LocalLLMProvider(LLMProvider):
         """检查本地 LLM 是否可用"""
         # 这里可以添加健康检查逻辑
         return False
+
+
+@dataclass
+class LatencyModel:
+    """合成延迟模型（首 token 延迟 + 生成速度）"""
+
+    ttft_ms: float = 0.0  # 首 token 延迟均值（毫秒）
+    ttft_jitter_ms: float = 0.0  # 首 token 延迟抖动（标准差，毫秒）
+    distribution: str = "fixed"  # 支持: fixed, normal, lognormal
+    tokens_per_second: float = 0.0  # 生成速度，0 表示不模拟生成耗时
+    seed: Optional[int] = 0  # 随机种子，保证延迟序列可复现
+
+    def __post_init__(self):
+        self._rng = random.Random(self.seed)
+
+    def sample_ttft(self) -> float:
+        """采样首 token 延迟（秒）"""
+        if self.ttft_ms <= 0:
+            return 0.0
+
+        if self.distribution == "normal":
+            value = self._rng.gauss(self.ttft_ms, self.ttft_jitter_ms)
+        elif self.distribution == "lognormal":
+            # 按给定的均值和标准差换算对数正态分布参数
+            variance = self.ttft_jitter_ms**2
+            sigma2 = math.log(1 + variance / self.ttft_ms**2)
+            mu = math.log(self.ttft_ms) - sigma2 / 2
+            value = self._rng.lognormvariate(mu, math.sqrt(sigma2))
+        else:
+            value = self.ttft_ms
+
+        return max(value, 0.0) / 1000
+
+    def generation_time(self, tokens: int) -> float:
+        """计算生成指定 token 数所需时间（秒）"""
+        if self.tokens_per_second <= 0:
+            return 0.0
+        return tokens / self.tokens_per_second
+
+
+class _ReplayFixtureStore:
+    """回放夹具文件存储，同一路径在进程内共享一个实例"""
+
+    _instances: Dict[str, "_ReplayFixtureStore"] = {}
+    _instances_lock = threading.Lock()
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._records: Dict[str, List[Dict[str, Any]]] = {}
+        self._cursors: Dict[str, int] = {}
+        self._load()
+
+    @classmethod
+    def get(cls, path: str) -> "_ReplayFixtureStore":
+        path = os.path.abspath(path)
+        with cls._instances_lock:
+            if path not in cls._instances:
+                cls._instances[path] = cls(path)
+            return cls._instances[path]
+
+    def _load(self) -> None:
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        self._records = data.get("records", {})
+        logger.info(
+            f"加载回放夹具: {self.path}, 记录数: {sum(len(v) for v in self._records.values())}"
+        )
+
+    @staticmethod
+    def make_key(messages: List[LLMMessage]) -> str:
+        """根据消息内容计算记录键"""
+        payload = json.dumps(
+            [msg.to_dict() for msg in messages], ensure_ascii=False, sort_keys=True
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def lookup(self, messages: List[LLMMessage]) -> Optional[Dict[str, Any]]:
+        """按顺序返回匹配的记录，同一请求被录制多次时循环回放"""
+        key = self.make_key(messages)
+        with self._lock:
+            entries = self._records.get(key)
+            if not entries:
+                return None
+            cursor = self._cursors.get(key, 0)
+            self._cursors[key] = cursor + 1
+            return entries[cursor % len(entries)]
+
+    def append(self, messages: List[LLMMessage], response: LLMResponse) -> None:
+        """追加一条记录并写回文件"""
+        key = self.make_key(messages)
+        entry = {
+            "messages": [msg.to_dict() for msg in messages],
+            "response": {
+                "content": response.content,
+                "model": response.model,
+                "usage": response.usage,
+            },
+        }
+        if response.tool_calls:
+            entry["response"]["tool_calls"] = [call.to_dict() for call in response.tool_calls]
+        with self._lock:
+            self._records.setdefault(key, []).append(entry)
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(
+                    {"version": 1, "records": self._records},
+                    f,
+                    ensure_ascii=False,
+                    indent=2,
+                    default=str,
+                )
+            os.replace(tmp_path, self.path)
+
+    def exists(self) -> bool:
+        return bool(self._records) or os.path.exists(self.path)
+
+
+class ReplayLLMProvider(LLMProvider):
+    """录制/回放 LLM 提供商（用于离线测试和压测）
+
+    record 模式下调用真实提供商并把请求/响应写入夹具文件；
+    replay 模式下按消息内容查找记录，并按延迟模型模拟耗时。
+    """
+
+    # 流式回放时每段的字符数
+    STREAM_CHUNK_CHARS = 16
+
+    def __init__(
+        self,
+        model: str = "replay",
+        temperature: float = 0.0,
+        fixture_path: Optional[str] = None,
+        mode: Optional[str] = None,
+        delegate: Optional[LLMProvider] = None,
+        latency: Optional[LatencyModel] = None,
+        record_provider: Optional[str] = None,
+        record_model: Optional[str] = None,
+        **kwargs,
+    ):
+        super().__init__(model, temperature, **kwargs)
+        self.fixture_path = fixture_path or os.getenv(
+            "REPLAY_FIXTURE_PATH", "fixtures/llm_replay.json"
+        )
+        self.mode = (mode or os.getenv("REPLAY_MODE", "replay")).lower()
+        self.latency = latency or LatencyModel(
+            ttft_ms=float(os.getenv("REPLAY_TTFT_MS", "0")),
+            ttft_jitter_ms=float(os.getenv("REPLAY_TTFT_JITTER_MS", "0")),
+            distribution=os.getenv("REPLAY_LATENCY_DISTRIBUTION", "fixed"),
+            tokens_per_second=float(os.getenv("REPLAY_TOKENS_PER_SECOND", "0")),
+            seed=int(os.getenv("REPLAY_SEED", "0")),
+        )
+        # 录制模式下实际调用的提供商和模型
+        self.record_provider = record_provider or os.getenv("REPLAY_RECORD_PROVIDER", "openai")
+        self.record_model = record_model
+        self._delegate = delegate
+        self._store = _ReplayFixtureStore.get(self.fixture_path)
+
+    def _get_delegate(self) -> LLMProvider:
+        """获取录制模式下实际调用的提供商"""
+        if self._delegate is None:
+            # 延迟导入，避免与工厂类循环依赖
+            from .llm_factory import LLMFactory
+
+            self._delegate = LLMFactory.create_llm(
+                provider=self.record_provider,
+                model=self.record_model,
+                temperature=self.temperature,
+                fallback_to_mock=False,
+            )
+        return self._delegate
+
+    @staticmethod
+    def _estimate_tokens(text: str) -> int:
+        """粗略估算 token 数：非 ASCII 字符按 1 个，ASCII 字符按 4 个折 1 个"""
+        non_ascii = sum(1 for ch in text if ord(ch) > 127)
+        return max(1, non_ascii + (len(text) - non_ascii) // 4)
+
+    def _lookup(self, messages: List[LLMMessage]) -> LLMResponse:
+        """查找回放记录"""
+        entry = self._store.lookup(messages)
+        if entry is None:
+            raise LLMAPIError(
+                f"回放夹具中没有匹配的记录: {self.fixture_path}, "
+                f"键: {_ReplayFixtureStore.make_key(messages)[:12]}"
+            )
+
+        recorded = entry["response"]
+        return LLMResponse(
+            content=recorded["content"],
+            model=recorded.get("model") or self.model,
+            usage=recorded.get("usage"),
+            tool_calls=[ToolCall(**call) for call in recorded.get("tool_calls") or []],
+        )
+
+    def invoke(self, messages: List[LLMMessage]) -> LLMResponse:
+        """录制或回放 LLM 响应"""
+        return self._respond(messages)
+
+    def invoke_with_tools(
+        self, messages: List[LLMMessage], tools: List[Dict[str, Any]]
+    ) -> LLMResponse:
+        """录制或回放带工具调用的 LLM 响应"""
+        return self._respond(messages, tools)
+
+    def _respond(
+        self, messages: List[LLMMessage], tools: Optional[List[Dict[str, Any]]] = None
+    ) -> LLMResponse:
+        if self.mode == "record":
+            delegate = self._get_delegate()
+            response = delegate.invoke_with_tools(messages, tools) if tools else delegate.invoke(messages)
+            self._store.append(messages, response)
+            logger.debug(f"录制 LLM 响应 - 响应长度: {len(response.content)} 字符")
+            return response
+
+        response = self._lookup(messages)
+
+        tokens = response.output_tokens or self._estimate_tokens(response.content)
+        latency = self.latency.sample_ttft() + self.latency.generation_time(tokens)
+        if latency > 0:
+            time.sleep(latency)
+
+        usage_tracker.record(self.model, response, latency)
+        logger.debug(f"回放 LLM 响应 - 响应长度: {len(response.content)} 字符, 模拟耗时: {latency:.3f}s")
+        return response
+
+    def stream(self, messages: List[LLMMessage]) -> Iterator[str]:
+        """流式录制或回放：回放时按延迟模型逐段输出"""
+        if self.mode == "record":
+            parts = []
+            for delta in self._get_delegate().stream(messages):
+                parts.append(delta)
+                yield delta
+            self._store.append(messages, LLMResponse(content="".join(parts), model=self.model))
+            return
+
+        response = self._lookup(messages)
+        started = time.perf_counter()
+
+        ttft = self.latency.sample_ttft()
+        if ttft > 0:
+            time.sleep(ttft)
+
+        content = response.content
+        for start in range(0, len(content), self.STREAM_CHUNK_CHARS):
+            delta = content[start:start + self.STREAM_CHUNK_CHARS]
+            delay = self.latency.generation_time(self._estimate_tokens(delta))
+            if delay > 0:
+                time.sleep(delay)
+            yield delta
+
+        latency = time.perf_counter() - started
+        usage_tracker.record(self.model, response, latency)
+        logger.debug(f"流式回放 LLM 响应 - 响应长度: {len(content)} 字符, 模拟耗时: {latency:.3f}s")
+
+    def is_available(self) -> bool:
+        """回放模式要求夹具存在，录制模式要求实际提供商可用"""
+        if self.mode == "record":
+            try:
+                return self._get_delegate().is_available()
+            except Exception:
+                return False
+        return self._store.exists()
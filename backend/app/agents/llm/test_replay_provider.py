@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""测试录制/回放 LLM 提供商"""
+
+import os
+import sys
+import time
+# 添加项目根目录到 Python 路径
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '../../..'))
+
+import pytest
+
+from app.agents.llm import (
+    LLMFactory,
+    LLMMessage,
+    MessageRole,
+    MockLLMProvider,
+    ReplayLLMProvider,
+    LatencyModel,
+    LLMProvider,
+    LLMResponse,
+    ToolCall,
+)
+from app.agents.llm.llm_interface import LLMAPIError
+
+
+def _messages(question: str):
+    return [
+        LLMMessage(role=MessageRole.SYSTEM, content="你是一个测试助手"),
+        LLMMessage(role=MessageRole.USER, content=question),
+    ]
+
+
+def test_record_then_replay(tmp_path):
+    """录制后回放应得到相同响应"""
+    fixture = str(tmp_path / "replay.json")
+
+    recorder = ReplayLLMProvider(
+        fixture_path=fixture, mode="record", delegate=MockLLMProvider()
+    )
+    recorded = recorder.invoke(_messages("总共有多少行？"))
+    assert os.path.exists(fixture)
+
+    player = ReplayLLMProvider(fixture_path=fixture, mode="replay")
+    assert player.is_available()
+    replayed = player.invoke(_messages("总共有多少行？"))
+    assert replayed.content == recorded.content
+
+
+def test_replay_miss_raises(tmp_path):
+    """回放时没有匹配记录应报错"""
+    fixture = str(tmp_path / "empty.json")
+    player = ReplayLLMProvider(fixture_path=fixture, mode="replay")
+    assert not player.is_available()
+
+    with pytest.raises(LLMAPIError):
+        player.invoke(_messages("未录制的问题"))
+
+
+def test_latency_model_is_deterministic():
+    """相同种子的延迟序列应一致"""
+    first = LatencyModel(ttft_ms=200, ttft_jitter_ms=50, distribution="lognormal", seed=7)
+    second = LatencyModel(ttft_ms=200, ttft_jitter_ms=50, distribution="lognormal", seed=7)
+
+    assert [first.sample_ttft() for _ in range(5)] == [second.sample_ttft() for _ in range(5)]
+    assert LatencyModel(tokens_per_second=100).generation_time(50) == pytest.approx(0.5)
+
+
+def test_replay_applies_latency(tmp_path):
+    """回放时应模拟首 token 延迟"""
+    fixture = str(tmp_path / "latency.json")
+    ReplayLLMProvider(
+        fixture_path=fixture, mode="record", delegate=MockLLMProvider()
+    ).invoke(_messages("平均值是多少"))
+
+    player = ReplayLLMProvider(
+        fixture_path=fixture, mode="replay", latency=LatencyModel(ttft_ms=50)
+    )
+    started = time.perf_counter()
+    player.invoke(_messages("平均值是多少"))
+    assert time.perf_counter() - started >= 0.05
+
+
+def test_replay_stream_yields_recorded_content(tmp_path):
+    """流式回放应分段输出录制的完整响应"""
+    fixture = str(tmp_path / "stream.json")
+    recorded = "".join(ReplayLLMProvider(
+        fixture_path=fixture, mode="record", delegate=MockLLMProvider()
+    ).stream(_messages("各地区销售额")))
+
+    player = ReplayLLMProvider(fixture_path=fixture, mode="replay")
+    chunks = list(player.stream(_messages("各地区销售额")))
+    assert "".join(chunks) == recorded
+    assert all(len(chunk) <= ReplayLLMProvider.STREAM_CHUNK_CHARS for chunk in chunks)
+
+
+class _ToolCallingProvider(LLMProvider):
+    def __init__(self):
+        super().__init__("tool-calling")
+
+    def invoke(self, messages):
+        return LLMResponse(content="直接回答")
+
+    def invoke_with_tools(self, messages, tools):
+        return LLMResponse(content="", tool_calls=[
+            ToolCall(id="call_1", name="code_execution", arguments={"code": "print(len(df))"})
+        ])
+
+    def is_available(self):
+        return True
+
+
+def test_replay_tool_calls(tmp_path):
+    """工具调用应被录制并原样回放"""
+    fixture = str(tmp_path / "tools.json")
+    tools = [{"type": "function", "function": {"name": "code_execution", "parameters": {}}}]
+    ReplayLLMProvider(
+        fixture_path=fixture, mode="record", delegate=_ToolCallingProvider()
+    ).invoke_with_tools(_messages("总共有多少行？"), tools)
+
+    player = ReplayLLMProvider(fixture_path=fixture, mode="replay")
+    response = player.invoke_with_tools(_messages("总共有多少行？"), tools)
+    assert response.tool_calls == [
+        ToolCall(id="call_1", name="code_execution", arguments={"code": "print(len(df))"})
+    ]
+
+
+def test_factory_passes_record_provider(tmp_path, monkeypatch):
+    """录制时实际调用的提供商和模型取自配置对象"""
+    monkeypatch.delenv("REPLAY_RECORD_PROVIDER", raising=False)
+
+    class Config:
+        LLM_PROVIDER = "replay"
+        LLM_MODEL = "mock-model"
+        REPLAY_FIXTURE_PATH = str(tmp_path / "replay.json")
+        REPLAY_MODE = "record"
+        REPLAY_RECORD_PROVIDER = "mock"
+
+    provider = LLMFactory.create_from_config(Config)
+    delegate = provider._get_delegate()
+
+    assert isinstance(delegate, MockLLMProvider)
+    assert delegate.model == "mock-model"
@@ -0,0 +1,86 @@
+"""LLM 用量统计"""
+
+import threading
+from typing import Dict, Any
+from .llm_interface import LLMResponse
+
+
+class LLMUsageTracker:
+    """LLM 调用用量统计，区分命中/未命中提示词缓存的调用"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats: Dict[str, Dict[str, Any]] = {}
+
+    @staticmethod
+    def _empty_stats() -> Dict[str, Any]:
+        return {
+            "calls": 0,
+            "cache_hit_calls": 0,
+            "input_tokens": 0,
+            "cached_tokens": 0,
+            "output_tokens": 0,
+            "latency_seconds": 0.0,
+            "cache_hit_latency_seconds": 0.0,
+        }
+
+    def record(self, model: str, response: LLMResponse, latency_seconds: float) -> None:
+        """
+        记录一次 LLM 调用
+
+        Args:
+            model: 模型名称
+            response: LLM 响应（读取其中的 usage）
+            latency_seconds: 调用耗时（秒）
+        """
+        cached_tokens = response.cached_tokens
+        with self._lock:
+            stats = self._stats.setdefault(model, self._empty_stats())
+            stats["calls"] += 1
+            stats["input_tokens"] += response.input_tokens
+            stats["cached_tokens"] += cached_tokens
+            stats["output_tokens"] += response.output_tokens
+            stats["latency_seconds"] += latency_seconds
+            if cached_tokens:
+                stats["cache_hit_calls"] += 1
+                stats["cache_hit_latency_seconds"] += latency_seconds
+
+    def snapshot(self) -> Dict[str, Any]:
+        """
+        获取统计快照
+
+        Returns:
+            按模型划分的统计信息，包含缓存命中率和平均延迟
+        """
+        with self._lock:
+            models = {name: dict(stats) for name, stats in self._stats.items()}
+
+        for stats in models.values():
+            calls = stats["calls"]
+            hit_calls = stats["cache_hit_calls"]
+            miss_calls = calls - hit_calls
+            stats["cached_token_ratio"] = (
+                stats["cached_tokens"] / stats["input_tokens"]
+                if stats["input_tokens"]
+                else 0.0
+            )
+            stats["avg_latency_cache_hit"] = (
+                stats["cache_hit_latency_seconds"] / hit_calls if hit_calls else None
+            )
+            stats["avg_latency_cache_miss"] = (
+                (stats["latency_seconds"] - stats["cache_hit_latency_seconds"])
+                / miss_calls
+                if miss_calls
+                else None
+            )
+
+        return {"models": models}
+
+    def reset(self) -> None:
+        """清空统计"""
+        with self._lock:
+            self._stats.clear()
+
+
+# 全局用量统计实例
+usage_tracker = LLMUsageTracker()
@@ -1,33 +1,94 @@
 """Agent 节点模块"""
 import pandas as pd
-from typing import Dict, Any, List, Optional
+from concurrent.futures import ThreadPoolExecutor, Future
+from typing import Dict, Any, List, Optional, Tuple
 from app.agents.config import AgentConfig
-from app.agents.llm import LLMFactory, LLMMessage, MessageRole, LLMProvider
+from app.agents.llm import LLMFactory, LLMMessage, MessageRole, LLMProvider, ToolCall
+from app.agents.prompts import (
+    GENERAL_ASSISTANT_PROMPT,
+    DIRECT_RESPONSE_PROMPT,
+    build_intent_messages,
+    build_analysis_messages,
+    build_retry_messages,
+    format_performance_hints
+)
+from app.agents.query_recognizer import SimpleQueryRecognizer
+from app.agents.code_blocks import CodeFenceParser, extract_code_blocks
+from app.agents.tools import CodeExecutionTool, DataContextTool, build_tool_specs
+from app.agents.execution import ExecutionContext, code_executor, resolve_analysis_engine
+from app.agents.execution.cost import Admission, ROUTE_RUN, ROUTE_BACKGROUND, ROUTE_SAMPLE, ROUTE_REJECT
+from app.agents.execution.sampling import group_keys
+from app.agents.cancellation import WorkflowCancelled
 from app.services.file_service import FileService
 from app.core.logging_config import get_agent_logger
 
 # 获取日志记录器
 logger = get_agent_logger('nodes')
 
+# 推测性加载数据上下文的线程池
+_speculative_executor = ThreadPoolExecutor(
+    max_workers=AgentConfig.SPECULATIVE_DATA_CONTEXT_WORKERS,
+    thread_name_prefix="data-context"
+)
+
+# 并行执行同一轮工具调用的线程池
+_tool_call_executor = ThreadPoolExecutor(
+    max_workers=AgentConfig.MAX_PARALLEL_TOOL_CALLS,
+    thread_name_prefix="tool-call"
+)
+
 
 class AgentState(Dict[str, Any]):
     """Agent 状态类"""
     pass
 
 
+def _execution_session_id(state: AgentState) -> Optional[str]:
+    """代码执行使用的会话ID（决定会话内核与工作进程绑定），状态中 execution_session_id 为 None 时不使用会话内核"""
+    return state.get("execution_session_id", state.get("session_id"))
+
+
+def _build_execution_context(state: AgentState, engine: str) -> ExecutionContext:
+    """根据状态构建代码执行上下文"""
+    file_info = state.get("file_info")
+    return ExecutionContext(
+        session_id=_execution_session_id(state),
+        filepath=file_info.filepath if file_info else None,
+        dataframe=state.get("dataframe"),
+        engine=engine,
+        columns=state.get("data_context", {}).get("columns"),
+        rows=state.get("data_context", {}).get("total_rows"),
+        cancel_token=state.get("cancel_token")
+    )
+
+
+def _call_llm(state: AgentState, func, *args):
+    """调用 LLM；工作流带有取消令牌时在后台线程中调用，取消后立即停止等待"""
+    cancel_token = state.get("cancel_token")
+    if cancel_token is None:
+        return func(*args)
+    return cancel_token.run(func, *args)
+
+
 class IntentClassificationNode:
     """意图分类节点"""
     
-    def __init__(self):
+    def __init__(self, data_context_node: Optional["DataContextNode"] = None):
         try:
             self.llm = LLMFactory.create_from_config(AgentConfig)
         except Exception as e:
             logger.warning(f"创建 LLM 实例失败: {str(e)}")
             self.llm = None
+        # 用于在 LLM 分类期间推测性加载数据上下文
+        self.data_context_node = data_context_node
     
     def __call__(self, state: AgentState) -> AgentState:
         """判断用户意图"""
         logger.info("开始执行意图分类节点")
+        if state.get("intent_classification_done"):
+            # 调用方已确定问题类型（如批量问题）
+            logger.debug("意图已确定，跳过分类")
+            return state
         user_message = state.get("user_message", "")
         logger.debug(f"用户消息: {user_message[:100]}...")  # 只记录前100个字符
         
@@ -39,42 +100,52 @@ class IntentClassificationNode:
         logger.debug(f"关键词匹配结果: {is_table_related}")
         
         # 如果关键词匹配不明确，使用 LLM 进行判断
+        speculative_future = None
         if not is_table_related and self.llm:
+            # LLM 往返与文件解析互不依赖，分类的同时推测性地加载数据上下文
+            speculative_future = self._start_speculative_load(state)
             logger.info("使用 LLM 进行意图分类")
             try:
-                system_prompt = """
-                你是一个意图分类专家。请判断用户的问题是否与数据表格分析相关。
-                
-                表格相关的问题包括但不限于：
-                - 数据统计和分析
-                - 数据查询和筛选
-                - 数据可视化
-                - 字段信息查询
-                - 数据计算和汇总
-                - 趋势分析
-                
-                请只回答 "是" 或 "否"。
-                """
+                messages = build_intent_messages(user_message)
                 
-                messages = [
-                    LLMMessage(role=MessageRole.SYSTEM, content=system_prompt),
-                    LLMMessage(role=MessageRole.USER, content=f"用户问题：{user_message}")
-                ]
-                
-                response = self.llm.invoke(messages)
+                response = _call_llm(state, self.llm.invoke, messages)
                 is_table_related = "是" in response.content
                 logger.debug(f"LLM 分类结果: {response.content} -> {is_table_related}")
+            except WorkflowCancelled:
+                raise
             except Exception as e:
                 logger.error(f"LLM 意图分类失败: {str(e)}", exc_info=True)
                 # 如果 LLM 调用失败，默认认为是表格相关问题
                 is_table_related = True
                 logger.warning("LLM 分类失败，默认设置为表格相关问题")
         
+        if speculative_future is not None:
+            if is_table_related:
+                state["data_context_future"] = speculative_future
+            else:
+                # 非表格问题，丢弃推测加载的结果
+                speculative_future.cancel()
+                logger.info("非表格相关问题，丢弃推测加载的数据上下文")
+        
         state["is_table_related"] = is_table_related
         state["intent_classification_done"] = True
         
         logger.info(f"意图分类完成 - 是否表格相关: {is_table_related}")
         return state
+    
+    def _start_speculative_load(self, state: AgentState) -> Optional[Future]:
+        """提交推测性的数据上下文加载任务"""
+        file_info = state.get("file_info")
+        if (
+            not AgentConfig.SPECULATIVE_DATA_CONTEXT
+            or self.data_context_node is None
+            or not file_info
+            or state.get("data_context_ready")
+        ):
+            return None
+        
+        logger.debug(f"推测性加载数据上下文: {file_info.filename}")
+        return _speculative_executor.submit(self.data_context_node.load_context, file_info)
 
 
 class DataContextNode:
@@ -83,6 +154,12 @@ class DataContextNode:
     def __call__(self, state: AgentState) -> AgentState:
         """构建数据上下文"""
         logger.info("开始执行数据上下文节点")
+        speculative_future = state.pop("data_context_future", None)
+        
+        if state.get("data_context_ready"):
+            logger.debug("数据上下文已就绪，跳过加载")
+            return state
+        
         file_info = state.get("file_info")
         if not file_info:
             logger.error("没有找到文件信息")
@@ -92,29 +169,23 @@ class DataContextNode:
         logger.debug(f"处理文件: {file_info.filename}")
         
         try:
-            # 读取数据文件
-            logger.debug("开始读取数据文件")
-            df = FileService.get_dataframe(file_info.filepath)
-            logger.info(f"成功读取数据文件 - 行数: {len(df)}, 列数: {len(df.columns)}")
-            
-            # 获取前21行数据（包含表头）
-            preview_df = df.head(AgentConfig.MAX_PREVIEW_ROWS - 1)  # -1 因为 head 不包含表头计数
-            
-            # 构建数据上下文
-            context_info = {
-                "filename": file_info.filename,
-                "total_rows": len(df),
-                "total_columns": len(df.columns),
-                "columns": df.columns.tolist(),
-                "dtypes": df.dtypes.to_dict(),
-                "preview_data": preview_df.to_dict('records'),
-                "preview_string": preview_df.to_string()
-            }
+            if speculative_future is not None:
+                # 等待意图分类期间已启动的推测加载
+                logger.debug("使用推测加载的数据上下文")
+                context_info, df = speculative_future.result()
+            else:
+                context_info, df = self.load_context(file_info)
             
             state["data_context"] = context_info
             state["dataframe"] = df
             state["data_context_ready"] = True
             
+            # 让代码执行进程提前加载数据，与 LLM 分析并行
+            _speculative_executor.submit(
+                code_executor.preload,
+                ExecutionContext(session_id=state.get("session_id"), filepath=file_info.filepath)
+            )
+            
             logger.info("数据上下文构建完成")
             
         except Exception as e:
@@ -122,6 +193,75 @@ class DataContextNode:
             state["error"] = f"读取数据文件失败：{str(e)}"
         
         return state
+    
+    def load_context(self, file_info) -> Tuple[Dict[str, Any], pd.DataFrame]:
+        """读取数据文件并构建数据上下文"""
+        logger.debug("开始读取数据文件")
+        df = FileService.get_cached_dataframe(file_info.filepath)
+        logger.info(f"成功读取数据文件 - 行数: {len(df)}, 列数: {len(df.columns)}")
+        
+        # 获取前21行数据（包含表头）
+        preview_df = df.head(AgentConfig.MAX_PREVIEW_ROWS - 1)  # -1 因为 head 不包含表头计数
+        
+        # 构建数据上下文
+        context_info = {
+            "filename": file_info.filename,
+            "total_rows": len(df),
+            "total_columns": len(df.columns),
+            "columns": df.columns.tolist(),
+            "dtypes": df.dtypes.to_dict(),
+            "preview_data": preview_df.to_dict('records'),
+            "preview_string": preview_df.to_string()
+        }
+        
+        return context_info, df
+
+
+class QuickAnswerNode:
+    """快速回答节点（简单查询直接计算，不调用 LLM）"""
+    
+    def __init__(self):
+        self.recognizer = SimpleQueryRecognizer(max_rows=AgentConfig.MAX_PREVIEW_ROWS - 1)
+    
+    def __call__(self, state: AgentState) -> AgentState:
+        """尝试直接回答简单查询"""
+        logger.info("开始执行快速回答节点")
+        state["quick_answer_done"] = False
+        user_message = state.get("user_message", "")
+        df = state.get("dataframe")
+        
+        if not AgentConfig.QUICK_ANSWER_ENABLED or df is None:
+            return state
+        
+        try:
+            plan = self.recognizer.recognize(user_message, df)
+            if plan is None:
+                logger.debug("未识别为简单查询，交由 LLM 分析")
+                return state
+            result = plan.execute(df)
+        except Exception as e:
+            logger.warning(f"快速回答失败，交由 LLM 分析: {str(e)}")
+            return state
+        
+        if isinstance(result, (pd.DataFrame, pd.Series)):
+            output = result.to_string()
+            summary = f"{plan.describe()}如下："
+        else:
+            output = str(result.item() if hasattr(result, "item") else result)
+            summary = f"{plan.describe()}为 **{output}**。"
+        
+        state["analysis_response"] = f"{summary}\n\n（该问题由规则直接计算得出，未调用模型。）"
+        state["code_execution_results"] = [{
+            "code": plan.to_code(),
+            "output": output,
+            "success": True
+        }]
+        state["needs_code_execution"] = False
+        state["analysis_done"] = True
+        state["quick_answer_done"] = True
+        
+        logger.info(f"快速回答完成: {plan.describe()}")
+        return state
 
 
 class TableAnalysisNode:
@@ -135,7 +275,8 @@ class TableAnalysisNode:
                 model=AgentConfig.LLM_MODEL,
                 temperature=0.1,
                 fallback_to_mock=AgentConfig.LLM_FALLBACK_TO_MOCK,
-                api_key=AgentConfig.OPENAI_API_KEY if AgentConfig.LLM_PROVIDER == "openai" else None
+                api_key=AgentConfig.OPENAI_API_KEY if AgentConfig.LLM_PROVIDER == "openai" else None,
+                prompt_cache_hints=AgentConfig.LLM_PROMPT_CACHE_HINTS
             )
         except Exception as e:
             logger.warning(f"创建 LLM 实例失败: {str(e)}")
@@ -154,48 +295,49 @@ class TableAnalysisNode:
         
         logger.debug(f"分析数据文件: {data_context.get('filename', 'unknown')}")
         
-        # 构建系统提示
-        system_prompt = f"""
-        你是一个专业的数据分析师。用户上传了一个数据文件，你需要根据用户的问题进行分析。
-
-        数据文件信息：
-        - 文件名：{data_context.get('filename', 'unknown')}
-        - 总行数：{data_context.get('total_rows', 0)}
-        - 总列数：{data_context.get('total_columns', 0)}
-        - 列名：{', '.join(data_context.get('columns', []))}
-        
-        数据预览（前20行）：
-        {data_context.get('preview_string', '')}
-        
-        请根据用户的问题，分析数据并提供准确的回答。如果需要进行复杂的计算或数据处理，
-        你可以生成 Python 代码来处理数据。数据已经加载到变量 'df' 中。
-        
-        如果你需要执行代码来回答问题，请在回答中包含代码块，格式如下：
-        ```python
-        # 你的代码
-        ```
-        """
+        # 分析引擎决定模型生成 Python 代码还是 SQL
+        engine = resolve_analysis_engine()
+        language = "sql" if engine == "duckdb" else "python"
+        
+        # 构建消息：静态指令 + 会话级冻结的数据上下文 + 本轮问题
+        messages = build_analysis_messages(
+            user_message,
+            data_context,
+            session_id=state.get("session_id"),
+            engine=engine,
+            kernel_variables=code_executor.get_kernel_variables(_execution_session_id(state)) if engine != "duckdb" else None
+        )
         
-        messages = [
-            LLMMessage(role=MessageRole.SYSTEM, content=system_prompt),
-            LLMMessage(role=MessageRole.USER, content=user_message)
-        ]
+        # 上一次的代码执行失败，带上错误信息和性能提示重新分析
+        retry_results = state.pop("retry_results", None)
+        if retry_results:
+            logger.info(f"第 {state.get('code_retries', 0)} 次重新分析")
+            messages.extend(build_retry_messages(state.get("analysis_response", ""), retry_results))
+            state.pop("code_execution_results", None)
         
         try:
             if self.llm:
                 logger.info("使用 LLM 进行表格分析")
                 logger.debug(f"发送消息到 LLM: {len(messages)} 条消息，数据行数: {data_context.get('total_rows', 0)}")
-                response = self.llm.invoke(messages)
-                logger.info(f"LLM 表格分析响应成功，响应长度: {len(response.content)} 字符")
-                state["analysis_response"] = response.content
+                if AgentConfig.STREAM_CODE_EXECUTION:
+                    # 流式接收响应，代码块一闭合就开始执行
+                    content, code_futures = self._stream_and_execute(messages, state, engine, language)
+                else:
+                    content, code_futures = _call_llm(state, self.llm.invoke, messages).content, []
+                logger.info(f"LLM 表格分析响应成功，响应长度: {len(content)} 字符")
+                state["analysis_response"] = content
                 state["analysis_done"] = True
                 
                 # 检查是否包含代码块
-                if "```python" in response.content:
+                if f"```{language}" in content:
                     state["needs_code_execution"] = True
                     # 提取代码
-                    code_blocks = self._extract_code_blocks(response.content)
+                    code_blocks = self._extract_code_blocks(content, language)
                     state["code_to_execute"] = code_blocks
+                    state["code_language"] = language
+                    state["analysis_engine"] = engine
+                    if code_futures:
+                        state["code_execution_futures"] = code_futures
                     logger.info(f"检测到 {len(code_blocks)} 个代码块需要执行")
                 else:
                     state["needs_code_execution"] = False
@@ -220,6 +362,8 @@ class TableAnalysisNode:
                 state["analysis_done"] = True
                 state["needs_code_execution"] = False
                 
+        except WorkflowCancelled:
+            raise
         except Exception as e:
             logger.error(f"表格分析过程中出错: {str(e)}", exc_info=True)
             state["error"] = f"分析过程中出错：{str(e)}"
@@ -228,35 +372,263 @@ class TableAnalysisNode:
         
         return state
     
-    def _extract_code_blocks(self, text: str) -> List[str]:
-        """提取代码块"""
-        code_blocks = []
-        lines = text.split('\n')
-        in_code_block = False
-        current_code = []
-        
-        for line in lines:
-            if line.strip().startswith('```python'):
-                in_code_block = True
-                current_code = []
-            elif line.strip() == '```' and in_code_block:
-                in_code_block = False
-                if current_code:
-                    code_blocks.append('\n'.join(current_code))
-            elif in_code_block:
-                current_code.append(line)
-        
-        return code_blocks
+    def _stream_and_execute(
+        self,
+        messages: List[LLMMessage],
+        state: AgentState,
+        engine: str,
+        language: str
+    ) -> Tuple[str, List[Future]]:
+        """
+        流式接收分析响应，代码块闭合后立即提交执行，执行与后续内容的生成重叠
+
+        代码块按生成顺序在单线程中依次执行，与一次性执行的顺序一致。
+
+        Returns:
+            (完整响应, 各代码块的执行 Future；未提前执行的代码块为 None)
+        """
+        parser = CodeFenceParser(language)
+        context = _build_execution_context(state, engine)
+        runner = ThreadPoolExecutor(max_workers=1, thread_name_prefix="early-exec")
+        futures: List[Optional[Future]] = []
+        parts: List[str] = []
+        
+        def submit(code: str) -> None:
+            # 估计耗时较长的代码块（及其后依赖其结果的代码块）交给代码执行节点按准入决定执行
+            if (futures and futures[-1] is None) or (
+                    language == "python" and code_executor.admit(code, context).route != ROUTE_RUN):
+                futures.append(None)
+                return
+            logger.info(f"代码块 {len(futures) + 1} 已生成，提前开始执行")
+            futures.append(runner.submit(code_executor.execute, code, context, language))
+        
+        cancel_token = state.get("cancel_token")
+        try:
+            for delta in self.llm.stream(messages):
+                if cancel_token is not None:
+                    # 中止流式调用，关闭与提供商的连接
+                    cancel_token.raise_if_cancelled()
+                parts.append(delta)
+                for code in parser.feed(delta):
+                    submit(code)
+            for code in parser.close():
+                submit(code)
+        finally:
+            # 不等待执行完成，由代码执行节点收集结果
+            runner.shutdown(wait=False)
+        
+        return "".join(parts), futures
+    
+    def _extract_code_blocks(self, text: str, language: str = "python") -> List[str]:
+        """提取指定语言的代码块"""
+        return extract_code_blocks(text, language)
+
+
+class ToolAnalysisNode(TableAnalysisNode):
+    """工具调用分析节点（ANALYSIS_MODE=tools）
+
+    模型通过结构化的 code_execution / get_data_context 工具调用执行代码或查看数据，
+    不再从回答文本中提取代码块。同一轮中的多个工具调用在使用会话内核时按调用顺序依次执行
+    （共用一个内核，后面的调用可以使用前面定义的变量），不使用会话内核时并行执行；
+    结果作为工具消息返回给模型，直到模型给出最终回答或达到轮数上限。
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.code_tool = CodeExecutionTool()
+        self.context_tool = DataContextTool()
+
+    def __call__(self, state: AgentState) -> AgentState:
+        """通过工具调用分析表格数据"""
+        if not self.llm:
+            # 没有 LLM 时与代码块模式相同，给出简单回答
+            return super().__call__(state)
+
+        logger.info("开始执行工具调用分析节点")
+        data_context = state.get("data_context", {})
+        if not data_context:
+            logger.error("数据上下文未准备就绪")
+            state["error"] = "数据上下文未准备就绪"
+            return state
+
+        engine = resolve_analysis_engine()
+        language = "sql" if engine == "duckdb" else "python"
+        messages = build_analysis_messages(
+            state.get("user_message", ""),
+            data_context,
+            session_id=state.get("session_id"),
+            engine=engine,
+            kernel_variables=code_executor.get_kernel_variables(_execution_session_id(state)) if engine != "duckdb" else None,
+            mode="tools"
+        )
+        tools = build_tool_specs(engine)
+        context = _build_execution_context(state, engine)
+        # 会话内核的调用都绑定到同一个工作进程并共用内核变量，并行执行只会互相等待、争用内核
+        sequential = AgentConfig.SESSION_KERNELS_ENABLED and bool(context.session_id)
+        execution_results = []
+
+        try:
+            for round_index in range(1, AgentConfig.MAX_TOOL_ROUNDS + 1):
+                response = _call_llm(state, self.llm.invoke_with_tools, messages, tools)
+                if not response.tool_calls:
+                    break
+
+                logger.info(
+                    f"第 {round_index} 轮工具调用: {[call.name for call in response.tool_calls]}"
+                )
+                messages.append(LLMMessage(
+                    role=MessageRole.ASSISTANT,
+                    content=response.content or "",
+                    tool_calls=response.tool_calls
+                ))
+                run_call = lambda call: self._run_tool_call(call, state, context, language)
+                if sequential or len(response.tool_calls) == 1:
+                    outputs = [run_call(call) for call in response.tool_calls]
+                else:
+                    outputs = list(_tool_call_executor.map(run_call, response.tool_calls))
+                for call, (output, result) in zip(response.tool_calls, outputs):
+                    messages.append(LLMMessage(role=MessageRole.TOOL, content=output, tool_call_id=call.id))
+                    if result is not None:
+                        execution_results.append(result)
+            else:
+                # 达到轮数上限，要求模型根据已有结果直接回答
+                logger.warning(f"工具调用达到 {AgentConfig.MAX_TOOL_ROUNDS} 轮上限")
+                response = _call_llm(state, self.llm.invoke, messages)
+
+            logger.info(f"工具调用分析完成，执行代码 {len(execution_results)} 次")
+            state["analysis_response"] = response.content
+            state["analysis_done"] = True
+            state["needs_code_execution"] = False
+            state["code_execution_results"] = execution_results
+            state["code_execution_done"] = True
+        except WorkflowCancelled:
+            raise
+        except Exception as e:
+            logger.error(f"工具调用分析过程中出错: {str(e)}", exc_info=True)
+            state["error"] = f"分析过程中出错：{str(e)}"
+
+        return state
+
+    def _run_tool_call(
+        self,
+        call: ToolCall,
+        state: AgentState,
+        context: ExecutionContext,
+        language: str
+    ) -> Tuple[str, Optional[Dict[str, Any]]]:
+        """
+        执行一个工具调用
+
+        Returns:
+            (返回给模型的结果文本, 代码执行结果；非代码执行工具为 None)
+        """
+        if call.name == self.context_tool.name:
+            return self.context_tool._run(state.get("dataframe")), None
+
+        if call.name != self.code_tool.name:
+            return f"未知工具: {call.name}", None
+
+        code = call.arguments.get("code")
+        if not isinstance(code, str) or not code.strip():
+            return "参数错误：缺少 code 参数", None
+
+        if language == "python":
+            try:
+                self.code_tool._validate_code_safety(code)
+            except ValueError as e:
+                result = {"code": code, "output": f"执行错误：{str(e)}", "success": False, "language": language}
+                return result["output"], result
+
+        admission = code_executor.admit(code, context) if language == "python" else Admission(ROUTE_RUN)
+        if admission.route == ROUTE_REJECT:
+            result = _rejected_result(code, admission)
+        elif admission.route == ROUTE_SAMPLE:
+            result = _run_on_sample_only(code, context, admission)
+        else:
+            result = code_executor.execute(code, context, language)
+        output = result["output"]
+        if result.get("note"):
+            output = result["note"] + "\n" + output
+        if not result["success"] and result.get("hints"):
+            output += "\n\n" + format_performance_hints(result["hints"])
+        return output, result
+
+
+def _describe_sample(sample: Dict[str, Any]) -> List[str]:
+    """样本结果的换算说明与误差范围"""
+    lines = []
+    if sample["sample_rows"]:
+        factor = sample["total_rows"] / sample["sample_rows"]
+        lines.append(f"求和、计数等总量类结果约为样本值的 {factor:.1f} 倍。")
+    margins = sample.get("margins") or {}
+    if margins:
+        bounds = "、".join(f"{column} ±{margin:.1%}" for column, margin in list(margins.items())[:5])
+        lines.append(f"均值类结果的 95% 误差范围约为：{bounds}。")
+    return lines
+
+
+def _sample_source(sample: Dict[str, Any]) -> str:
+    strata = sample.get("strata") or []
+    source = f"分层样本（按 {'、'.join(strata)} 分层）" if strata else "随机样本"
+    return f"{sample['sample_rows']:,} / {sample['total_rows']:,} 行的{source}"
+
+
+def _format_provisional_result(index: int, result: Dict[str, Any]) -> str:
+    """格式化样本上的初步结果"""
+    sample = result["sample"]
+    output = result["output"]
+    if len(output) > AgentConfig.PROGRESSIVE_MAX_OUTPUT_CHARS:
+        output = output[:AgentConfig.PROGRESSIVE_MAX_OUTPUT_CHARS] + "\n……"
+    
+    lines = [
+        f"【初步结果】代码块 {index} 基于 {_sample_source(sample)}，完整结果计算中：",
+        f"```\n{output.rstrip()}\n```",
+    ]
+    lines.extend(_describe_sample(sample))
+    return "\n".join(lines) + "\n"
+
+
+def _rejected_result(code: str, admission: Admission) -> Dict[str, Any]:
+    """被准入控制拒绝的代码的执行结果（附带改写提示，交回模型重新生成）"""
+    logger.warning(f"拒绝执行代码: {admission.reason}")
+    return {
+        "code": code,
+        "language": "python",
+        "output": f"执行被拒绝：{admission.reason}，在样本上也无法完成。请改用更高效的写法。",
+        "success": False,
+        "rejected": True,
+        "hints": admission.hints,
+    }
+
+
+def _run_on_sample_only(code: str, context: ExecutionContext, admission: Admission) -> Dict[str, Any]:
+    """完整执行会超时的代码只在样本上执行，结果的 note 标明为样本估计"""
+    strata = group_keys(code, context.columns or [])
+    result = code_executor.execute_sample(code, context, AgentConfig.PROGRESSIVE_SAMPLE_ROWS, strata)
+    sample = result.pop("sample", None)
+    if result["success"] and sample:
+        lines = [f"【样本估计】{admission.reason}，以下结果基于 {_sample_source(sample)}。"]
+        lines.extend(_describe_sample(sample))
+        result["note"] = "\n".join(lines)
+    if admission.hints:
+        result["hints"] = admission.hints
+    return result
 
 
 class CodeExecutionNode:
-    """代码执行节点"""
+    """代码执行节点
+
+    执行前先估计耗时（准入控制）：估计会超出时间上限的代码只在样本上执行，
+    样本上也无法完成的代码被拒绝并带着改写提示交回分析节点。
+    大表或估计耗时较长的代码先在分层样本上执行，通过 event_sink 推送标明为初步结果的思考事件，
+    再在完整数据上执行得到精确结果。
+    """
     
     def __call__(self, state: AgentState) -> AgentState:
         """执行代码"""
         logger.info("开始执行代码执行节点")
         code_blocks = state.get("code_to_execute", [])
-        df = state.get("dataframe")
+        language = state.get("code_language", "python")
         
         if not code_blocks:
             logger.debug("没有代码需要执行")
@@ -267,41 +639,38 @@ class CodeExecutionNode:
         
         execution_results = []
         
+        # 分析节点流式接收响应时已提前提交执行的代码块
+        futures = state.pop("code_execution_futures", None) or []
+        if len(futures) != len(code_blocks):
+            futures = []
+        context = _build_execution_context(state, state.get("analysis_engine", "pandas"))
+        
         for i, code in enumerate(code_blocks):
             logger.debug(f"执行代码块 {i+1}/{len(code_blocks)}")
-            try:
-                # 创建执行环境
-                exec_globals = {
-                    'df': df,
-                    'pd': pd,
-                    'pandas': pd,
-                }
-                
-                # 捕获输出
-                import io
-                import contextlib
-                
-                output_buffer = io.StringIO()
-                
-                with contextlib.redirect_stdout(output_buffer):
-                    exec(code, exec_globals)
-                
-                output = output_buffer.getvalue()
-                execution_results.append({
-                    "code": code,
-                    "output": output,
-                    "success": True
-                })
+            future = futures[i] if futures else None
+            # 提前执行的代码块已经通过准入
+            admission = Admission(ROUTE_RUN)
+            if language == "python" and future is None:
+                admission = code_executor.admit(code, context)
+            
+            if admission.route == ROUTE_REJECT:
+                result = _rejected_result(code, admission)
+            elif admission.route == ROUTE_SAMPLE:
+                result = _run_on_sample_only(code, context, admission)
+            else:
+                if language == "python" and (future is None or not future.done()):
+                    self._run_provisional(code, state, context, i + 1, future, admission)
+                if future is not None:
+                    result = future.result()
+                else:
+                    result = code_executor.execute(code, context, language)
+            execution_results.append(result)
+            
+            if result["success"]:
                 logger.info(f"代码块 {i+1} 执行成功")
-                
-            except Exception as e:
-                logger.error(f"代码块 {i+1} 执行失败: {str(e)}", exc_info=True)
+            else:
+                logger.error(f"代码块 {i+1} 执行失败: {result['output']}")
                 logger.debug(f"失败的代码内容: {code[:200]}...")  # 只记录前200个字符
-                execution_results.append({
-                    "code": code,
-                    "output": f"执行错误：{str(e)}",
-                    "success": False
-                })
         
         state["code_execution_results"] = execution_results
         state["code_execution_done"] = True
@@ -309,7 +678,56 @@ class CodeExecutionNode:
         successful_executions = sum(1 for result in execution_results if result["success"])
         logger.info(f"代码执行完成 - 成功: {successful_executions}/{len(code_blocks)}")
         
+        retries = state.get("code_retries", 0)
+        if successful_executions < len(code_blocks) and retries < AgentConfig.MAX_CODE_RETRIES:
+            # 交回分析节点，带上错误信息和性能提示重新生成代码
+            state["code_retries"] = retries + 1
+            state["retry_results"] = execution_results
+        
         return state
+    
+    def _should_run_progressively(
+        self,
+        code: str,
+        state: AgentState,
+        context: ExecutionContext,
+        admission: Admission
+    ) -> bool:
+        """按行数和准入决定（估计耗时）判断是否先在样本上执行"""
+        if not AgentConfig.PROGRESSIVE_EXECUTION_ENABLED or state.get("event_sink") is None:
+            return False
+        rows = context.rows or 0
+        if rows < 2 * AgentConfig.PROGRESSIVE_SAMPLE_ROWS:
+            return False
+        large = bool(AgentConfig.PROGRESSIVE_MIN_ROWS) and rows >= AgentConfig.PROGRESSIVE_MIN_ROWS
+        if not (large or admission.route == ROUTE_BACKGROUND):
+            return False
+        return code_executor.supports_sampling(code, context)
+    
+    def _run_provisional(
+        self,
+        code: str,
+        state: AgentState,
+        context: ExecutionContext,
+        index: int,
+        future: Optional[Future],
+        admission: Admission
+    ) -> None:
+        """在样本上执行代码并推送初步结果"""
+        if not self._should_run_progressively(code, state, context, admission):
+            return
+        
+        strata = group_keys(code, context.columns or [])
+        result = code_executor.execute_sample(code, context, AgentConfig.PROGRESSIVE_SAMPLE_ROWS, strata)
+        if not result["success"]:
+            logger.debug(f"代码块 {index} 样本执行失败: {result['output']}")
+            return
+        # 完整结果已经得到时不再推送初步结果
+        if future is not None and future.done():
+            return
+        
+        logger.info(f"推送代码块 {index} 的初步结果（样本 {result['sample']['sample_rows']} 行）")
+        state["event_sink"]("thinking", _format_provisional_result(index, result))
 
 
 class ResponseGenerationNode:
@@ -322,7 +740,8 @@ class ResponseGenerationNode:
                 model=AgentConfig.LLM_MODEL,
                 temperature=0.1,
                 fallback_to_mock=AgentConfig.LLM_FALLBACK_TO_MOCK,
-                api_key=AgentConfig.OPENAI_API_KEY if AgentConfig.LLM_PROVIDER == "openai" else None
+                api_key=AgentConfig.OPENAI_API_KEY if AgentConfig.LLM_PROVIDER == "openai" else None,
+                prompt_cache_hints=AgentConfig.LLM_PROMPT_CACHE_HINTS
             )
         except Exception as e:
             logger.warning(f"创建 LLM 实例失败: {str(e)}")
@@ -340,17 +759,18 @@ class ResponseGenerationNode:
             logger.debug("处理非表格相关问题")
             if self.llm:
                 logger.info("使用 LLM 生成非表格相关回答")
-                system_prompt = "你是一个友好的助手，请直接回答用户的问题。"
                 messages = [
-                    LLMMessage(role=MessageRole.SYSTEM, content=system_prompt),
+                    LLMMessage(role=MessageRole.SYSTEM, content=GENERAL_ASSISTANT_PROMPT),
                     LLMMessage(role=MessageRole.USER, content=user_message)
                 ]
                 
                 try:
                     logger.debug(f"发送消息到 LLM: {len(messages)} 条消息")
-                    response = self.llm.invoke(messages)
+                    response = _call_llm(state, self.llm.invoke, messages)
                     logger.info(f"LLM 响应成功，响应长度: {len(response.content)} 字符")
                     state["final_response"] = response.content
+                except WorkflowCancelled:
+                    raise
                 except Exception as e:
                     logger.error(f"LLM 调用失败: {str(e)}", exc_info=True)
                     state["final_response"] = f"抱歉，生成回答时出现错误: {str(e)}"
@@ -367,7 +787,9 @@ class ResponseGenerationNode:
                 final_response += "\n\n## 代码执行结果\n\n"
                 for i, result in enumerate(code_execution_results, 1):
                     final_response += f"### 代码块 {i}\n"
-                    final_response += f"```python\n{result['code']}\n```\n\n"
+                    final_response += f"```{result.get('language', 'python')}\n{result['code']}\n```\n\n"
+                    if result.get('note'):
+                        final_response += f"{result['note']}\n\n"
                     if result['success']:
                         final_response += f"**执行结果：**\n```\n{result['output']}\n```\n\n"
                     else:
@@ -391,7 +813,8 @@ class DirectResponseNode:
                 model=AgentConfig.LLM_MODEL,
                 temperature=0.7,
                 fallback_to_mock=AgentConfig.LLM_FALLBACK_TO_MOCK,
-                api_key=AgentConfig.OPENAI_API_KEY if AgentConfig.LLM_PROVIDER == "openai" else None
+                api_key=AgentConfig.OPENAI_API_KEY if AgentConfig.LLM_PROVIDER == "openai" else None,
+                prompt_cache_hints=AgentConfig.LLM_PROMPT_CACHE_HINTS
             )
         except Exception as e:
             logger.warning(f"创建 LLM 实例失败: {str(e)}")
@@ -402,26 +825,23 @@ class DirectResponseNode:
         logger.info("开始执行直接响应节点")
         user_message = state.get("user_message", "")
         
-        system_prompt = """
-        你是一个友好、专业的助手。用户的问题与数据表格分析无关，
-        请直接回答用户的问题，保持友好和专业的语调。
-        """
-        
         messages = [
-            LLMMessage(role=MessageRole.SYSTEM, content=system_prompt),
+            LLMMessage(role=MessageRole.SYSTEM, content=DIRECT_RESPONSE_PROMPT),
             LLMMessage(role=MessageRole.USER, content=user_message)
         ]
         
         try:
             if self.llm:
                 logger.info("使用 LLM 生成直接回答")
-                response = self.llm.invoke(messages)
+                response = _call_llm(state, self.llm.invoke, messages)
                 state["final_response"] = response.content
             else:
                 logger.warning("未配置 OpenAI API Key，无法生成直接回答")
                 state["final_response"] = "抱歉，当前未配置 OpenAI API Key，无法回答您的问题。请配置 OPENAI_API_KEY 环境变量以获得完整的 AI 功能。"
             state["direct_response_done"] = True
             logger.info("直接响应生成完成")
+        except WorkflowCancelled:
+            raise
         except Exception as e:
             logger.error(f"生成直接回答时出错: {str(e)}")
             state["error"] = f"生成回答时出错：{str(e)}"
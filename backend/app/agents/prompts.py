@@ -0,0 +1,306 @@
+"""Prompt 模板模块
+
+提示词按「静态指令块 → 会话级数据上下文块 → 本轮问题」的顺序组织。
+前两部分在同一会话内逐字节稳定，LLM 提供商可以复用已缓存的前缀。
+"""
+import textwrap
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional
+from app.agents.config import AgentConfig
+from app.core.config import settings
+from app.agents.llm import LLMMessage, MessageRole
+from app.core.logging_config import get_agent_logger
+
+logger = get_agent_logger('prompts')
+
+
+# 意图分类指令
+INTENT_CLASSIFICATION_PROMPT = textwrap.dedent("""
+    你是一个意图分类专家。请判断用户的问题是否与数据表格分析相关。
+
+    表格相关的问题包括但不限于：
+    - 数据统计和分析
+    - 数据查询和筛选
+    - 数据可视化
+    - 字段信息查询
+    - 数据计算和汇总
+    - 趋势分析
+
+    请只回答 "是" 或 "否"。
+""").strip()
+
+# 表格分析静态指令（不包含任何与文件相关的内容）
+TABLE_ANALYSIS_INSTRUCTIONS = textwrap.dedent("""
+    你是一个专业的数据分析师。用户上传了一个数据文件，你需要根据用户的问题进行分析。
+    数据文件的信息会在下一条系统消息中给出。
+
+    请根据用户的问题，分析数据并提供准确的回答。如果需要进行复杂的计算或数据处理，
+    你可以生成 Python 代码来处理数据。数据已经加载到变量 'df' 中。
+
+    如果你需要执行代码来回答问题，请在回答中包含代码块，格式如下：
+    ```python
+    # 你的代码
+    ```
+""").strip()
+
+# SQL 分析静态指令（ANALYSIS_ENGINE=duckdb）
+SQL_ANALYSIS_INSTRUCTIONS = textwrap.dedent("""
+    你是一个专业的数据分析师。用户上传了一个数据文件，你需要根据用户的问题进行分析。
+    数据文件的信息会在下一条系统消息中给出。
+
+    请根据用户的问题，分析数据并提供准确的回答。如果需要进行计算或数据处理，
+    你可以编写 DuckDB SQL 查询。数据在表 data 中，列名包含中文、空格或特殊字符时请用双引号括起来。
+    只能使用 SELECT 查询（可以使用 WITH），不能修改数据或读取其他文件。
+
+    如果你需要执行查询来回答问题，请在回答中包含 SQL 代码块，格式如下：
+    ```sql
+    SELECT ... FROM data ...
+    ```
+""").strip()
+
+# Polars 分析静态指令（ANALYSIS_ENGINE=polars）
+POLARS_ANALYSIS_INSTRUCTIONS = textwrap.dedent("""
+    你是一个专业的数据分析师。用户上传了一个数据文件，你需要根据用户的问题进行分析。
+    数据文件的信息会在下一条系统消息中给出。
+
+    请根据用户的问题，分析数据并提供准确的回答。如果需要进行复杂的计算或数据处理，
+    你可以生成 Polars 代码来处理数据。数据是变量 'lf' 中的 polars LazyFrame，polars 已导入为 'pl'。
+    请用 LazyFrame 构建完整的查询，最后调用 collect(查询) 获取结果并打印，
+    不要对中间结果提前 collect，也不要转换为 pandas。
+
+    如果你需要执行代码来回答问题，请在回答中包含代码块，格式如下：
+    ```python
+    result = collect(lf.group_by("列名").agg(pl.col("数值列").sum()))
+    print(result)
+    ```
+""").strip()
+
+# 工具调用模式静态指令（ANALYSIS_MODE=tools），{code_hint} 按分析引擎填入
+TOOL_ANALYSIS_INSTRUCTIONS = textwrap.dedent("""
+    你是一个专业的数据分析师。用户上传了一个数据文件，你需要根据用户的问题进行分析。
+    数据文件的信息会在下一条系统消息中给出。
+
+    需要计算或处理数据时，请调用 code_execution 工具，不要在回答中写代码块。
+    {code_hint}
+    需要查看列类型、样本数据或数值统计时可以调用 get_data_context 工具。
+    多个互不依赖的计算请在同一轮中同时发起多个工具调用。
+    拿到工具结果后，直接用简洁的文字给出最终回答。
+""").strip()
+
+TOOL_CODE_HINTS = {
+    "pandas": "code 参数是 Python 代码，数据已经加载到变量 'df' 中，请用 print 输出需要的结果。",
+    "polars": "code 参数是 Polars 代码，数据是变量 'lf' 中的 LazyFrame，请用 collect(查询) 获取结果并打印。",
+    "duckdb": "code 参数是 DuckDB SQL 查询，数据在表 data 中，只能使用 SELECT 查询。",
+}
+
+# 列概要说明（pandas 环境，上传时已为每列构建近似统计结构）
+PROFILE_INSTRUCTIONS = textwrap.dedent("""
+    数据行数很多（如超过 10 万行）时，去重计数、中位数/分位数和常见取值的问题可以用预先计算的列概要
+    近似回答，无需扫描 df：
+    - profile['列名'].distinct() 为非空值的去重计数，distinct_interval() 为其 95% 置信区间
+    - profile['列名'].quantile(q)、median() 为分位数，quantile_interval(q) 为误差范围（仅数值列）
+    - profile['列名'].typical_values(n) 为最常见的取值及估计行数，describe() 为该列的概要
+    - profile.rows 为总行数，profile.sample 为均匀随机抽取的行样本（DataFrame）
+    - HyperLogLog、TDigest、ReservoirSample 可以对筛选或分组后的数据构建同样的近似统计（add 加入数据，merge 合并）
+    用概要得到的结果是近似值，请在回答中注明并给出误差范围；用户要求精确结果时请直接用 df 计算。
+""").strip()
+
+# 通用助手指令（表格问题之外的兜底回答）
+GENERAL_ASSISTANT_PROMPT = "你是一个友好的助手，请直接回答用户的问题。"
+
+# 直接响应指令
+DIRECT_RESPONSE_PROMPT = textwrap.dedent("""
+    你是一个友好、专业的助手。用户的问题与数据表格分析无关，
+    请直接回答用户的问题，保持友好和专业的语调。
+""").strip()
+
+
+def build_data_context_block(data_context: Dict[str, Any]) -> str:
+    """
+    构建数据上下文块
+
+    Args:
+        data_context: DataContextNode 生成的数据上下文
+
+    Returns:
+        数据上下文文本
+    """
+    return textwrap.dedent("""
+        数据文件信息：
+        - 文件名：{filename}
+        - 总行数：{total_rows}
+        - 总列数：{total_columns}
+        - 列名：{columns}
+
+        数据预览（前20行）：
+    """).strip().format(
+        filename=data_context.get('filename', 'unknown'),
+        total_rows=data_context.get('total_rows', 0),
+        total_columns=data_context.get('total_columns', 0),
+        columns=', '.join(str(col) for col in data_context.get('columns', [])),
+    ) + "\n" + data_context.get('preview_string', '')
+
+
+class DataContextBlockCache:
+    """会话级数据上下文块缓存
+
+    每个会话的数据上下文块在首次构建后冻结，之后的轮次直接复用同一字符串，
+    保证提示词前缀在会话内不变。
+    """
+
+    _blocks: "OrderedDict[str, str]" = OrderedDict()
+    _lock = threading.Lock()
+
+    @classmethod
+    def get_or_build(cls, session_id: Optional[str], data_context: Dict[str, Any]) -> str:
+        """获取会话的数据上下文块，不存在时构建并冻结"""
+        if not session_id:
+            return build_data_context_block(data_context)
+
+        with cls._lock:
+            block = cls._blocks.get(session_id)
+            if block is not None:
+                cls._blocks.move_to_end(session_id)
+                return block
+
+        block = build_data_context_block(data_context)
+
+        with cls._lock:
+            # 并发构建时以先写入的为准，保证前缀唯一
+            block = cls._blocks.setdefault(session_id, block)
+            cls._blocks.move_to_end(session_id)
+            while len(cls._blocks) > AgentConfig.PROMPT_CACHE_MAX_SESSIONS:
+                cls._blocks.popitem(last=False)
+
+        logger.debug(f"冻结会话数据上下文块: {session_id}, 长度: {len(block)} 字符")
+        return block
+
+    @classmethod
+    def invalidate(cls, session_id: str) -> None:
+        """移除会话的数据上下文块"""
+        with cls._lock:
+            cls._blocks.pop(session_id, None)
+
+
+def build_kernel_variables_block(variables: List[Dict[str, Any]]) -> str:
+    """
+    构建会话内核变量说明
+
+    Args:
+        variables: 内核变量摘要（名称、类型、形状或取值）
+
+    Returns:
+        变量说明文本；没有变量时为空字符串
+    """
+    if not variables:
+        return ""
+
+    lines = ["之前轮次的代码定义的以下变量仍然保留，可以直接使用，无需从 df 重新计算："]
+    for variable in variables[:AgentConfig.KERNEL_MAX_PROMPT_VARIABLES]:
+        description = f"- {variable['name']}: {variable['type']}"
+        if "shape" in variable:
+            description += f"，形状 {tuple(variable['shape'])}"
+        elif "length" in variable:
+            description += f"，长度 {variable['length']}"
+        elif "value" in variable:
+            description += f" = {variable['value']}"
+        lines.append(description)
+    if len(variables) > AgentConfig.KERNEL_MAX_PROMPT_VARIABLES:
+        lines.append(f"- ……另有 {len(variables) - AgentConfig.KERNEL_MAX_PROMPT_VARIABLES} 个变量")
+    return "\n".join(lines)
+
+
+def build_intent_messages(user_message: str) -> List[LLMMessage]:
+    """构建意图分类消息"""
+    return [
+        LLMMessage(role=MessageRole.SYSTEM, content=INTENT_CLASSIFICATION_PROMPT, cache_hint=True),
+        LLMMessage(role=MessageRole.USER, content=f"用户问题：{user_message}")
+    ]
+
+
+def get_analysis_instructions(engine: str = "pandas", mode: str = "code_fence") -> str:
+    """获取分析引擎和分析模式对应的静态指令"""
+    if mode == "tools":
+        instructions = TOOL_ANALYSIS_INSTRUCTIONS.format(
+            code_hint=TOOL_CODE_HINTS.get(engine, TOOL_CODE_HINTS["pandas"])
+        )
+    elif engine == "duckdb":
+        return SQL_ANALYSIS_INSTRUCTIONS
+    elif engine == "polars":
+        return POLARS_ANALYSIS_INSTRUCTIONS
+    else:
+        instructions = TABLE_ANALYSIS_INSTRUCTIONS
+    if engine == "pandas" and settings.column_profile_enabled:
+        instructions += "\n\n" + PROFILE_INSTRUCTIONS
+    return instructions
+
+
+def build_analysis_messages(
+    user_message: str,
+    data_context: Dict[str, Any],
+    session_id: Optional[str] = None,
+    engine: str = "pandas",
+    kernel_variables: Optional[List[Dict[str, Any]]] = None,
+    mode: str = "code_fence"
+) -> List[LLMMessage]:
+    """
+    构建表格分析消息
+
+    Args:
+        user_message: 本轮用户问题
+        data_context: 数据上下文
+        session_id: 会话ID，用于复用冻结的数据上下文块
+        engine: 分析引擎，决定静态指令
+        kernel_variables: 会话内核中保留的变量摘要
+        mode: 分析模式，code_fence 或 tools
+
+    Returns:
+        消息列表：静态指令、数据上下文块（缓存前缀末尾）、内核变量说明（每轮变化）、本轮问题
+    """
+    data_block = DataContextBlockCache.get_or_build(session_id, data_context)
+    messages = [
+        LLMMessage(role=MessageRole.SYSTEM, content=get_analysis_instructions(engine, mode)),
+        LLMMessage(role=MessageRole.SYSTEM, content=data_block, cache_hint=True)
+    ]
+    variables_block = build_kernel_variables_block(kernel_variables or [])
+    if variables_block:
+        messages.append(LLMMessage(role=MessageRole.SYSTEM, content=variables_block))
+    messages.append(LLMMessage(role=MessageRole.USER, content=user_message))
+    return messages
+
+
+def format_performance_hints(hints: List[str]) -> str:
+    """性能提示文本；没有提示时为空字符串"""
+    if not hints:
+        return ""
+    return "性能提示（数据量较大时逐行计算会超时）：\n" + "\n".join(f"- {hint}" for hint in hints)
+
+
+def build_retry_messages(previous_response: str, results: List[Dict[str, Any]]) -> List[LLMMessage]:
+    """
+    构建代码执行失败后的重试消息
+
+    Args:
+        previous_response: 上一次的分析回答（包含执行失败的代码）
+        results: 上一次的代码执行结果
+
+    Returns:
+        追加在分析消息之后的消息：上一次的回答、执行错误与性能提示
+    """
+    lines = ["上面回答中的代码执行失败："]
+    hints: List[str] = []
+    for i, result in enumerate(results, 1):
+        if not result["success"]:
+            lines.append(f"代码块 {i}：{result['output']}")
+        for hint in result.get("hints", []):
+            if hint not in hints:
+                hints.append(hint)
+    hints_block = format_performance_hints(hints)
+    if hints_block:
+        lines.append(hints_block)
+    lines.append("请修正代码后重新给出完整的回答。")
+    return [
+        LLMMessage(role=MessageRole.ASSISTANT, content=previous_response),
+        LLMMessage(role=MessageRole.USER, content="\n\n".join(lines))
+    ]
@@ -0,0 +1,459 @@
+"""简单查询识别模块
+
+不调用 LLM，直接识别并回答常见的简单问题：聚合（求和、平均、最大、最小、中位数、
+计数、去重计数）、分组、筛选、排序和取前 N 项。
+识别过程是保守的：问题中只要有无法解释的内容就返回 None，由调用方回退到 LLM 分析。
+"""
+import re
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+import pandas as pd
+from app.core.logging_config import get_agent_logger
+
+logger = get_agent_logger('query_recognizer')
+
+
+# 聚合关键词（按聚合类型划分）
+AGGREGATION_KEYWORDS: Dict[str, List[str]] = {
+    "sum": ["总和", "求和", "合计", "总计", "总额", "sum", "total"],
+    "mean": ["平均值", "平均数", "平均", "均值", "average", "mean", "avg"],
+    "max": ["最大值", "最大", "最高", "max", "maximum", "highest", "largest"],
+    "min": ["最小值", "最小", "最低", "min", "minimum", "lowest", "smallest"],
+    "median": ["中位数", "median"],
+    "nunique": ["不同值", "不同", "去重", "唯一值", "distinct", "unique"],
+    "count": ["计数", "数量", "个数", "count", "number of"],
+}
+
+# 聚合类型的中文名称
+AGGREGATION_NAMES = {
+    "sum": "总和",
+    "mean": "平均值",
+    "max": "最大值",
+    "min": "最小值",
+    "median": "中位数",
+    "nunique": "不同值个数",
+    "count": "非空计数",
+    "size": "行数",
+}
+
+# 需要数值列的聚合
+NUMERIC_AGGREGATIONS = {"sum", "mean", "median"}
+
+# 行数类问题
+ROW_COUNT_PATTERN = (
+    r"how many (?:rows|records|lines)|number of (?:rows|records)|count of (?:rows|records)"
+    r"|row count|总行数|多少行|行数|多少条(?:数据|记录)?|记录数|数据量"
+)
+
+# 比较运算符（按长度排列，保证优先匹配较长的写法）
+COMPARISON_OPERATORS = {
+    ">=": ">=", "<=": "<=", "!=": "!=", "==": "==", "=": "==", ">": ">", "<": "<",
+    "大于等于": ">=", "小于等于": "<=", "不等于": "!=", "等于": "==", "大于": ">", "小于": "<",
+    "为": "==", "是": "==", "is": "==", "equals": "==",
+}
+
+# 可忽略的词
+STOPWORDS = [
+    "请问", "请", "帮我", "给我", "计算", "算一下", "一下", "求", "查询", "统计", "显示", "列出",
+    "看看", "查看", "是多少", "有多少个", "有多少", "多少个", "多少", "是什么", "分别", "所有", "全部", "数据", "表格",
+    "表中", "总共", "一共", "结果", "其中", "筛选", "只看", "仅", "当", "中", "的", "了", "吗",
+    "呢", "是", "为", "列", "字段", "值", "有",
+    "what's", "whats", "what", "is", "are", "the", "of", "in", "for", "all", "show", "me",
+    "give", "list", "compute", "calculate", "find", "get", "please", "tell", "value", "values",
+    "column", "field", "overall", "where", "with", "whole", "data", "table", "there", "do",
+    "does", "we", "have", "has", "this", "file",
+]
+
+_PLACEHOLDER = "⟦{}⟧"
+_PLACEHOLDER_RE = r"⟦(\d+)⟧"
+_LATIN_RE = re.compile(r"^[A-Za-z0-9_' ]+$")
+
+
+def _phrase_pattern(phrase: str) -> str:
+    """英文短语按单词边界匹配，中文短语直接匹配"""
+    escaped = re.escape(phrase)
+    if _LATIN_RE.match(phrase):
+        return rf"(?<![A-Za-z0-9_]){escaped}(?![A-Za-z0-9_])"
+    return escaped
+
+
+def _alternation(phrases: List[str]) -> str:
+    return "|".join(_phrase_pattern(p) for p in sorted(phrases, key=len, reverse=True))
+
+
+@dataclass
+class QueryFilter:
+    """筛选条件"""
+    column: str
+    operator: str
+    value: Any
+
+    def apply(self, df: pd.DataFrame) -> pd.DataFrame:
+        series = df[self.column]
+        if self.operator == "==":
+            mask = series == self.value
+        elif self.operator == "!=":
+            mask = series != self.value
+        elif self.operator == ">":
+            mask = series > self.value
+        elif self.operator == ">=":
+            mask = series >= self.value
+        elif self.operator == "<":
+            mask = series < self.value
+        else:
+            mask = series <= self.value
+        return df[mask]
+
+    def to_code(self, source: str) -> str:
+        return f"{source}[{source}[{self.column!r}] {self.operator} {self.value!r}]"
+
+    def describe(self) -> str:
+        return f"「{self.column}」{self.operator} {self.value!r}"
+
+
+@dataclass
+class QueryPlan:
+    """识别出的查询计划"""
+    aggregation: Optional[str] = None  # sum/mean/max/min/median/nunique/count/size
+    column: Optional[str] = None
+    group_by: Optional[str] = None
+    filters: List[QueryFilter] = field(default_factory=list)
+    sort_column: Optional[str] = None
+    ascending: Optional[bool] = None
+    limit: Optional[int] = None
+
+    def execute(self, df: pd.DataFrame) -> Any:
+        """在 DataFrame 上执行查询"""
+        data = df
+        for query_filter in self.filters:
+            data = query_filter.apply(data)
+
+        if self.aggregation is None:
+            # 行查询：按列排序后取前 N 行
+            if self.sort_column is not None:
+                data = data.sort_values(self.sort_column, ascending=bool(self.ascending))
+            return data.head(self.limit)
+
+        if self.group_by is not None:
+            grouped = data.groupby(self.group_by)
+            if self.aggregation == "size":
+                result = grouped.size()
+            else:
+                result = getattr(grouped[self.column], self.aggregation)()
+            if self.ascending is not None:
+                result = result.sort_values(ascending=self.ascending)
+            if self.limit is not None:
+                result = result.head(self.limit)
+            return result
+
+        if self.aggregation == "size":
+            return len(data)
+        return getattr(data[self.column], self.aggregation)()
+
+    def to_code(self) -> str:
+        """生成等价的 pandas 代码"""
+        lines = []
+        source = "df"
+        for query_filter in self.filters:
+            lines.append(f"data = {query_filter.to_code(source)}")
+            source = "data"
+
+        if self.aggregation is None:
+            expr = source
+            if self.sort_column is not None:
+                expr += f".sort_values({self.sort_column!r}, ascending={bool(self.ascending)})"
+            expr += f".head({self.limit})"
+        elif self.group_by is not None:
+            expr = f"{source}.groupby({self.group_by!r})"
+            if self.aggregation == "size":
+                expr += ".size()"
+            else:
+                expr += f"[{self.column!r}].{self.aggregation}()"
+            if self.ascending is not None:
+                expr += f".sort_values(ascending={self.ascending})"
+            if self.limit is not None:
+                expr += f".head({self.limit})"
+        elif self.aggregation == "size":
+            expr = f"len({source})"
+        else:
+            expr = f"{source}[{self.column!r}].{self.aggregation}()"
+
+        lines.append(f"print({expr})")
+        return "\n".join(lines)
+
+    def describe(self) -> str:
+        """生成查询的中文描述"""
+        parts = []
+        if self.filters:
+            parts.append("筛选 " + "、".join(f.describe() for f in self.filters) + " 后")
+        if self.aggregation is None:
+            if self.sort_column is not None:
+                order = "升序" if self.ascending else "降序"
+                parts.append(f"按「{self.sort_column}」{order}排列")
+            parts.append(f"{'的' if parts else ''}前 {self.limit} 行")
+            return "".join(parts)
+
+        if self.group_by is not None:
+            parts.append(f"按「{self.group_by}」分组")
+        target = f"「{self.column}」的" if self.column and self.aggregation != "size" else ""
+        parts.append(f"{target}{AGGREGATION_NAMES[self.aggregation]}")
+        if self.limit is not None:
+            parts.append(f"（前 {self.limit} 项）")
+        return "".join(parts)
+
+
+class SimpleQueryRecognizer:
+    """简单查询识别器"""
+
+    def __init__(self, max_rows: int = 20):
+        self.max_rows = max_rows
+        self._aggregation_res = {
+            name: re.compile(_alternation(words), re.IGNORECASE)
+            for name, words in AGGREGATION_KEYWORDS.items()
+        }
+        self._stopword_re = re.compile(_alternation(STOPWORDS), re.IGNORECASE)
+        self._operator_re = _alternation(list(COMPARISON_OPERATORS.keys()))
+
+    def recognize(self, question: str, df: pd.DataFrame) -> Optional[QueryPlan]:
+        """
+        识别问题对应的查询计划
+
+        Args:
+            question: 用户问题
+            df: 会话数据
+
+        Returns:
+            查询计划，不确定时返回 None
+        """
+        columns = [str(col) for col in df.columns]
+        if len(set(columns)) != len(columns) or list(df.columns) != columns:
+            # 重复列名或非字符串列名，交给 LLM 处理
+            return None
+
+        text, mentioned = self._replace_columns(question.strip().lower(), columns)
+        if text is None:
+            return None
+
+        plan = QueryPlan()
+        used = set()
+
+        # 行数类问题
+        text, row_count = self._consume(text, ROW_COUNT_PATTERN)
+
+        # 排序与前 N 项
+        text, plan.sort_column, plan.ascending, plan.limit = self._parse_sort(text, mentioned, used)
+
+        # 分组
+        match = re.search(
+            rf"(?:group(?:ed)? by|for each|by|per|按照|按|每个|每|各个|各)\s*{_PLACEHOLDER_RE}(?:\s*分组)?",
+            text,
+        ) or re.search(rf"{_PLACEHOLDER_RE}\s*分组", text)
+        if match:
+            plan.group_by = mentioned[int(match.group(1))]
+            used.add(int(match.group(1)))
+            text = text[:match.start()] + " " + text[match.end():]
+
+        # 筛选
+        text, filters = self._parse_filters(text, mentioned, used, df)
+        if filters is None:
+            return None
+        plan.filters = filters
+
+        # 聚合
+        found = set()
+        for name, pattern in self._aggregation_res.items():
+            if pattern.search(text):
+                found.add(name)
+                text = pattern.sub(" ", text)
+        if {"count", "nunique"} <= found:
+            found.discard("count")
+        if len(found) > 1:
+            return None
+        aggregation = found.pop() if found else None
+
+        # 剩余的列即为被聚合的列
+        value_columns = [
+            mentioned[int(i)] for i in re.findall(_PLACEHOLDER_RE, text) if int(i) not in used
+        ]
+        text = re.sub(_PLACEHOLDER_RE, " ", text)
+
+        # 问题中不能有无法解释的内容
+        leftover = self._stopword_re.sub(" ", text)
+        leftover = re.sub(r"[\s\?？。，,.!！:：;；\"'“”‘’()（）]+", "", leftover)
+        if leftover:
+            logger.debug(f"存在无法识别的内容: {leftover}")
+            return None
+
+        if not self._resolve(plan, aggregation, row_count, value_columns, df):
+            return None
+
+        logger.debug(f"识别为简单查询: {plan}")
+        return plan
+
+    def _replace_columns(self, text: str, columns: List[str]) -> Tuple[Optional[str], List[str]]:
+        """把问题中出现的列名替换为占位符"""
+        mentioned: List[str] = []
+        for column in sorted(columns, key=len, reverse=True):
+            pattern = re.compile(_phrase_pattern(column.lower()), re.IGNORECASE)
+            if pattern.search(text):
+                text = pattern.sub(_PLACEHOLDER.format(len(mentioned)), text)
+                mentioned.append(column)
+        # 同一列出现多次或列名相互包含时无法可靠解析
+        indexes = re.findall(_PLACEHOLDER_RE, text)
+        if len(indexes) != len(set(indexes)):
+            return None, mentioned
+        return text, mentioned
+
+    @staticmethod
+    def _consume(text: str, pattern: str) -> Tuple[str, bool]:
+        match = re.search(pattern, text, re.IGNORECASE)
+        if not match:
+            return text, False
+        return text[:match.start()] + " " + text[match.end():], True
+
+    def _parse_sort(self, text: str, mentioned: List[str], used: set):
+        """解析排序方向、排序列和前 N 项"""
+        sort_column = None
+        ascending = None
+        limit = None
+
+        match = re.search(
+            rf"(?:sort(?:ed)?|order(?:ed)?|rank(?:ed)?)\s+by\s*{_PLACEHOLDER_RE}", text
+        ) or re.search(
+            rf"(?:按照|按)\s*{_PLACEHOLDER_RE}\s*的?\s*"
+            rf"(?=降序|升序|从高到低|从低到高|从大到小|从小到大|排序|排名|排列)",
+            text,
+        )
+        if match:
+            sort_column = mentioned[int(match.group(1))]
+            used.add(int(match.group(1)))
+            text = text[:match.start()] + " " + text[match.end():]
+
+        match = re.search(r"(?:top|前)\s*(\d+)\s*(?:名|个|项|行|rows?)?", text)
+        if match:
+            limit, ascending = int(match.group(1)), False
+            text = text[:match.start()] + " " + text[match.end():]
+        match = re.search(r"(?:bottom|后)\s*(\d+)\s*(?:名|个|项|行|rows?)?", text)
+        if match:
+            if limit is not None:
+                return text, None, None, None
+            limit, ascending = int(match.group(1)), True
+            text = text[:match.start()] + " " + text[match.end():]
+
+        for pattern, value in (
+            (r"降序|从高到低|从大到小|descending|desc", False),
+            (r"升序|从低到高|从小到大|ascending|asc", True),
+        ):
+            match = re.search(pattern, text)
+            if match:
+                ascending = value
+                text = text[:match.start()] + " " + text[match.end():]
+
+        text, sort_requested = self._consume(text, r"排序|排名|排列|sort(?:ed)?|rank(?:ed)?")
+        if sort_requested and ascending is None:
+            ascending = False
+
+        if limit is not None and limit <= 0:
+            return text, None, None, None
+        return text, sort_column, ascending, limit
+
+    def _parse_filters(self, text: str, mentioned: List[str], used: set, df: pd.DataFrame):
+        """解析筛选条件，返回 None 表示条件无法可靠解析"""
+        filters: List[QueryFilter] = []
+        value_re = r"(?:\"([^\"]*)\"|'([^']*)'|“([^”]*)”|([^\s,，。;；?？⟦⟧的]+))"
+        pattern = re.compile(
+            rf"{_PLACEHOLDER_RE}\s*({self._operator_re})\s*{value_re}", re.IGNORECASE
+        )
+
+        while True:
+            match = pattern.search(text)
+            if not match:
+                break
+            index = int(match.group(1))
+            column = mentioned[index]
+            operator = COMPARISON_OPERATORS[match.group(2).lower()]
+            quoted = next((g for g in match.group(3, 4, 5) if g is not None), None)
+            raw = quoted if quoted is not None else match.group(6)
+
+            value = self._coerce_value(df[column], raw, operator, quoted is not None)
+            if value is None:
+                return text, None
+
+            filters.append(QueryFilter(column=column, operator=operator, value=value))
+            used.add(index)
+            text = text[:match.start()] + " " + text[match.end():]
+
+        return text, filters
+
+    @staticmethod
+    def _coerce_value(series: pd.Series, raw: str, operator: str, quoted: bool) -> Any:
+        """把筛选值转换为列的类型，无法确认时返回 None"""
+        if pd.api.types.is_bool_dtype(series):
+            return None
+        if pd.api.types.is_numeric_dtype(series):
+            if quoted:
+                return None
+            try:
+                number = float(raw)
+            except ValueError:
+                return None
+            return int(number) if number.is_integer() else number
+
+        if operator not in ("==", "!="):
+            return None
+        # 字符串筛选值必须在列中真实存在，避免误解析
+        values = set(series.dropna().astype(str).unique())
+        if raw in values:
+            return raw
+        matches = [v for v in values if v.lower() == raw.lower()]
+        return matches[0] if len(matches) == 1 else None
+
+    def _resolve(
+        self,
+        plan: QueryPlan,
+        aggregation: Optional[str],
+        row_count: bool,
+        value_columns: List[str],
+        df: pd.DataFrame
+    ) -> bool:
+        """根据识别结果补全查询计划，返回是否可以确定地回答"""
+        if len(value_columns) > 1:
+            return False
+        column = value_columns[0] if value_columns else None
+
+        if row_count:
+            if aggregation not in (None, "count") or column is not None:
+                return False
+            aggregation = "size"
+
+        if aggregation is None:
+            # 无聚合时只支持「按某列排序的前 N 行」和「前 N 行」
+            if plan.group_by is not None or plan.limit is None or plan.limit > self.max_rows:
+                return False
+            if column is not None and plan.sort_column is not None:
+                return False
+            plan.sort_column = plan.sort_column or column
+            if plan.sort_column is None:
+                # 「前 N 行」按原始顺序返回
+                plan.ascending = None
+            plan.aggregation = None
+            return True
+
+        if plan.sort_column is not None:
+            return False
+
+        if aggregation == "count" and column is None:
+            aggregation = "size"
+
+        if aggregation != "size":
+            if column is None or column == plan.group_by:
+                return False
+            if aggregation in NUMERIC_AGGREGATIONS and not pd.api.types.is_numeric_dtype(df[column]):
+                return False
+
+        if plan.group_by is None and (plan.limit is not None or plan.ascending is not None):
+            return False
+
+        plan.aggregation = aggregation
+        plan.column = column
+        return True
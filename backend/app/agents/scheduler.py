@@ -0,0 +1,229 @@
+"""工作流并发调度
+
+所有工作流执行前先向调度器申请名额：同时执行的工作流数不超过全局上限，同一会话不超过单会话上限；
+暂时没有名额的请求进入有界等待队列，各会话的请求轮流出队，单个会话的大量请求不会让其他会话一直等待。
+等待队列已满时拒绝新请求，并根据最近工作流的平均耗时给出建议的重试等待时间。
+"""
+import math
+import time
+import asyncio
+from collections import OrderedDict, deque
+from typing import AsyncGenerator, Dict, List, Optional
+from app.agents.config import AgentConfig
+from app.agents.cancellation import CancellationToken, WorkflowCancelled
+from app.core.logging_config import get_agent_logger
+
+logger = get_agent_logger('scheduler')
+
+
+class SchedulerFullError(Exception):
+    """等待队列已满"""
+
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class RunTicket:
+    """一次工作流执行的名额申请"""
+
+    def __init__(self, session_id: str, max_per_session: int):
+        self.session_id = session_id
+        # 本申请所在会话允许同时执行的工作流数
+        self.max_per_session = max_per_session
+        self.granted = False
+        self.released = False
+        # 获得名额或排队位置变化时置位
+        self.updated = asyncio.Event()
+        self.started_at: Optional[float] = None
+
+
+class AgentScheduler:
+    """工作流并发调度器（只在事件循环线程中使用）"""
+
+    # 平均耗时的平滑系数
+    DURATION_ALPHA = 0.2
+
+    def __init__(self, max_running: int, max_per_session: int, max_queued: int, retry_after: int):
+        self.max_running = max(1, max_running)
+        self.max_per_session = max(1, max_per_session)
+        self.max_queued = max(0, max_queued)
+        self.default_retry_after = max(1, retry_after)
+        self._running = 0
+        # 会话ID -> 执行中的申请
+        self._running_by_session: Dict[str, List[RunTicket]] = {}
+        # 会话ID -> 等待中的申请；出队时从前往后找第一个可执行的会话，出队后该会话移到末尾
+        self._waiting: "OrderedDict[str, deque[RunTicket]]" = OrderedDict()
+        self._queued = 0
+        self._average_duration: Optional[float] = None
+
+    @property
+    def running(self) -> int:
+        return self._running
+
+    @property
+    def queued(self) -> int:
+        return self._queued
+
+    def _can_start(self, session_id: str, max_per_session: int) -> bool:
+        """全局名额未满，且会话内执行中的数量低于本申请与执行中各申请的单会话上限中最严格的一个
+
+        例如批量问题（上限较大）执行时，普通对话（上限为 1）要等批量问题全部结束；反之亦然。
+        """
+        running = self._running_by_session.get(session_id, [])
+        limit = min([max_per_session] + [ticket.max_per_session for ticket in running])
+        return self._running < self.max_running and len(running) < limit
+
+    def _start(self, ticket: RunTicket) -> None:
+        ticket.granted = True
+        ticket.started_at = time.monotonic()
+        self._running += 1
+        self._running_by_session.setdefault(ticket.session_id, []).append(ticket)
+        ticket.updated.set()
+
+    def retry_after(self) -> int:
+        """队列已满时建议的重试等待时间（秒）：排在前面的请求按平均耗时分批完成所需的时间"""
+        if self._average_duration is None:
+            return self.default_retry_after
+        batches = (self._queued + 1) / self.max_running
+        return max(1, math.ceil(self._average_duration * batches))
+
+    def reserve(self, session_id: str, max_per_session: Optional[int] = None) -> RunTicket:
+        """
+        申请执行名额：有空闲名额时立即获得，否则进入等待队列
+
+        Args:
+            session_id: 会话ID
+            max_per_session: 本申请使用的单会话并发上限（如批量问题），默认使用调度器的单会话上限；
+                同一会话中上限不同的申请不会同时执行超过其中最严格的上限
+
+        Raises:
+            SchedulerFullError: 等待队列已满
+        """
+        ticket = RunTicket(session_id, max(1, max_per_session or self.max_per_session))
+        # 每次调度后队列中都不再有可以执行的申请，因此本会话没有排队且名额允许时可以直接执行
+        if session_id not in self._waiting and self._can_start(session_id, ticket.max_per_session):
+            self._start(ticket)
+            return ticket
+        if self._queued >= self.max_queued:
+            retry_after = self.retry_after()
+            logger.warning(f"等待队列已满（{self._queued}），拒绝会话 {session_id} 的请求，建议 {retry_after} 秒后重试")
+            raise SchedulerFullError("当前请求过多，请稍后再试", retry_after)
+        self._waiting.setdefault(session_id, deque()).append(ticket)
+        self._queued += 1
+        logger.info(f"会话 {session_id} 的请求进入等待队列，执行中: {self._running}，排队: {self._queued}")
+        self._dispatch()
+        return ticket
+
+    def position(self, ticket: RunTicket) -> int:
+        """按轮转顺序估计的排队位置（从 1 开始，已获得名额时为 0）"""
+        queue = self._waiting.get(ticket.session_id)
+        if ticket.granted or not queue or ticket not in queue:
+            return 0
+        index = queue.index(ticket)
+        sessions = list(self._waiting)
+        order = sessions.index(ticket.session_id)
+        # 每一轮各会话出队一个：排在前面的会话在本申请之前出队 index + 1 个，排在后面的出队 index 个
+        ahead = sum(min(len(self._waiting[sid]), index + 1) for sid in sessions[:order])
+        ahead += sum(min(len(self._waiting[sid]), index) for sid in sessions[order + 1:])
+        return ahead + index + 1
+
+    def _notify_waiting(self) -> None:
+        for queue in self._waiting.values():
+            for waiting in queue:
+                waiting.updated.set()
+
+    def _dispatch(self) -> None:
+        """按会话轮转把等待中的申请转为执行"""
+        changed = False
+        while self._waiting and self._running < self.max_running:
+            session_id = next(
+                (sid for sid, queue in self._waiting.items() if self._can_start(sid, queue[0].max_per_session)),
+                None
+            )
+            if session_id is None:
+                break
+            queue = self._waiting.pop(session_id)
+            ticket = queue.popleft()
+            if queue:
+                # 轮到过的会话排到末尾
+                self._waiting[session_id] = queue
+            self._queued -= 1
+            self._start(ticket)
+            changed = True
+        if changed:
+            self._notify_waiting()
+
+    async def wait(
+        self,
+        ticket: RunTicket,
+        cancel_token: Optional[CancellationToken] = None
+    ) -> AsyncGenerator[int, None]:
+        """
+        等待获得名额，排队位置变化时产出新的位置
+
+        等待期间工作流被取消（如客户端断开）或调用方停止等待时，申请被移出队列。
+
+        Raises:
+            WorkflowCancelled: 等待期间工作流被取消
+        """
+        last_position = None
+        remove_callback = None
+        if cancel_token is not None:
+            loop = asyncio.get_running_loop()
+            remove_callback = cancel_token.add_callback(
+                lambda reason: loop.call_soon_threadsafe(ticket.updated.set)
+            )
+        try:
+            while not ticket.granted:
+                if cancel_token is not None:
+                    cancel_token.raise_if_cancelled()
+                position = self.position(ticket)
+                if position != last_position:
+                    last_position = position
+                    yield position
+                ticket.updated.clear()
+                if ticket.granted:
+                    break
+                await ticket.updated.wait()
+        finally:
+            if remove_callback is not None:
+                remove_callback()
+            if not ticket.granted:
+                self.release(ticket)
+
+    def release(self, ticket: RunTicket) -> None:
+        """归还名额（或放弃排队），唤醒排在后面的申请"""
+        if ticket.released:
+            return
+        ticket.released = True
+        if ticket.granted:
+            self._running -= 1
+            running = self._running_by_session.get(ticket.session_id, [])
+            if ticket in running:
+                running.remove(ticket)
+            if not running:
+                self._running_by_session.pop(ticket.session_id, None)
+            duration = time.monotonic() - ticket.started_at
+            self._average_duration = duration if self._average_duration is None else (
+                self.DURATION_ALPHA * duration + (1 - self.DURATION_ALPHA) * self._average_duration
+            )
+        else:
+            queue = self._waiting.get(ticket.session_id)
+            if queue and ticket in queue:
+                queue.remove(ticket)
+                self._queued -= 1
+                if not queue:
+                    del self._waiting[ticket.session_id]
+            logger.info(f"会话 {ticket.session_id} 的请求已放弃排队")
+            self._notify_waiting()
+        self._dispatch()
+
+
+# 创建全局调度器
+agent_scheduler = AgentScheduler(
+    max_running=AgentConfig.MAX_CONCURRENT_RUNS,
+    max_per_session=AgentConfig.MAX_RUNS_PER_SESSION,
+    max_queued=AgentConfig.MAX_QUEUED_RUNS,
+    retry_after=AgentConfig.SCHEDULER_RETRY_AFTER
+)
@@ -1,17 +1,21 @@
 """表格分析 Agent"""
 import asyncio
-from typing import AsyncGenerator, Dict, Any
+from typing import AsyncGenerator, Dict, Any, Optional
 from langgraph.graph import StateGraph, END
 from app.agents.nodes import (
     AgentState, 
     IntentClassificationNode,
     DataContextNode,
+    QuickAnswerNode,
     TableAnalysisNode,
+    ToolAnalysisNode,
     CodeExecutionNode,
     ResponseGenerationNode,
     DirectResponseNode
 )
 from app.agents.config import AgentConfig
+from app.agents.cancellation import CancellationToken, WorkflowCancelled
+from app.agents.scheduler import RunTicket, SchedulerFullError, agent_scheduler
 from app.models.schemas import ChatStreamEvent, Session
 from app.core.logging_config import get_agent_logger
 
@@ -35,9 +39,11 @@ class TableAnalysisAgent:
         
         # 创建节点实例
         logger.debug("创建节点实例")
-        self.intent_node = IntentClassificationNode()
         self.data_context_node = DataContextNode()
+        self.intent_node = IntentClassificationNode(data_context_node=self.data_context_node)
+        self.quick_answer_node = QuickAnswerNode()
         self.table_analysis_node = TableAnalysisNode()
+        self.tool_analysis_node = ToolAnalysisNode()
         self.code_execution_node = CodeExecutionNode()
         self.response_generation_node = ResponseGenerationNode()
         self.direct_response_node = DirectResponseNode()
@@ -54,7 +60,9 @@ class TableAnalysisAgent:
         # 添加节点
         workflow.add_node("intent_classification", self.intent_node)
         workflow.add_node("data_context", self.data_context_node)
+        workflow.add_node("quick_answer", self.quick_answer_node)
         workflow.add_node("table_analysis", self.table_analysis_node)
+        workflow.add_node("tool_analysis", self.tool_analysis_node)
         workflow.add_node("code_execution", self.code_execution_node)
         workflow.add_node("response_generation", self.response_generation_node)
         workflow.add_node("direct_response", self.direct_response_node)
@@ -72,8 +80,18 @@ class TableAnalysisAgent:
             }
         )
         
-        # 表格分析流程
-        workflow.add_edge("data_context", "table_analysis")
+        # 表格分析流程：简单查询直接回答，其余交由 LLM 分析
+        workflow.add_edge("data_context", "quick_answer")
+        
+        workflow.add_conditional_edges(
+            "quick_answer",
+            self._should_use_llm,
+            {
+                "analyze": "table_analysis",
+                "analyze_with_tools": "tool_analysis",
+                "generate_response": "response_generation"
+            }
+        )
         
         workflow.add_conditional_edges(
             "table_analysis",
@@ -84,7 +102,16 @@ class TableAnalysisAgent:
             }
         )
         
-        workflow.add_edge("code_execution", "response_generation")
+        workflow.add_conditional_edges(
+            "code_execution",
+            self._should_retry_analysis,
+            {
+                "retry": "table_analysis",
+                "generate_response": "response_generation"
+            }
+        )
+        # 工具调用模式在分析节点内完成代码执行
+        workflow.add_edge("tool_analysis", "response_generation")
         
         # 结束节点
         workflow.add_edge("response_generation", END)
@@ -96,27 +123,66 @@ class TableAnalysisAgent:
         """判断是否需要分析表格"""
         return "analyze_table" if state.get("is_table_related", False) else "direct_response"
     
+    def _should_use_llm(self, state: AgentState) -> str:
+        """判断是否需要 LLM 分析，以及使用代码块模式还是工具调用模式"""
+        if state.get("quick_answer_done", False):
+            return "generate_response"
+        return "analyze_with_tools" if AgentConfig.ANALYSIS_MODE.lower() == "tools" else "analyze"
+    
     def _should_execute_code(self, state: AgentState) -> str:
         """判断是否需要执行代码"""
         return "execute_code" if state.get("needs_code_execution", False) else "generate_response"
     
+    def _should_retry_analysis(self, state: AgentState) -> str:
+        """判断代码执行失败后是否重新分析"""
+        return "retry" if state.get("retry_results") else "generate_response"
+    
     async def process_message(
         self, 
         message: str, 
-        session: Session
+        session: Session,
+        cancel_token: Optional[CancellationToken] = None,
+        ticket: Optional[RunTicket] = None,
+        initial_context: Optional[Dict[str, Any]] = None
     ) -> AsyncGenerator[ChatStreamEvent, None]:
-        """处理消息并返回流式响应"""
+        """
+        处理消息并返回流式响应
+
+        工作流执行前先向调度器申请名额（ticket 为调用方预先申请的名额），排队期间推送排队位置。
+        initial_context 为调用方预先准备的状态（如已加载的数据上下文、已确定的意图），对应的节点不再重复处理。
+        事件均由这里构建、字段类型确定，使用 model_construct 跳过 pydantic 校验。
+        cancel_token 被取消（如客户端断开连接）或响应流被提前关闭时，工作流随之取消：
+        不再执行后续节点，进行中的 LLM 调用不再等待，进行中的代码执行被终止。
+        """
+        cancel_token = cancel_token or CancellationToken(f"会话 {session.id}")
         
         try:
+            if ticket is None:
+                ticket = agent_scheduler.reserve(session.id)
+            async for position in agent_scheduler.wait(ticket, cancel_token):
+                yield ChatStreamEvent.model_construct(type="thinking", content=f"当前请求较多，正在排队（第 {position} 位）...\n")
+            
             logger.info(f"开始处理用户消息: {message[:100]}...")
+            # 节点在工作线程中执行，通过 event_sink 推送的中间事件（如初步结果）经队列转发
+            loop = asyncio.get_running_loop()
+            queue: asyncio.Queue = asyncio.Queue()
+            
+            def event_sink(event_type: str, content: str) -> None:
+                event = ChatStreamEvent.model_construct(type=event_type, content=content)
+                loop.call_soon_threadsafe(queue.put_nowait, ("event", event))
+            
             # 初始化状态
             initial_state = AgentState({
                 "user_message": message,
                 "file_info": session.file_info,
-                "session_id": session.id
+                "session_id": session.id,
+                "event_sink": event_sink,
+                "cancel_token": cancel_token
             })
+            if initial_context:
+                initial_state.update(initial_context)
             
-            yield ChatStreamEvent(type="thinking", content="正在分析您的问题...\n")
+            yield ChatStreamEvent.model_construct(type="thinking", content="正在分析您的问题...\n")
             await asyncio.sleep(0.3)
             
             # 使用 langgraph 工作流的流式执行
@@ -124,53 +190,70 @@ class TableAnalysisAgent:
             
             # 使用 workflow.astream() 进行流式执行
             logger.info("开始工作流执行")
-            async for chunk in self.workflow.astream(initial_state):
-                # 获取当前节点名称
-                node_name = list(chunk.keys())[0] if chunk else None
-                
-                if node_name:
-                    logger.debug(f"执行节点: {node_name}")
-                    # 发送节点执行状态
-                    thinking_message = self._get_thinking_message(node_name)
-                    if thinking_message:
-                        yield ChatStreamEvent(
-                            type="thinking",
-                            content=thinking_message
+            workflow_task = asyncio.create_task(self._run_workflow(initial_state, queue))
+            remove_cancel_callback = cancel_token.add_callback(
+                lambda reason: loop.call_soon_threadsafe(queue.put_nowait, ("cancelled", reason))
+            )
+            try:
+                async for chunk in self._drain(queue):
+                    if isinstance(chunk, ChatStreamEvent):
+                        yield chunk
+                        continue
+                    # 获取当前节点名称
+                    node_name = list(chunk.keys())[0] if chunk else None
+                    
+                    if node_name:
+                        logger.debug(f"执行节点: {node_name}")
+                        # 发送节点执行状态
+                        thinking_message = self._get_thinking_message(node_name)
+                        if thinking_message:
+                            yield ChatStreamEvent.model_construct(
+                                type="thinking",
+                                content=thinking_message
+                            )
+                    
+                    # 检查是否有错误
+                    current_state = chunk.get(node_name, {}) if node_name else {}
+                    # 确保 current_state 不为 None
+                    if current_state is None:
+                        current_state = {}
+                    
+                    if current_state and current_state.get("error"):
+                        logger.error(f"节点 {node_name} 执行出错: {current_state['error']}")
+                        yield ChatStreamEvent.model_construct(
+                            type="error",
+                            content=current_state["error"]
                         )
-                
-                # 检查是否有错误
-                current_state = chunk.get(node_name, {}) if node_name else {}
-                # 确保 current_state 不为 None
-                if current_state is None:
-                    current_state = {}
-                
-                if current_state and current_state.get("error"):
-                    logger.error(f"节点 {node_name} 执行出错: {current_state['error']}")
-                    yield ChatStreamEvent(
-                        type="error",
-                        content=current_state["error"]
-                    )
-                    return
-                
-                # 保存最终状态，确保不为 None
-                if current_state:
-                    final_state = current_state
+                        return
+                    
+                    # 保存最终状态，确保不为 None
+                    if current_state:
+                        final_state = current_state
+            except (GeneratorExit, asyncio.CancelledError):
+                cancel_token.cancel("响应流已关闭")
+                raise
+            finally:
+                remove_cancel_callback()
+                if not workflow_task.done():
+                    # 提前结束时终止仍在进行的 LLM 调用和代码执行
+                    cancel_token.cancel("工作流提前结束")
+                    workflow_task.cancel()
             
             # 检查最终状态
             if not final_state:
                 logger.error("工作流执行失败，未获得最终状态")
-                yield ChatStreamEvent(type="error", content="工作流执行失败")
+                yield ChatStreamEvent.model_construct(type="error", content="工作流执行失败")
                 return
             
             # 确保 final_state 是字典类型
             if not isinstance(final_state, dict):
                 logger.error(f"最终状态类型错误: {type(final_state)}")
-                yield ChatStreamEvent(type="error", content="工作流状态错误")
+                yield ChatStreamEvent.model_construct(type="error", content="工作流状态错误")
                 return
             
             if final_state.get("error"):
                 logger.error(f"工作流执行出错: {final_state['error']}")
-                yield ChatStreamEvent(type="error", content=final_state["error"])
+                yield ChatStreamEvent.model_construct(type="error", content=final_state["error"])
                 return
             
             # 流式输出最终响应
@@ -181,22 +264,54 @@ class TableAnalysisAgent:
             response_parts = self._split_response(final_response)
             
             for part in response_parts:
-                yield ChatStreamEvent(type="response", content=part)
+                yield ChatStreamEvent.model_construct(type="response", content=part)
                 await asyncio.sleep(0.1)
             
             # 完成信号
-            yield ChatStreamEvent(type="done")
+            yield ChatStreamEvent.model_construct(type="done")
             
+        except SchedulerFullError as e:
+            yield ChatStreamEvent.model_construct(type="error", content=f"{str(e)}（建议 {e.retry_after} 秒后重试）")
+        except WorkflowCancelled:
+            logger.info(f"消息处理已取消: {cancel_token.reason}")
+            yield ChatStreamEvent.model_construct(type="error", content=f"分析已取消：{cancel_token.reason}")
         except Exception as e:
             logger.error(f"处理消息时出错: {str(e)}", exc_info=True)
-            yield ChatStreamEvent(type="error", content=f"处理消息时出错：{str(e)}")
+            yield ChatStreamEvent.model_construct(type="error", content=f"处理消息时出错：{str(e)}")
+        finally:
+            if ticket is not None:
+                agent_scheduler.release(ticket)
+    
+    async def _run_workflow(self, initial_state: AgentState, queue: asyncio.Queue) -> None:
+        """执行工作流，把每个节点的输出放入队列"""
+        try:
+            async for chunk in self.workflow.astream(initial_state):
+                await queue.put(("chunk", chunk))
+        except Exception as e:
+            await queue.put(("error", e))
+        finally:
+            await queue.put(("end", None))
+    
+    async def _drain(self, queue: asyncio.Queue) -> AsyncGenerator[Any, None]:
+        """按到达顺序取出节点输出和中间事件，工作流出错时重新抛出异常，取消时抛出 WorkflowCancelled"""
+        while True:
+            kind, item = await queue.get()
+            if kind == "end":
+                return
+            if kind == "error":
+                raise item
+            if kind == "cancelled":
+                raise WorkflowCancelled(f"工作流已取消：{item}")
+            yield item
     
     def _get_thinking_message(self, node_name: str) -> str:
         """根据节点名称生成思考消息"""
         thinking_messages = {
             "intent_classification": "正在判断问题类型...\n",
             "data_context": "检测到表格分析问题，正在加载数据...\n",
+            "quick_answer": "正在识别查询类型...\n",
             "table_analysis": "正在分析数据并生成回答...\n",
+            "tool_analysis": "正在调用工具分析数据...\n",
             "code_execution": "正在执行数据分析代码...\n",
             "response_generation": "正在整理分析结果...\n",
             "direct_response": "正在生成回答...\n"
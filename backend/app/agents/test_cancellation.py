@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""测试工作流取消令牌"""
+
+import os
+import sys
+import time
+import threading
+# 添加项目根目录到 Python 路径
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '../..'))
+
+import pytest
+
+from app.agents.cancellation import CancellationToken, WorkflowCancelled
+from app.agents.execution import CodeExecutor, ExecutionContext
+from app.agents.nodes import AgentState, IntentClassificationNode
+
+
+def test_cancel_runs_callbacks_once():
+    """取消时调用已注册的回调，注销的回调和重复取消不再触发"""
+    token = CancellationToken()
+    calls = []
+    token.add_callback(lambda reason: calls.append(("a", reason)))
+    remove = token.add_callback(lambda reason: calls.append(("b", reason)))
+    remove()
+
+    assert token.cancel("客户端断开连接")
+    assert not token.cancel("服务关闭")
+    assert calls == [("a", "客户端断开连接")]
+    assert token.reason == "客户端断开连接"
+
+    # 取消后注册的回调立即调用
+    token.add_callback(lambda reason: calls.append(("c", reason)))
+    assert calls[-1] == ("c", "客户端断开连接")
+    with pytest.raises(WorkflowCancelled):
+        token.raise_if_cancelled()
+
+
+def test_run_stops_waiting_on_cancel():
+    """阻塞调用进行中被取消时立即返回，不等待调用结束"""
+    token = CancellationToken()
+    assert token.run(lambda x: x * 2, 21) == 42
+
+    release = threading.Event()
+    threading.Timer(0.05, token.cancel, args=("客户端断开连接",)).start()
+    started = time.perf_counter()
+    with pytest.raises(WorkflowCancelled):
+        token.run(release.wait, 5)
+    assert time.perf_counter() - started < 1
+    release.set()
+
+    with pytest.raises(WorkflowCancelled):
+        token.run(lambda: 1)
+
+
+def test_cancelled_execution_is_skipped():
+    """工作流已取消时不再执行代码"""
+    token = CancellationToken()
+    token.cancel("客户端断开连接")
+    executor = CodeExecutor(mode="inline")
+    result = executor.execute("print(1)", ExecutionContext(cancel_token=token))
+    assert not result["success"] and result["cancelled"]
+
+
+def test_cancel_during_intent_classification_stops_workflow():
+    """意图分类的 LLM 调用进行中被取消时抛出 WorkflowCancelled，而不是按表格问题继续执行"""
+    release = threading.Event()
+
+    class BlockingLLM:
+        def invoke(self, messages):
+            release.wait(5)
+
+    node = IntentClassificationNode()
+    node.llm = BlockingLLM()
+    token = CancellationToken()
+    threading.Timer(0.05, token.cancel, args=("客户端断开连接",)).start()
+    state = AgentState({"user_message": "你好", "cancel_token": token})
+    try:
+        with pytest.raises(WorkflowCancelled):
+            node(state)
+    finally:
+        release.set()
+    assert "is_table_related" not in state
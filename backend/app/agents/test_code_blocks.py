@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+"""测试代码块增量解析"""
+
+import os
+import sys
+# 添加项目根目录到 Python 路径
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '../..'))
+
+from app.agents.code_blocks import CodeFenceParser, extract_code_blocks
+
+
+RESPONSE = (
+    "先统计各地区：\n"
+    "```python\n"
+    "print(df.groupby('region')['price'].sum())\n"
+    "```\n"
+    "再看均值：\n"
+    "```python\n"
+    "print(df['price'].mean())\n"
+    "```\n"
+    "```sql\n"
+    "SELECT 1\n"
+    "```"
+)
+
+
+def test_chunked_feed_matches_full_extraction():
+    """任意切分输入，结果与一次性提取相同"""
+    expected = extract_code_blocks(RESPONSE)
+    assert expected == [
+        "print(df.groupby('region')['price'].sum())",
+        "print(df['price'].mean())",
+    ]
+
+    for size in (1, 3, 7, 16):
+        parser = CodeFenceParser()
+        blocks = []
+        for i in range(0, len(RESPONSE), size):
+            blocks += parser.feed(RESPONSE[i:i + size])
+        blocks += parser.close()
+        assert blocks == expected
+
+
+def test_block_returned_when_fence_closes():
+    """代码块闭合所在的行结束时立即返回"""
+    parser = CodeFenceParser()
+    assert parser.feed("```python\nx = 1\n``") == []
+    assert parser.feed("`") == []
+    assert parser.feed("\n后续说明") == ["x = 1"]
+
+
+def test_language_and_unclosed_block():
+    """只提取指定语言，未闭合的代码块被忽略"""
+    assert extract_code_blocks(RESPONSE, "sql") == ["SELECT 1"]
+    assert extract_code_blocks("```python\nprint(1)\n") == []
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""测试简单查询识别"""
+
+import os
+import sys
+# 添加项目根目录到 Python 路径
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '../..'))
+
+import pandas as pd
+import pytest
+
+from app.agents.query_recognizer import SimpleQueryRecognizer
+
+
+@pytest.fixture
+def df():
+    return pd.DataFrame({
+        "region": ["east", "west", "east", "north"] * 5,
+        "price": list(range(20)),
+        "销售额": [x * 1.5 for x in range(20)],
+    })
+
+
+@pytest.fixture
+def recognizer():
+    return SimpleQueryRecognizer()
+
+
+@pytest.mark.parametrize("question, expected", [
+    ("总和 of 销售额", 285.0),
+    ("销售额的平均值是多少", 14.25),
+    ("how many rows", 20),
+    ("数据有多少行", 20),
+    ("region为east的销售额总和", 135.0),
+    ("price > 10 的行数", 9),
+    ("有多少个不同的region", 3),
+])
+def test_scalar_questions(recognizer, df, question, expected):
+    """标量类问题应直接得出结果"""
+    plan = recognizer.recognize(question, df)
+    assert plan is not None
+    assert plan.execute(df) == pytest.approx(expected)
+
+
+def test_group_by_with_sort_and_limit(recognizer, df):
+    """分组、排序和前 N 项"""
+    plan = recognizer.recognize("按region分组的price最大值，降序前2名", df)
+    assert plan is not None
+    result = plan.execute(df)
+    assert list(result.index) == ["north", "east"]
+    assert plan.to_code() == (
+        "print(df.groupby('region')['price'].max().sort_values(ascending=False).head(2))"
+    )
+
+
+def test_average_by_english(recognizer, df):
+    """英文分组问题"""
+    plan = recognizer.recognize("average price by region", df)
+    assert plan is not None
+    assert plan.execute(df)["north"] == pytest.approx(11.0)
+
+
+@pytest.mark.parametrize("question", [
+    "销售额增长趋势",
+    "price和销售额的总和",
+    "region为south的销售额总和",
+    "region的总和",
+    "你好",
+])
+def test_falls_back_when_unsure(recognizer, df, question):
+    """无法确定时应回退到 LLM"""
+    assert recognizer.recognize(question, df) is None
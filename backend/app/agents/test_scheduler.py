@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""测试工作流并发调度"""
+
+import os
+import sys
+# 添加项目根目录到 Python 路径
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '../..'))
+
+import asyncio
+import pytest
+
+from app.agents.cancellation import CancellationToken, WorkflowCancelled
+from app.agents.scheduler import AgentScheduler, SchedulerFullError
+
+
+def test_round_robin_and_caps():
+    """名额满时排队，各会话轮流出队，同一会话不超过单会话上限"""
+    scheduler = AgentScheduler(max_running=2, max_per_session=1, max_queued=4, retry_after=7)
+    a1 = scheduler.reserve("a")
+    b1 = scheduler.reserve("b")
+    assert a1.granted and b1.granted
+
+    a2, a3 = scheduler.reserve("a"), scheduler.reserve("a")
+    c1 = scheduler.reserve("c")
+    assert not any(t.granted for t in (a2, a3, c1))
+    # 轮转顺序：a2, c1, a3
+    assert [scheduler.position(t) for t in (a2, c1, a3)] == [1, 2, 3]
+
+    scheduler.reserve("d")
+    with pytest.raises(SchedulerFullError) as error:
+        scheduler.reserve("e")
+    assert error.value.retry_after == 7
+
+    # b 完成后 a 仍占着单会话名额，轮到 c
+    scheduler.release(b1)
+    assert c1.granted and not a2.granted
+    scheduler.release(a1)
+    assert a2.granted and not a3.granted
+    assert scheduler.running == 2
+
+
+def test_mixed_session_caps_use_strictest():
+    """批量问题与普通对话不会在同一会话中重叠执行"""
+    scheduler = AgentScheduler(max_running=8, max_per_session=1, max_queued=8, retry_after=1)
+    turn = scheduler.reserve("a")
+    batch = [scheduler.reserve("a", max_per_session=3) for _ in range(3)]
+    assert turn.granted and not any(t.granted for t in batch)
+
+    scheduler.release(turn)
+    assert all(t.granted for t in batch)
+    # 批量问题执行中，普通对话等待；排在它后面的批量问题也不会插队
+    later_turn = scheduler.reserve("a")
+    later_batch = scheduler.reserve("a", max_per_session=3)
+    scheduler.release(batch[0])
+    assert not later_turn.granted and not later_batch.granted
+    for ticket in batch[1:]:
+        scheduler.release(ticket)
+    assert later_turn.granted and not later_batch.granted
+
+
+def test_wait_reports_position_and_abandons_on_cancel():
+    """等待期间推送排队位置，取消后申请移出队列"""
+    async def scenario():
+        scheduler = AgentScheduler(max_running=1, max_per_session=1, max_queued=4, retry_after=1)
+        first = scheduler.reserve("a")
+        waiting = scheduler.reserve("b")
+        cancelled = scheduler.reserve("c")
+        token = CancellationToken()
+
+        positions = []
+
+        async def wait_first():
+            async for position in scheduler.wait(waiting):
+                positions.append(position)
+
+        async def wait_cancelled():
+            async for _ in scheduler.wait(cancelled, token):
+                pass
+
+        waiter = asyncio.create_task(wait_first())
+        abandoned = asyncio.create_task(wait_cancelled())
+        await asyncio.sleep(0.01)
+        token.cancel("客户端断开连接")
+        with pytest.raises(WorkflowCancelled):
+            await abandoned
+        assert scheduler.queued == 1
+
+        scheduler.release(first)
+        await asyncio.wait_for(waiter, 1)
+        assert waiting.granted
+        return positions
+
+    assert asyncio.run(scenario()) == [1]
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""测试工具调用分析模式"""
+
+import os
+import sys
+# 添加项目根目录到 Python 路径
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '../..'))
+
+import pandas as pd
+import pytest
+
+from app.agents import nodes
+from app.agents.execution import CodeExecutor
+from app.agents.llm import LLMProvider, LLMResponse, MessageRole, ToolCall
+
+
+class ScriptedProvider(LLMProvider):
+    """按顺序返回预设响应，并记录每次收到的消息"""
+
+    def __init__(self, responses):
+        super().__init__("scripted")
+        self.responses = list(responses)
+        self.calls = []
+
+    def invoke(self, messages):
+        self.calls.append(("invoke", list(messages)))
+        return LLMResponse(content="根据已有结果作答")
+
+    def invoke_with_tools(self, messages, tools):
+        self.calls.append(("tools", list(messages)))
+        return self.responses.pop(0)
+
+    def is_available(self):
+        return True
+
+
+@pytest.fixture
+def state(monkeypatch):
+    monkeypatch.setattr(nodes, "code_executor", CodeExecutor(mode="inline"))
+    df = pd.DataFrame({"region": ["east", "west", "east"], "price": [1, 2, 3]})
+    return nodes.AgentState({
+        "user_message": "各地区价格合计和总行数",
+        "dataframe": df,
+        "data_context": {
+            "filename": "d.csv",
+            "total_rows": 3,
+            "total_columns": 2,
+            "columns": ["region", "price"],
+            "dtypes": df.dtypes.to_dict(),
+            "preview_string": df.to_string(),
+        },
+    })
+
+
+def _node(responses):
+    node = nodes.ToolAnalysisNode()
+    node.llm = ScriptedProvider(responses)
+    return node
+
+
+def test_parallel_tool_calls_feed_results_back(state):
+    """同一轮的多个工具调用都被执行，结果按调用ID返回给模型"""
+    node = _node([
+        LLMResponse(content="", tool_calls=[
+            ToolCall(id="a", name="code_execution",
+                     arguments={"code": "print(df.groupby('region')['price'].sum().to_dict())"}),
+            ToolCall(id="b", name="code_execution", arguments={"code": "print(len(df))"}),
+            ToolCall(id="c", name="get_data_context"),
+        ]),
+        LLMResponse(content="east 合计 4，west 合计 2，共 3 行"),
+    ])
+
+    state = node(state)
+
+    assert state["analysis_response"] == "east 合计 4，west 合计 2，共 3 行"
+    assert not state["needs_code_execution"]
+    assert [r["output"].strip() for r in state["code_execution_results"]] == ["{'east': 4, 'west': 2}", "3"]
+
+    _, final_messages = node.llm.calls[-1]
+    assert final_messages[-4].role == MessageRole.ASSISTANT
+    assert len(final_messages[-4].tool_calls) == 3
+    tool_messages = final_messages[-3:]
+    assert [m.tool_call_id for m in tool_messages] == ["a", "b", "c"]
+    assert "数据形状: 3 行 x 2 列" in tool_messages[2].content
+
+
+def test_unsafe_code_is_rejected(state):
+    """未通过安全检查的代码不会执行"""
+    node = _node([
+        LLMResponse(content="", tool_calls=[
+            ToolCall(id="a", name="code_execution", arguments={"code": "import os\nprint(os.getcwd())"}),
+        ]),
+        LLMResponse(content="无法执行"),
+    ])
+
+    state = node(state)
+
+    result = state["code_execution_results"][0]
+    assert not result["success"]
+    assert "危险的导入" in result["output"]
+
+
+def test_round_limit_forces_answer(state, monkeypatch):
+    """达到轮数上限后不再提供工具，要求模型直接回答"""
+    monkeypatch.setattr(nodes.AgentConfig, "MAX_TOOL_ROUNDS", 1)
+    node = _node([
+        LLMResponse(content="", tool_calls=[
+            ToolCall(id="a", name="code_execution", arguments={"code": "print(1)"}),
+        ]),
+    ])
+
+    state = node(state)
+
+    assert state["analysis_response"] == "根据已有结果作答"
+    assert [kind for kind, _ in node.llm.calls] == ["tools", "invoke"]
+
+
+def test_kernel_tool_calls_run_in_order(state, monkeypatch):
+    """使用会话内核时同一轮的工具调用按顺序依次执行，后面的调用可以使用前面定义的变量"""
+    monkeypatch.setattr(nodes.AgentConfig, "SESSION_KERNELS_ENABLED", True)
+    monkeypatch.setattr(nodes, "_tool_call_executor", None)
+    state["session_id"] = "kernel-tools"
+    node = _node([
+        LLMResponse(content="", tool_calls=[
+            ToolCall(id="a", name="code_execution", arguments={"code": "total = df['price'].sum()"}),
+            ToolCall(id="b", name="code_execution", arguments={"code": "print(total * 2)"}),
+        ]),
+        LLMResponse(content="合计的两倍是 12"),
+    ])
+
+    state = node(state)
+
+    assert [r["success"] for r in state["code_execution_results"]] == [True, True]
+    assert state["code_execution_results"][1]["output"].strip() == "12"
+    assert "total" in [v["name"] for v in nodes.code_executor.get_kernel_variables("kernel-tools")]
@@ -5,7 +5,7 @@ import io
 import contextlib
 import traceback
 import pandas as pd
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, Optional
 from langchain.tools import BaseTool
 from pydantic import BaseModel, Field
 
@@ -150,6 +150,49 @@ class DataContextTool(BaseTool):
         return "\n".join(context_info)
 
 
+# 不同分析引擎下 code_execution 工具 code 参数的说明
+CODE_ARGUMENT_DESCRIPTIONS = {
+    "pandas": "要执行的 Python 代码，数据是变量 'df' 中的 pandas DataFrame，用 print 输出结果",
+    "polars": "要执行的 Polars 代码，数据是变量 'lf' 中的 LazyFrame，用 collect(查询) 获取结果并 print 输出",
+    "duckdb": "要执行的 DuckDB SQL 查询，只能使用 SELECT，数据在表 data 中",
+}
+
+
+def _tool_spec(tool: BaseTool, parameters: Dict[str, Any], description: Optional[str] = None) -> Dict[str, Any]:
+    """转换为 OpenAI function calling 格式的工具定义"""
+    return {
+        "type": "function",
+        "function": {
+            "name": tool.name,
+            "description": description or " ".join(tool.description.split()),
+            "parameters": parameters,
+        },
+    }
+
+
+def build_tool_specs(engine: str = "pandas") -> List[Dict[str, Any]]:
+    """
+    构建提供给模型的工具定义
+
+    执行上下文（df 等）由服务端提供，不作为模型可填写的参数。
+
+    Args:
+        engine: 分析引擎，决定 code_execution 执行的代码类型
+    """
+    code_description = CODE_ARGUMENT_DESCRIPTIONS.get(engine, CODE_ARGUMENT_DESCRIPTIONS["pandas"])
+    code_parameters = {
+        "type": "object",
+        "properties": {"code": {"type": "string", "description": code_description}},
+        "required": ["code"],
+    }
+    # 工具自带的说明针对 pandas，其他引擎改用对应的代码说明
+    description = None if engine == "pandas" else f"执行代码并返回结果。{code_description}"
+    return [
+        _tool_spec(CodeExecutionTool(), code_parameters, description),
+        _tool_spec(DataContextTool(), {"type": "object", "properties": {}}),
+    ]
+
+
 def create_agent_tools(df: Optional[pd.DataFrame] = None) -> list:
     """创建 Agent 工具列表"""
     tools = [CodeExecutionTool()]
@@ -1,7 +1,7 @@
 # API 路由模块
 from fastapi import APIRouter
 from app.core.logging_config import get_api_logger
-from . import upload, chat
+from . import upload, chat, ws
 
 logger = get_api_logger("routes")
 
@@ -11,5 +11,6 @@ router = APIRouter()
 # 包含子路由
 router.include_router(upload.router, tags=["upload"])
 router.include_router(chat.router, tags=["chat"])
+router.include_router(ws.router, tags=["ws"])
 
 logger.info("API 路由模块初始化完成")
@@ -1,11 +1,17 @@
-import json
-import uuid
-from datetime import datetime
-from fastapi import APIRouter, HTTPException
+from typing import Optional
+from fastapi import APIRouter, HTTPException, Header, Request
 from fastapi.responses import StreamingResponse
-from app.models.schemas import ChatRequest, Message, ErrorResponse
+from app.models.schemas import BatchChatRequest, ChatRequest, ErrorResponse
 from app.services.session_service import SessionService
-from app.services.chat_service import ChatService
+from app.services.job_service import JobService
+from app.services.batch_service import BatchService
+from app.services.stream_service import StreamService
+from app.api.sse import SSE_HEADERS, event_stream, parse_last_event_id
+from app.agents.llm import usage_tracker
+from app.agents.prompts import DataContextBlockCache
+from app.agents.execution import code_executor
+from app.agents.scheduler import SchedulerFullError
+from app.agents.config import AgentConfig
 from app.core.logging_config import get_api_logger
 
 logger = get_api_logger("chat")
@@ -13,12 +19,26 @@ logger = get_api_logger("chat")
 router = APIRouter()
 
 
+def _message_stream_response(message_id: str, http_request: Request, after: int = 0) -> StreamingResponse:
+    """订阅消息流的 SSE 响应"""
+    return StreamingResponse(
+        event_stream(StreamService.subscribe(message_id, after), is_disconnected=http_request.is_disconnected),
+        media_type="text/event-stream",
+        headers={**SSE_HEADERS, "X-Message-Id": message_id},
+    )
+
+
 @router.post("/chat/stream")
-async def stream_chat(request: ChatRequest):
+async def stream_chat(request: ChatRequest, http_request: Request):
     """
     流式聊天接口
 
-    接收用户消息，返回 Server-Sent Events (SSE) 格式的流式响应
+    接收用户消息，返回 Server-Sent Events (SSE) 格式的流式响应。
+    每个事件带有递增的 id，AI 消息ID 通过 X-Message-Id 响应头返回；
+    连接断开后工作流继续执行，可通过 GET /chat/stream/{message_id} 从断点继续接收；
+    在 stream_disconnect_grace 秒内没有重连时工作流被取消。
+    执行名额已满时排队并推送排队位置，等待队列也已满时返回 429 和 Retry-After。
+    同一会话的各轮对话由调度器按提交顺序依次执行；短时间内重复提交的相同消息复用已有的消息流。
     """
     logger.info(f"收到聊天请求，会话ID: {request.session_id}")
     # 验证会话
@@ -27,73 +47,138 @@ async def stream_chat(request: ChatRequest):
         logger.warning(f"会话不存在: {request.session_id}")
         raise HTTPException(status_code=404, detail="会话不存在")
 
-    # 添加用户消息
-    logger.debug(f"添加用户消息: {request.message[:100]}...")
-    user_message = Message(
-        id=str(uuid.uuid4()),
-        type="user",
-        content=request.message,
-        timestamp=datetime.now().isoformat(),
-    )
-    SessionService.add_message(request.session_id, user_message)
-
-    # 创建 AI 消息占位符
-    ai_message = Message(
-        id=str(uuid.uuid4()),
-        type="assistant",
-        content="",
-        thinking="",
-        timestamp=datetime.now().isoformat(),
-    )
-    SessionService.add_message(request.session_id, ai_message)
-
-    async def generate_response():
-        """生成流式响应"""
-        try:
-            logger.debug("开始生成流式响应")
-            current_thinking = ""
-            current_response = ""
-
-            async for event in ChatService.process_message(request.message, session):
-                # 更新消息内容
-                if event.type == "thinking" and event.content:
-                    current_thinking += event.content
-                    SessionService.update_last_message(
-                        request.session_id,
-                        content=current_response,
-                        thinking=current_thinking,
-                    )
-                elif event.type == "response" and event.content:
-                    current_response += event.content
-                    SessionService.update_last_message(
-                        request.session_id,
-                        content=current_response,
-                        thinking=current_thinking,
-                    )
-
-                # 发送 SSE 事件
-                yield f"data: {json.dumps(event.dict())}\n\n"
-
-            # 发送完成信号
-            logger.info("聊天响应生成完成")
-            yield "data: [DONE]\n\n"
-
-        except Exception as e:
-            logger.error(f"生成聊天响应时出错: {str(e)}")
-            error_event = {"type": "error", "content": f"处理消息时出错：{str(e)}"}
-            yield f"data: {json.dumps(error_event)}\n\n"
+    try:
+        message_id = StreamService.open_turn(session, request.message)
+    except SchedulerFullError as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+    return _message_stream_response(message_id, http_request)
+
+
+@router.get("/chat/stream/{message_id}")
+async def resume_chat_stream(
+    message_id: str,
+    http_request: Request,
+    after: int = 0,
+    last_event_id: Optional[str] = Header(None),
+):
+    """
+    继续接收流式响应
+
+    从 Last-Event-ID 请求头（或 after 参数）指定的事件之后继续推送，不会重新执行工作流。
+    已推送的事件超出重放缓冲区时返回 409，客户端应重新获取聊天历史。
+    """
+    after = parse_last_event_id(last_event_id, after)
+    buffer = StreamService.get_buffer(message_id)
+    if buffer is None:
+        raise HTTPException(status_code=404, detail="消息流不存在或已过期")
+    if not buffer.can_resume(after):
+        logger.warning(f"消息流 {message_id} 无法从事件 {after} 继续，最早可重放的事件为 {buffer.first_id}")
+        raise HTTPException(status_code=409, detail="事件已超出重放范围，请重新获取聊天历史")
+    logger.info(f"继续推送消息流 {message_id}，起始序号: {after}")
+    return _message_stream_response(message_id, http_request, after)
+
+
+@router.post("/chat/jobs", status_code=202)
+async def create_chat_job(request: ChatRequest):
+    """
+    提交后台分析任务
+
+    立即返回任务ID，分析在后台执行；通过 GET /chat/jobs/{job_id} 查询状态和结果，
+    或通过 GET /chat/jobs/{job_id}/events 订阅事件流。
+    """
+    logger.info(f"收到后台任务请求，会话ID: {request.session_id}")
+    session = SessionService.get_session(request.session_id)
+    if not session:
+        logger.warning(f"会话不存在: {request.session_id}")
+        raise HTTPException(status_code=404, detail="会话不存在")
+
+    if not JobService.has_capacity():
+        logger.warning("后台任务已达到上限")
+        raise HTTPException(status_code=429, detail="后台任务过多，请稍后再试")
+
+    ai_message = SessionService.add_exchange(request.session_id, request.message)
+    job = JobService.submit(session, request.message, ai_message.id)
+    return {"job_id": job.id, "status": job.status, "message_id": job.message_id}
+
+
+@router.get("/chat/jobs/{job_id}")
+async def get_chat_job(job_id: str):
+    """获取后台任务的状态，以及目前为止的思考过程和回答"""
+    job = JobService.get_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="任务不存在")
+    return job
+
+
+@router.get("/chat/jobs/{job_id}/events")
+async def stream_chat_job_events(
+    job_id: str,
+    http_request: Request,
+    after: int = 0,
+    last_event_id: Optional[str] = Header(None),
+):
+    """
+    订阅后台任务的事件流
+
+    每个事件带有递增的 id。断线后通过 Last-Event-ID 请求头（或 after 参数）从已收到的最后一个事件之后继续，
+    已完成的任务直接返回保存的事件。
+    """
+    if not JobService.get_job(job_id):
+        raise HTTPException(status_code=404, detail="任务不存在")
+    after = parse_last_event_id(last_event_id, after)
+    logger.info(f"订阅后台任务事件 {job_id}，起始序号: {after}")
 
     return StreamingResponse(
-        generate_response(),
-        media_type="text/plain",
-        headers={
-            "Cache-Control": "no-cache",
-            "Connection": "keep-alive",
-            "Content-Type": "text/event-stream",
-        },
+        event_stream(JobService.stream_events(job_id, after), is_disconnected=http_request.is_disconnected),
+        media_type="text/event-stream",
+        headers=SSE_HEADERS,
     )
 
 
+@router.post("/chat/batch")
+async def batch_chat(request: BatchChatRequest, http_request: Request):
+    """
+    批量问题接口
+
+    对会话中已上传的数据一次提交多个问题：数据只加载一次，各问题在 BATCH_MAX_CONCURRENCY 的并发上限内同时分析。
+    默认等待全部完成后返回按问题索引的结果；stream 为 True 时以 SSE 逐个推送完成的问题结果，客户端断开时取消剩余问题。
+    批量问题不写入聊天历史。
+    """
+    logger.info(f"收到批量问题请求，会话ID: {request.session_id}，问题数: {len(request.questions)}")
+    session = SessionService.get_session(request.session_id)
+    if not session:
+        logger.warning(f"会话不存在: {request.session_id}")
+        raise HTTPException(status_code=404, detail="会话不存在")
+    if not session.file_info:
+        raise HTTPException(status_code=400, detail="会话尚未上传文件")
+
+    questions = BatchService.normalize_questions(request.questions)
+    if not questions:
+        raise HTTPException(status_code=400, detail="问题列表不能为空")
+    if len(questions) > AgentConfig.BATCH_MAX_QUESTIONS:
+        raise HTTPException(status_code=400, detail=f"一次最多提交 {AgentConfig.BATCH_MAX_QUESTIONS} 个问题")
+
+    if request.stream:
+        async def numbered():
+            index = 0
+            async for result in BatchService.run(session, questions):
+                index += 1
+                yield index, result
+
+        return StreamingResponse(
+            event_stream(numbered(), is_disconnected=http_request.is_disconnected),
+            media_type="text/event-stream",
+            headers=SSE_HEADERS,
+        )
+
+    results = {result.question: result async for result in BatchService.run(session, questions)}
+    return {
+        "session_id": session.id,
+        # 按提交顺序排列
+        "results": {question: results[question] for question in questions},
+    }
+
+
 @router.get("/chat/history/{session_id}")
 async def get_chat_history(session_id: str):
     """获取聊天历史"""
@@ -119,6 +204,9 @@ async def delete_session(session_id: str):
         logger.warning(f"删除会话失败，会话不存在: {session_id}")
         raise HTTPException(status_code=404, detail="会话不存在")
 
+    DataContextBlockCache.invalidate(session_id)
+    code_executor.release_session(session_id)
+
     return {"message": "会话已删除"}
 
 
@@ -140,3 +228,10 @@ async def list_sessions():
             for session in sessions.values()
         ]
     }
+
+
+@router.get("/chat/stats/llm-usage")
+async def get_llm_usage():
+    """获取 LLM 用量统计（含提示词缓存命中情况）"""
+    logger.info("获取 LLM 用量统计")
+    return usage_tracker.snapshot()
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""测试 WebSocket 聊天接口"""
+
+import os
+import sys
+# 添加项目根目录到 Python 路径
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '../../..'))
+
+import asyncio
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.api.routes import ws
+from app.models.schemas import ChatSocketFrame, ChatStreamEvent, Session
+from app.services import stream_service
+from app.services.chat_service import ChatService
+from app.services.session_service import SessionService
+from app.services.stream_service import StreamService
+
+
+def _receive_until_done(socket, turn_ids):
+    """接收帧直到各轮对话都收到 done 帧，按对话ID分组返回"""
+    frames = {turn_id: [] for turn_id in turn_ids}
+    pending = set(turn_ids)
+    while pending:
+        frame = socket.receive_json()
+        frames[frame["turn_id"]].append(frame)
+        if frame["type"] == "done":
+            pending.discard(frame["turn_id"])
+    return frames
+
+
+def test_multiplexed_turns_and_cancel(monkeypatch):
+    """一个连接上同时进行两个会话的对话，取消其中一轮不影响另一轮"""
+    monkeypatch.setattr(StreamService, "_streams", stream_service.OrderedDict())
+    for session_id in ("ws-a", "ws-b"):
+        SessionService._sessions[session_id] = Session(id=session_id, created_at="", updated_at="", status="active")
+
+    async def process_message(message, session, cancel_token=None, ticket=None):
+        yield ChatStreamEvent(type="thinking", content="分析中\n")
+        while message == "慢" and not cancel_token.cancelled:
+            await asyncio.sleep(0.01)
+        if cancel_token.cancelled:
+            yield ChatStreamEvent(type="error", content=f"分析已取消：{cancel_token.reason}")
+            return
+        yield ChatStreamEvent(type="response", content=f"{session.id}:{message}")
+
+    monkeypatch.setattr(ChatService, "process_message", staticmethod(process_message))
+    app = FastAPI()
+    app.include_router(ws.router, prefix="/api")
+
+    try:
+        with TestClient(app).websocket_connect("/api/ws") as socket:
+            socket.send_json({"type": "start", "session_id": "missing", "message": "销量", "request_id": "r0"})
+            assert socket.receive_json() == {"type": "error", "content": "会话不存在", "request_id": "r0"}
+
+            socket.send_json({"type": "start", "session_id": "ws-a", "message": "慢", "request_id": "r1"})
+            socket.send_json({"type": "start", "session_id": "ws-b", "message": "销量", "request_id": "r2"})
+            turns = {}
+            while len(turns) < 2:
+                frame = socket.receive_json()
+                if frame["type"] == "turn_start":
+                    turns[frame["request_id"]] = frame["turn_id"]
+            socket.send_json({"type": "cancel", "turn_id": turns["r1"]})
+            frames = _receive_until_done(socket, list(turns.values()))
+    finally:
+        for session_id in ("ws-a", "ws-b"):
+            SessionService._sessions.pop(session_id, None)
+
+    slow, fast = frames[turns["r1"]], frames[turns["r2"]]
+    # turn_start 之前到达的帧已在等待时读走，只检查每轮最后的帧
+    assert fast[-1] == {"type": "done", "turn_id": turns["r2"]}
+    assert fast[-2]["type"] == "response" and fast[-2]["content"] == "ws-b:销量"
+    assert slow[-2] == {"type": "error", "content": "分析已取消：客户端取消",
+                        "turn_id": turns["r1"], "id": slow[-2]["id"]}
+
+
+def test_cancel_is_not_blocked_by_full_outbox(monkeypatch):
+    """待发送队列已满时仍能处理 cancel；无法送达的控制帧导致连接关闭"""
+    monkeypatch.setattr(StreamService, "_streams", stream_service.OrderedDict())
+    session = Session(id="ws-full", created_at="", updated_at="", status="active")
+
+    async def scenario():
+        async def process_message(message, session, cancel_token=None, ticket=None):
+            while not cancel_token.cancelled:
+                await asyncio.sleep(0.01)
+            yield ChatStreamEvent(type="error", content=f"分析已取消：{cancel_token.reason}")
+
+        monkeypatch.setattr(ChatService, "process_message", staticmethod(process_message))
+        StreamService.start(session, "慢", "turn-1")
+        outbox = asyncio.Queue(maxsize=1)
+        outbox.put_nowait({"type": "thinking"})
+        connection = ws._Connection(outbox)
+
+        connection.handle(ChatSocketFrame(type="cancel", turn_id="turn-1"))
+        cancelled = StreamService._streams["turn-1"].cancel_token.cancelled
+        with pytest.raises(ws._OutboxFull):
+            connection.handle(ChatSocketFrame(type="cancel", turn_id="missing"))
+        await asyncio.gather(*StreamService._tasks)
+        return cancelled
+
+    assert asyncio.run(scenario())
+
+
+def test_send_failure_closes_connection(monkeypatch):
+    """发送失败时关闭连接，而不是让接收循环一直等待"""
+    async def broken_sender(websocket, outbox):
+        await outbox.get()
+        raise RuntimeError("发送失败")
+
+    monkeypatch.setattr(ws, "_send_frames", broken_sender)
+    app = FastAPI()
+    app.include_router(ws.router, prefix="/api")
+
+    with TestClient(app).websocket_connect("/api/ws") as socket:
+        socket.send_json({"type": "bogus"})
+        assert socket.receive() == {"type": "websocket.close", "code": 1011, "reason": ""}
@@ -0,0 +1,196 @@
+"""WebSocket 聊天接口
+
+一个连接上可以同时进行多个会话的多轮对话，帧均为 JSON 文本。
+
+客户端帧（ChatSocketFrame）：
+- {"type": "start", "session_id": ..., "message": ..., "request_id": ...}  开始一轮对话
+- {"type": "cancel", "turn_id": ...}                                      取消进行中的一轮对话
+- {"type": "resume", "turn_id": ..., "after": N}                          从事件 N 之后继续接收（重连后使用）
+
+服务端帧：
+- {"type": "turn_start", "turn_id": ..., "session_id": ..., "request_id": ...}
+- {"type": "thinking" | "response" | "error", "content": ..., "turn_id": ..., "id": N}  即 ChatStreamEvent 附带对话ID和事件序号
+- {"type": "done", "turn_id": ...}                                        该轮对话的事件已全部发送
+- {"type": "error", "content": ..., "request_id"/"turn_id": ..., "retry_after": ...}  请求无法处理
+
+发送采用有界队列：客户端接收慢时各轮对话暂停转发（事件仍保存在消息流的重放缓冲区中），
+连接内存占用不会随未发送的事件增长。接收循环不等待队列空位，cancel 等控制帧不受背压影响；
+队列已满时无法送达的控制帧导致连接关闭（1013），发送失败时同样关闭连接。
+连接断开后各轮对话与 SSE 断开时一样，超过重连等待时间后取消。
+"""
+import json
+import asyncio
+from typing import Any, Dict
+from fastapi import APIRouter, WebSocket, WebSocketDisconnect
+from pydantic import ValidationError
+from app.core.config import settings
+from app.models.schemas import ChatSocketFrame
+from app.api.serialization import dumps, event_payload
+from app.services.session_service import SessionService
+from app.services.stream_service import StreamService
+from app.services.event_buffer import EventGapError
+from app.agents.scheduler import SchedulerFullError
+from app.core.logging_config import get_api_logger
+
+logger = get_api_logger("ws")
+
+router = APIRouter()
+
+
+def _error_frame(content: str, **fields: Any) -> Dict[str, Any]:
+    frame = {"type": "error", "content": content}
+    frame.update({key: value for key, value in fields.items() if value is not None})
+    return frame
+
+
+async def _send_frames(websocket: WebSocket, outbox: asyncio.Queue) -> None:
+    """按顺序发送待发送队列中的帧"""
+    while True:
+        frame = await outbox.get()
+        await websocket.send_text(dumps(frame))
+
+
+async def _forward_turn(turn_id: str, after: int, outbox: asyncio.Queue) -> None:
+    """把一轮对话的事件转发到连接的待发送队列（队列满时等待，即背压）"""
+    try:
+        async for event_id, event in StreamService.subscribe(turn_id, after):
+            if event.type == "done":
+                continue
+            await outbox.put({**event_payload(event), "turn_id": turn_id, "id": event_id})
+    except EventGapError as e:
+        logger.warning(f"对话 {turn_id} 无法继续推送: {str(e)}")
+        await outbox.put(_error_frame(f"{str(e)}，请重新获取聊天历史", turn_id=turn_id))
+    await outbox.put({"type": "done", "turn_id": turn_id})
+
+
+class _OutboxFull(Exception):
+    """待发送队列已满，客户端长时间不接收"""
+    pass
+
+
+class _Connection:
+    """一个 WebSocket 连接上进行中的各轮对话"""
+
+    def __init__(self, outbox: asyncio.Queue):
+        self.outbox = outbox
+        self.forwarders: Dict[str, asyncio.Task] = {}
+
+    def send(self, frame: Dict[str, Any]) -> None:
+        """
+        放入控制帧（turn_start、错误），不等待队列空位，接收循环因此不会被慢客户端阻塞
+
+        Raises:
+            _OutboxFull: 待发送队列已满
+        """
+        try:
+            self.outbox.put_nowait(frame)
+        except asyncio.QueueFull:
+            raise _OutboxFull()
+
+    def forward(self, turn_id: str, after: int = 0) -> None:
+        previous = self.forwarders.pop(turn_id, None)
+        if previous is not None:
+            previous.cancel()
+        task = asyncio.create_task(_forward_turn(turn_id, after, self.outbox))
+        self.forwarders[turn_id] = task
+        task.add_done_callback(lambda done: self.forwarders.pop(turn_id, None) if self.forwarders.get(turn_id) is done else None)
+
+    def handle(self, frame: ChatSocketFrame) -> None:
+        if frame.type == "start":
+            self._start(frame)
+        elif frame.type == "cancel":
+            if not frame.turn_id or not StreamService.cancel(frame.turn_id, "客户端取消"):
+                self.send(_error_frame("对话不存在或已结束", turn_id=frame.turn_id))
+        elif frame.type == "resume":
+            if not frame.turn_id or StreamService.get_buffer(frame.turn_id) is None:
+                self.send(_error_frame("消息流不存在或已过期", turn_id=frame.turn_id))
+                return
+            self.forward(frame.turn_id, frame.after)
+        else:
+            self.send(_error_frame(f"不支持的帧类型: {frame.type}", request_id=frame.request_id))
+
+    def _start(self, frame: ChatSocketFrame) -> None:
+        session = SessionService.get_session(frame.session_id) if frame.session_id else None
+        if not session:
+            self.send(_error_frame("会话不存在", request_id=frame.request_id))
+            return
+        if not frame.message:
+            self.send(_error_frame("消息不能为空", request_id=frame.request_id))
+            return
+        if self.outbox.full():
+            # 无法通知客户端对话ID时不开始对话
+            raise _OutboxFull()
+        try:
+            turn_id = StreamService.open_turn(session, frame.message)
+        except SchedulerFullError as e:
+            self.send(_error_frame(str(e), request_id=frame.request_id, retry_after=e.retry_after))
+            return
+        logger.info(f"WebSocket 开始对话 {turn_id}，会话ID: {session.id}")
+        self.send({
+            "type": "turn_start",
+            "turn_id": turn_id,
+            "session_id": session.id,
+            "request_id": frame.request_id,
+        })
+        self.forward(turn_id)
+
+    async def close(self) -> None:
+        tasks = list(self.forwarders.values())
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            # 用 wait 而不是 gather：清理期间本任务再被取消时不会把取消传给已在结束的子任务
+            await asyncio.wait(tasks)
+
+
+async def _receive_frames(websocket: WebSocket, connection: _Connection) -> None:
+    """接收并处理客户端帧（处理过程不等待发送）"""
+    while True:
+        text = await websocket.receive_text()
+        try:
+            frame = ChatSocketFrame(**json.loads(text))
+        except (ValueError, TypeError, ValidationError) as e:
+            connection.send(_error_frame(f"无效的帧: {str(e)}"))
+            continue
+        connection.handle(frame)
+
+
+@router.websocket("/ws")
+async def chat_socket(websocket: WebSocket):
+    """
+    WebSocket 聊天接口，一个连接可以同时进行多个会话的对话
+
+    控制帧（如 cancel）总能及时处理；客户端长时间不接收导致待发送队列已满、或发送失败时关闭连接。
+    """
+    await websocket.accept()
+    logger.info("WebSocket 连接已建立")
+    outbox: asyncio.Queue = asyncio.Queue(maxsize=settings.ws_send_queue_size)
+    connection = _Connection(outbox)
+    sender = asyncio.create_task(_send_frames(websocket, outbox))
+    receiver = asyncio.create_task(_receive_frames(websocket, connection))
+    close_code = None
+    try:
+        await asyncio.wait({sender, receiver}, return_when=asyncio.FIRST_COMPLETED)
+        if receiver.done():
+            error = receiver.exception()
+            if isinstance(error, WebSocketDisconnect):
+                logger.info("WebSocket 连接已断开")
+            elif isinstance(error, _OutboxFull):
+                logger.warning("WebSocket 客户端接收过慢，待发送队列已满，关闭连接")
+                close_code = 1013
+            else:
+                logger.error(f"WebSocket 接收出错: {str(error)}", exc_info=error)
+                close_code = 1011
+        else:
+            logger.warning(f"WebSocket 发送失败，关闭连接: {str(sender.exception())}")
+            close_code = 1011
+    finally:
+        receiver.cancel()
+        await connection.close()
+        sender.cancel()
+        await asyncio.wait({sender, receiver})
+        if close_code is not None:
+            try:
+                await websocket.close(code=close_code)
+            except Exception as e:
+                logger.debug(f"关闭 WebSocket 连接失败: {str(e)}")
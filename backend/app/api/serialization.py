@@ -0,0 +1,26 @@
+"""流式事件序列化
+
+每条回答会产生大量很小的事件（逐段的回答、各节点的思考提示），逐个经过 pydantic 的 dict() 和 json.dumps
+在高并发时占用明显的 CPU。这里直接读取事件模型的字段（事件由服务内部构建，字段均为简单类型，无需再校验或转换），
+安装了 orjson 时使用 orjson 编码，否则退回标准库 json 的紧凑输出；非 ASCII 字符直接以 UTF-8 输出，不转义。
+"""
+import json
+from typing import Any, Dict
+from pydantic import BaseModel
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def event_payload(event: BaseModel) -> Dict[str, Any]:
+    """事件模型的字段（不复制、不校验，调用方不应修改返回的字典）"""
+    return event.__dict__
+
+
+def dumps(obj: Any) -> str:
+    """编码为 JSON 文本"""
+    if orjson is not None:
+        return orjson.dumps(obj).decode()
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"))
@@ -0,0 +1,112 @@
+"""Server-Sent Events 格式化
+
+事件按 text/event-stream 格式输出：带序号的事件附带 id 字段，客户端断线重连时通过 Last-Event-ID
+请求头告知已收到的最后一个事件；长时间没有事件（LLM 调用、代码执行）时发送注释行作为心跳，
+避免代理因连接空闲而断开。等待事件期间定期检查客户端是否已断开，断开后立即停止订阅。
+短时间内连续产生的事件合并为一次写入，序列化见 app.api.serialization。
+"""
+import asyncio
+import time
+from typing import AsyncGenerator, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
+from pydantic import BaseModel
+from app.core.config import settings
+from app.models.schemas import ChatStreamEvent
+from app.services.event_buffer import EventGapError
+from app.api.serialization import dumps, event_payload
+from app.core.logging_config import get_api_logger
+
+logger = get_api_logger("sse")
+
+SSE_HEADERS: Dict[str, str] = {
+    "Cache-Control": "no-cache",
+    "Connection": "keep-alive",
+    # 关闭 nginx 等反向代理的响应缓冲
+    "X-Accel-Buffering": "no",
+}
+
+HEARTBEAT = ": heartbeat\n\n"
+DONE = "data: [DONE]\n\n"
+
+
+def format_event(event: BaseModel, event_id: Optional[int] = None) -> str:
+    """格式化单个 SSE 事件（ChatStreamEvent 或批量问题结果等）"""
+    data = f"data: {dumps(event_payload(event))}\n\n"
+    return f"id: {event_id}\n{data}" if event_id is not None else data
+
+
+def parse_last_event_id(last_event_id: Optional[str], default: int = 0) -> int:
+    """解析 Last-Event-ID 请求头，无效时返回 default"""
+    if last_event_id and last_event_id.strip().isdigit():
+        return int(last_event_id.strip())
+    return default
+
+
+async def event_stream(
+    events: AsyncIterator[Tuple[int, BaseModel]],
+    heartbeat_interval: Optional[float] = None,
+    is_disconnected: Optional[Callable[[], Awaitable[bool]]] = None,
+    coalesce_window: Optional[float] = None,
+) -> AsyncGenerator[str, None]:
+    """
+    把 (事件序号, 事件) 序列转换为 SSE 文本
+
+    收到一个事件后，在 coalesce_window 秒内陆续到达（或已在缓冲区中等待重放）的事件合并为一次输出，
+    减少高并发时的写入次数。等待下一个事件超过 heartbeat_interval 秒时输出一行注释心跳（不中断等待），
+    事件结束后输出 [DONE]。客户端断开连接时不再输出，关闭事件序列（订阅者据此取消工作流）。
+
+    Args:
+        events: 事件序列
+        heartbeat_interval: 心跳间隔（秒），默认取 settings.sse_heartbeat_interval
+        is_disconnected: 检查客户端是否已断开的函数（如 Request.is_disconnected）
+        coalesce_window: 合并输出的时间窗口（秒），默认取 settings.sse_coalesce_window，0 表示逐个输出
+    """
+    interval = heartbeat_interval or settings.sse_heartbeat_interval
+    poll = min(interval, settings.sse_disconnect_poll_interval) if is_disconnected else interval
+    window = settings.sse_coalesce_window if coalesce_window is None else coalesce_window
+    iterator = events.__aiter__()
+    pending = asyncio.ensure_future(iterator.__anext__())
+    last_sent = time.monotonic()
+    finished = False
+    try:
+        while not finished:
+            done, _ = await asyncio.wait({pending}, timeout=poll)
+            if not done:
+                if is_disconnected is not None and await is_disconnected():
+                    logger.info("客户端已断开连接，停止推送事件")
+                    break
+                if time.monotonic() - last_sent >= interval:
+                    last_sent = time.monotonic()
+                    yield HEARTBEAT
+                continue
+            chunks: List[str] = []
+            deadline = time.monotonic() + window
+            while True:
+                try:
+                    event_id, event = pending.result()
+                except StopAsyncIteration:
+                    finished = True
+                    break
+                except EventGapError as e:
+                    logger.warning(f"无法继续推送事件: {str(e)}")
+                    chunks.append(format_event(
+                        ChatStreamEvent.model_construct(type="error", content=f"{str(e)}，请重新获取聊天历史")
+                    ))
+                    finished = True
+                    break
+                chunks.append(format_event(event, event_id))
+                pending = asyncio.ensure_future(iterator.__anext__())
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or len(chunks) >= settings.sse_coalesce_max_events:
+                    break
+                done, _ = await asyncio.wait({pending}, timeout=remaining)
+                if not done:
+                    break
+            if finished:
+                chunks.append(DONE)
+            last_sent = time.monotonic()
+            yield "".join(chunks)
+    finally:
+        if not pending.done():
+            pending.cancel()
+            # 等待取消完成，确保订阅者的清理逻辑（如断开计数）已执行
+            await asyncio.gather(pending, return_exceptions=True)
@@ -11,6 +11,26 @@ class Settings(BaseSettings):
     upload_dir: str = "uploads"
     max_file_size: int = 50 * 1024 * 1024  # 50MB
     allowed_extensions: List[str] = [".xlsx", ".xls", ".csv"]
+    dataframe_cache_size: int = 8  # 内存中缓存的 DataFrame 数量
+    column_profile_enabled: bool = True  # 上传时构建列概要（去重计数、分位数、行样本）
+    profile_sample_size: int = 10000  # 列概要中行样本的行数
+    
+    # 后台分析任务配置
+    job_results_dir: str = "jobs"  # 已完成任务的结果目录
+    job_max_running: int = 2  # 同时执行的后台任务数
+    job_max_pending: int = 32  # 排队与执行中的任务总数上限
+    job_memory_size: int = 100  # 内存中保留的已完成任务数
+    
+    # 流式响应配置
+    stream_replay_size: int = 2000  # 每条消息缓存的最近事件数，断线重连时从中重放
+    stream_memory_size: int = 100  # 内存中保留的已结束消息流数
+    sse_heartbeat_interval: float = 15.0  # 没有事件时发送 SSE 注释心跳的间隔（秒）
+    sse_disconnect_poll_interval: float = 1.0  # 检查客户端是否已断开连接的间隔（秒）
+    sse_coalesce_window: float = 0.02  # 该时间（秒）内连续产生的事件合并为一次写入，0 表示逐个写入
+    sse_coalesce_max_events: int = 64  # 一次写入合并的事件数上限
+    stream_disconnect_grace: float = 10.0  # 客户端全部断开后等待重连的时间（秒），超时取消工作流
+    duplicate_submit_window: float = 5.0  # 同一会话在该时间（秒）内重复提交相同消息时复用已有的消息流，0 表示不合并
+    ws_send_queue_size: int = 64  # 每个 WebSocket 连接待发送帧的上限，客户端接收慢时暂停转发事件
     
     # API 配置
     api_prefix: str = "/api"
@@ -27,5 +47,6 @@ class Settings(BaseSettings):
 # 创建设置实例
 settings = Settings()
 
-# 确保上传目录存在
-os.makedirs(settings.upload_dir, exist_ok=True)
\ No newline at end of file
+# 确保上传目录和任务结果目录存在
+os.makedirs(settings.upload_dir, exist_ok=True)
+os.makedirs(settings.job_results_dir, exist_ok=True)
\ No newline at end of file
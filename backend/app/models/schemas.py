@@ -52,6 +52,46 @@ class ChatStreamEvent(BaseModel):
     content: Optional[str] = None
 
 
+# 批量问题请求
+class BatchChatRequest(BaseModel):
+    session_id: str
+    questions: List[str]
+    stream: bool = False  # 为 True 时以 SSE 逐个推送完成的问题结果
+
+
+# 批量问题中单个问题的结果
+class BatchQuestionResult(BaseModel):
+    question: str
+    status: str  # 'completed' | 'failed'
+    answer: str = ""
+    error: Optional[str] = None
+    elapsed: float = 0.0  # 耗时（秒），含排队时间
+
+
+# WebSocket 客户端帧
+class ChatSocketFrame(BaseModel):
+    type: str  # 'start' | 'cancel' | 'resume'
+    request_id: Optional[str] = None  # 客户端自定义的请求标识，在 turn_start 帧中原样返回
+    session_id: Optional[str] = None
+    message: Optional[str] = None
+    turn_id: Optional[str] = None  # 一轮对话的 AI 消息ID
+    after: int = 0  # resume 时已收到的最后一个事件序号
+
+
+# 后台分析任务
+class ChatJob(BaseModel):
+    id: str
+    session_id: str
+    message_id: str  # 任务结果写入的 AI 消息
+    status: str  # 'queued' | 'running' | 'completed' | 'failed'
+    created_at: str
+    updated_at: str
+    content: str = ""
+    thinking: str = ""
+    error: Optional[str] = None
+    event_count: int = 0
+
+
 # 错误响应
 class ErrorResponse(BaseModel):
     error: str
@@ -0,0 +1,138 @@
+"""批量问题服务
+
+报表类请求会对同一份数据连续提出几十个问题。逐个通过 /chat/stream 提交时，每个问题都要重新构建数据上下文、
+单独做意图分类。批量执行时数据上下文只加载一次并由所有问题共用（问题视为表格相关问题，跳过意图分类），
+代码执行进程预先加载数据供各问题复用；各问题的 LLM 分析在 BATCH_MAX_CONCURRENCY
+的并发上限内同时进行，仍通过工作流调度器申请名额，受全局并发上限和等待队列的约束。
+批量问题的代码执行不使用会话内核：不绑定到会话的工作进程（可以分散到空闲进程上并行执行），
+问题之间、以及与交互式对话之间不会互相覆盖内核变量。
+"""
+import time
+import asyncio
+from collections import deque
+from typing import Any, AsyncGenerator, Dict, List, Optional
+from app.models.schemas import BatchQuestionResult, Session
+from app.services.chat_service import ChatService
+from app.agents.config import AgentConfig
+from app.agents.table_agent import table_agent
+from app.agents.cancellation import CancellationToken
+from app.agents.scheduler import SchedulerFullError, agent_scheduler
+from app.agents.execution import ExecutionContext, code_executor
+from app.core.logging_config import get_app_logger
+
+logger = get_app_logger('batch_service')
+
+
+class BatchService:
+    """批量问题执行"""
+
+    @staticmethod
+    def normalize_questions(questions: List[str]) -> List[str]:
+        """去掉空问题和重复的问题（保持提交顺序）"""
+        return list(dict.fromkeys(q.strip() for q in questions if q and q.strip()))
+
+    @staticmethod
+    def load_shared_context(session: Session) -> Dict[str, Any]:
+        """加载各问题共用的工作流状态：数据上下文和已确定的意图"""
+        context_info, df = table_agent.data_context_node.load_context(session.file_info)
+        # 让代码执行进程提前加载数据，各问题的代码执行直接使用
+        code_executor.preload(ExecutionContext(filepath=session.file_info.filepath))
+        return {
+            "data_context": context_info,
+            "dataframe": df,
+            "data_context_ready": True,
+            "is_table_related": True,
+            "intent_classification_done": True,
+            # 不使用会话内核，代码执行不绑定会话的工作进程
+            "execution_session_id": None,
+        }
+
+    @staticmethod
+    async def _answer(
+        session: Session,
+        question: str,
+        shared_context: Dict[str, Any],
+        concurrency: int,
+        cancel_token: CancellationToken
+    ) -> BatchQuestionResult:
+        """执行一个问题，收集回答"""
+        started = time.monotonic()
+        answer = ""
+        error = None
+        try:
+            # 同一批量请求的问题在本会话内最多同时执行 concurrency 个
+            ticket = agent_scheduler.reserve(session.id, max_per_session=concurrency)
+        except SchedulerFullError as e:
+            error = f"{str(e)}（建议 {e.retry_after} 秒后重试）"
+        else:
+            async for event in ChatService.process_message(
+                question, session, cancel_token, ticket, initial_context=dict(shared_context)
+            ):
+                if event.type == "response" and event.content:
+                    answer += event.content
+                elif event.type == "error":
+                    error = event.content
+        return BatchQuestionResult(
+            question=question,
+            status="failed" if error else "completed",
+            answer=answer,
+            error=error,
+            elapsed=round(time.monotonic() - started, 3),
+        )
+
+    @classmethod
+    async def run(
+        cls,
+        session: Session,
+        questions: List[str],
+        concurrency: Optional[int] = None
+    ) -> AsyncGenerator[BatchQuestionResult, None]:
+        """
+        执行批量问题，按完成顺序产出各问题的结果
+
+        读取数据文件失败时所有问题均返回失败；调用方停止迭代（如客户端断开）时取消仍在执行的问题。
+
+        Args:
+            session: 会话（需要已上传文件）
+            questions: 问题列表（已去重）
+            concurrency: 同时执行的问题数，默认取 BATCH_MAX_CONCURRENCY
+        """
+        limit = max(1, concurrency or AgentConfig.BATCH_MAX_CONCURRENCY)
+        try:
+            shared_context = await asyncio.to_thread(cls.load_shared_context, session)
+        except Exception as e:
+            logger.error(f"批量问题读取数据文件失败: {str(e)}", exc_info=True)
+            for question in questions:
+                yield BatchQuestionResult(question=question, status="failed", error=f"读取数据文件失败：{str(e)}")
+            return
+        logger.info(f"开始批量问题，会话ID: {session.id}，问题数: {len(questions)}，并发: {limit}")
+
+        pending = deque(questions)
+        results: asyncio.Queue = asyncio.Queue()
+        # 执行中的问题 -> 取消令牌（每个问题单独取消，一个问题提前结束不影响其他问题）
+        running: Dict[str, CancellationToken] = {}
+
+        async def worker() -> None:
+            while pending:
+                question = pending.popleft()
+                token = running[question] = CancellationToken(f"会话 {session.id} 批量问题")
+                try:
+                    result = await cls._answer(session, question, shared_context, limit, token)
+                except Exception as e:
+                    logger.error(f"批量问题执行出错: {str(e)}", exc_info=True)
+                    result = BatchQuestionResult(question=question, status="failed", error=f"处理问题时出错：{str(e)}")
+                finally:
+                    running.pop(question, None)
+                await results.put(result)
+
+        workers = [asyncio.create_task(worker()) for _ in range(min(limit, len(questions)))]
+        try:
+            for _ in range(len(questions)):
+                yield await results.get()
+            logger.info(f"批量问题完成，会话ID: {session.id}")
+        finally:
+            for token in list(running.values()):
+                token.cancel("批量请求已关闭")
+            for task in workers:
+                task.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
@@ -1,9 +1,12 @@
 import asyncio
 import json
-from typing import AsyncGenerator
+from typing import Any, AsyncGenerator, Dict, Optional
 from app.models.schemas import ChatStreamEvent, Session
 from app.services.file_service import FileService
+from app.services.session_service import SessionService
 from app.agents.table_agent import table_agent
+from app.agents.cancellation import CancellationToken
+from app.agents.scheduler import RunTicket
 from app.core.logging_config import get_app_logger
 
 logger = get_app_logger('chat_service')
@@ -14,15 +17,23 @@ class ChatService:
     @staticmethod
     async def process_message(
         message: str, 
-        session: Session
+        session: Session,
+        cancel_token: Optional[CancellationToken] = None,
+        ticket: Optional[RunTicket] = None,
+        initial_context: Optional[Dict[str, Any]] = None
     ) -> AsyncGenerator[ChatStreamEvent, None]:
-        """处理聊天消息并返回流式响应"""
+        """
+        处理聊天消息并返回流式响应
+
+        cancel_token 被取消时工作流随之取消；ticket 为预先向调度器申请的执行名额，为空时排队申请；
+        initial_context 为预先准备的工作流状态（如批量问题共用的数据上下文）。
+        """
         logger.info(f"开始处理聊天消息，session_id: {getattr(session, 'id', None)}")
         
         try:
             # 使用 table_agent 处理消息
             logger.debug("调用 table_agent 处理消息")
-            async for event in table_agent.process_message(message, session):
+            async for event in table_agent.process_message(message, session, cancel_token, ticket, initial_context):
                 logger.debug(f"收到事件: {event.type}")
                 yield event
             
@@ -30,4 +41,29 @@ class ChatService:
                 
         except Exception as e:
             logger.error(f"处理聊天消息时出错: {str(e)}")
-            yield ChatStreamEvent(type="error", content=f"处理消息时出错：{str(e)}")
\ No newline at end of file
+            yield ChatStreamEvent(type="error", content=f"处理消息时出错：{str(e)}")
+
+    @staticmethod
+    async def process_and_record(
+        message: str,
+        session: Session,
+        message_id: str,
+        cancel_token: Optional[CancellationToken] = None,
+        ticket: Optional[RunTicket] = None
+    ) -> AsyncGenerator[ChatStreamEvent, None]:
+        """处理聊天消息，同时把思考过程和回答写入会话中对应的 AI 消息"""
+        current_thinking = ""
+        current_response = ""
+        async for event in ChatService.process_message(message, session, cancel_token, ticket):
+            if event.type == "thinking" and event.content:
+                current_thinking += event.content
+            elif event.type == "response" and event.content:
+                current_response += event.content
+            if event.type in ("thinking", "response") and event.content:
+                SessionService.update_message(
+                    session.id,
+                    message_id,
+                    content=current_response,
+                    thinking=current_thinking,
+                )
+            yield event
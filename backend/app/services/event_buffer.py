@@ -0,0 +1,80 @@
+"""带序号的事件缓冲区
+
+后台任务和流式聊天共用：生产者追加事件，每个事件获得从 1 开始递增的序号；
+订阅者可以从任意序号之后开始读取，读完已缓存的事件后等待新事件，直到缓冲区关闭。
+设置 maxlen 时只保留最近的 maxlen 个事件，更早的事件无法再重放。
+"""
+import asyncio
+from collections import deque
+from typing import AsyncGenerator, List, Optional, Tuple
+from app.models.schemas import ChatStreamEvent
+
+
+class EventGapError(Exception):
+    """请求的事件已移出缓冲区，无法从该序号继续"""
+    pass
+
+
+class EventBuffer:
+    """带序号的事件缓冲区"""
+
+    def __init__(self, maxlen: Optional[int] = None):
+        self._events: "deque[ChatStreamEvent]" = deque(maxlen=maxlen)
+        self.last_id = 0
+        self.closed = False
+        # 每次有新事件或关闭时置位并替换，订阅者等待取到的那一个
+        self._updated = asyncio.Event()
+
+    @property
+    def first_id(self) -> int:
+        """缓冲区中最早事件的序号（缓冲区为空时为 last_id + 1）"""
+        return self.last_id - len(self._events) + 1
+
+    @property
+    def events(self) -> List[ChatStreamEvent]:
+        """缓冲区中的全部事件"""
+        return list(self._events)
+
+    def _notify(self) -> None:
+        updated, self._updated = self._updated, asyncio.Event()
+        updated.set()
+
+    def append(self, event: ChatStreamEvent) -> int:
+        """追加事件，返回其序号"""
+        self._events.append(event)
+        self.last_id += 1
+        self._notify()
+        return self.last_id
+
+    def close(self) -> None:
+        """不再有新事件，订阅者读完缓存的事件后结束"""
+        self.closed = True
+        self._notify()
+
+    def can_resume(self, after: int) -> bool:
+        """序号 after 之后的事件是否都还在缓冲区中"""
+        return after + 1 >= self.first_id
+
+    async def subscribe(self, after: int = 0) -> AsyncGenerator[Tuple[int, ChatStreamEvent], None]:
+        """
+        读取序号大于 after 的事件，缓冲区未关闭时继续等待新事件
+
+        Args:
+            after: 已收到的最后一个事件序号（0 表示从头开始）
+
+        Yields:
+            (事件序号, 事件)
+
+        Raises:
+            EventGapError: 序号 after 之后的部分事件已移出缓冲区
+        """
+        while True:
+            updated = self._updated
+            while after < self.last_id:
+                if not self.can_resume(after):
+                    raise EventGapError(f"事件 {after + 1} 已移出缓冲区，最早可重放的事件为 {self.first_id}")
+                after += 1
+                yield after, self._events[after - self.first_id]
+            if self.closed:
+                return
+            await updated.wait()
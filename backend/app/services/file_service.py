@@ -1,7 +1,10 @@
 import pandas as pd
 import os
+import hashlib
 import uuid
-from typing import Dict, List, Any, Tuple
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Any, Optional, Tuple
 from datetime import datetime
 from app.core.config import settings
 from app.models.schemas import FileInfo
@@ -10,6 +13,14 @@ from app.models.schemas import FileInfo
 class FileService:
     """文件处理服务"""
 
+    # DataFrame 缓存：文件路径 -> (修改时间, DataFrame)
+    _dataframe_cache: "OrderedDict[str, Tuple[float, pd.DataFrame]]" = OrderedDict()
+    _cache_lock = threading.Lock()
+    # 按列读取的 DataFrame 缓存：(文件路径, 列) -> (修改时间, DataFrame)
+    _projection_cache: "OrderedDict[Tuple[str, Tuple[str, ...]], Tuple[float, pd.DataFrame]]" = OrderedDict()
+    # 文件内容哈希缓存：文件路径 -> ((修改时间, 大小), 哈希)
+    _content_hashes: Dict[str, Tuple[Tuple[float, int], str]] = {}
+
     @staticmethod
     def validate_file(filename: str, file_size: int) -> bool:
         """验证文件格式和大小"""
@@ -68,6 +79,11 @@ class FileService:
             else:
                 raise ValueError(f"Unsupported file format: {file_ext}")
 
+            # 列概要基于与代码执行环境相同的原始数据（处理 NaN 之前）
+            if settings.column_profile_enabled:
+                from app.services.profile_service import ProfileService
+                ProfileService.save_profile(filepath, df)
+
             # 处理 NaN 值
             df = df.fillna("")
 
@@ -91,30 +107,130 @@ class FileService:
             # 如果处理失败，删除已保存的文件
             if os.path.exists(filepath):
                 os.remove(filepath)
+            FileService._remove_profile(filepath)
             raise e
 
     @staticmethod
-    def get_dataframe(filepath: str) -> pd.DataFrame:
-        """获取文件的 DataFrame"""
+    def get_dataframe(filepath: str, columns: Optional[List[str]] = None) -> pd.DataFrame:
+        """获取文件的 DataFrame，指定 columns 时只读取这些列"""
         file_ext = os.path.splitext(filepath)[1].lower()
 
         if file_ext in [".xlsx", ".xls"]:
-            return pd.read_excel(filepath)
+            return pd.read_excel(filepath, usecols=columns)
         elif file_ext == ".csv":
             # 尝试不同的编码
             try:
-                return pd.read_csv(filepath, encoding="utf-8")
+                return pd.read_csv(filepath, encoding="utf-8", usecols=columns)
             except UnicodeDecodeError:
                 try:
-                    return pd.read_csv(filepath, encoding="gbk")
+                    return pd.read_csv(filepath, encoding="gbk", usecols=columns)
                 except UnicodeDecodeError:
-                    return pd.read_csv(filepath, encoding="latin-1")
+                    return pd.read_csv(filepath, encoding="latin-1", usecols=columns)
         else:
             raise ValueError(f"Unsupported file format: {file_ext}")
 
+    @classmethod
+    def get_cached_dataframe(cls, filepath: str) -> pd.DataFrame:
+        """
+        获取缓存的 DataFrame，文件修改后自动重新读取
+
+        返回的对象在多个请求间共享，调用方不得原地修改。
+        """
+        mtime = os.path.getmtime(filepath)
+
+        with cls._cache_lock:
+            cached = cls._dataframe_cache.get(filepath)
+            if cached is not None and cached[0] == mtime:
+                cls._dataframe_cache.move_to_end(filepath)
+                return cached[1]
+
+        df = cls.get_dataframe(filepath)
+
+        with cls._cache_lock:
+            cls._dataframe_cache[filepath] = (mtime, df)
+            cls._dataframe_cache.move_to_end(filepath)
+            while len(cls._dataframe_cache) > settings.dataframe_cache_size:
+                cls._dataframe_cache.popitem(last=False)
+
+        return df
+
+    @classmethod
+    def get_projected_dataframe(cls, filepath: str, columns: List[str]) -> pd.DataFrame:
+        """
+        获取只包含指定列的 DataFrame
+
+        已缓存完整数据或包含这些列的数据时直接从中选取，否则只读取这些列。
+        返回的对象在多个请求间共享，调用方不得原地修改。
+        """
+        mtime = os.path.getmtime(filepath)
+        wanted = set(columns)
+
+        with cls._cache_lock:
+            cached = cls._dataframe_cache.get(filepath)
+            if cached is not None and cached[0] == mtime:
+                return cached[1][columns]
+            for (path, cached_columns), (cached_mtime, df) in reversed(cls._projection_cache.items()):
+                if path == filepath and cached_mtime == mtime and wanted.issubset(cached_columns):
+                    cls._projection_cache.move_to_end((path, cached_columns))
+                    return df if list(cached_columns) == columns else df[columns]
+
+        try:
+            df = cls.get_dataframe(filepath, columns)[columns]
+        except ValueError:
+            # 列名无法按 usecols 匹配（如重复列名被重命名）时读取全部列
+            return cls.get_cached_dataframe(filepath)[columns]
+
+        key = (filepath, tuple(columns))
+        with cls._cache_lock:
+            cls._projection_cache[key] = (mtime, df)
+            cls._projection_cache.move_to_end(key)
+            while len(cls._projection_cache) > settings.dataframe_cache_size:
+                cls._projection_cache.popitem(last=False)
+
+        return df
+
+    @classmethod
+    def get_content_hash(cls, filepath: str) -> str:
+        """获取文件内容的 SHA-256 哈希，文件未修改时直接返回缓存结果"""
+        stat = os.stat(filepath)
+        version = (stat.st_mtime, stat.st_size)
+
+        with cls._cache_lock:
+            cached = cls._content_hashes.get(filepath)
+            if cached is not None and cached[0] == version:
+                return cached[1]
+
+        digest = hashlib.sha256()
+        with open(filepath, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(chunk)
+        content_hash = digest.hexdigest()
+
+        with cls._cache_lock:
+            cls._content_hashes[filepath] = (version, content_hash)
+
+        return content_hash
+
+    @classmethod
+    def evict_cached_dataframe(cls, filepath: str) -> None:
+        """移除缓存的 DataFrame"""
+        with cls._cache_lock:
+            cls._dataframe_cache.pop(filepath, None)
+            cls._content_hashes.pop(filepath, None)
+            for key in [key for key in cls._projection_cache if key[0] == filepath]:
+                del cls._projection_cache[key]
+
+    @staticmethod
+    def _remove_profile(filepath: str) -> None:
+        """删除文件的列概要"""
+        from app.services.profile_service import ProfileService
+        ProfileService.evict(filepath)
+
     @staticmethod
     def cleanup_file(filepath: str) -> bool:
         """清理文件"""
+        FileService.evict_cached_dataframe(filepath)
+        FileService._remove_profile(filepath)
         try:
             if os.path.exists(filepath):
                 os.remove(filepath)
@@ -0,0 +1,243 @@
+"""后台分析任务服务
+
+耗时较长的分析不必占用一个 SSE 连接：提交后立即返回任务ID，工作流在有并发上限的后台任务中执行，
+产生的事件按顺序缓存在任务的事件缓冲区中。客户端可以轮询任务状态，也可以从任意事件序号重新订阅事件流。
+完成的任务连同全部事件写入 job_results_dir，任务移出内存或服务重启后仍可直接读取结果，无需重新计算。
+"""
+import os
+import json
+import uuid
+import asyncio
+from collections import OrderedDict
+from datetime import datetime
+from typing import AsyncGenerator, List, Optional, Set, Tuple
+from app.core.config import settings
+from app.models.schemas import ChatJob, ChatStreamEvent, Session
+from app.services.chat_service import ChatService
+from app.services.event_buffer import EventBuffer
+from app.agents.cancellation import CancellationToken
+from app.core.logging_config import get_app_logger
+
+logger = get_app_logger('job_service')
+
+FINISHED_STATUSES = ("completed", "failed")
+
+
+class JobQueueFullError(Exception):
+    """排队与执行中的任务数达到上限"""
+    pass
+
+
+class _Job:
+    """执行中或内存中保留的任务"""
+
+    def __init__(self, info: ChatJob, message: str, session: Session):
+        self.info = info
+        self.message = message
+        self.session = session
+        # 保留全部事件，用于重放和保存结果
+        self.buffer = EventBuffer()
+        self.cancel_token = CancellationToken(f"任务 {info.id}")
+
+    @property
+    def finished(self) -> bool:
+        return self.info.status in FINISHED_STATUSES
+
+    def touch(self) -> None:
+        self.info.updated_at = datetime.now().isoformat()
+
+    def append(self, event: ChatStreamEvent) -> None:
+        self.info.event_count = self.buffer.append(event)
+        self.touch()
+
+
+class JobService:
+    """后台分析任务管理"""
+
+    # 任务ID -> 任务（执行中的任务和最近完成的任务）
+    _jobs: "OrderedDict[str, _Job]" = OrderedDict()
+    # 执行中的 asyncio 任务（保持引用，避免被回收）
+    _tasks: Set[asyncio.Task] = set()
+    _semaphore: Optional[asyncio.Semaphore] = None
+    _semaphore_loop: Optional[asyncio.AbstractEventLoop] = None
+
+    @classmethod
+    def _get_semaphore(cls) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        if cls._semaphore is None or cls._semaphore_loop is not loop:
+            cls._semaphore = asyncio.Semaphore(settings.job_max_running)
+            cls._semaphore_loop = loop
+        return cls._semaphore
+
+    @classmethod
+    def pending_count(cls) -> int:
+        """排队与执行中的任务数"""
+        return sum(1 for job in cls._jobs.values() if not job.finished)
+
+    @classmethod
+    def has_capacity(cls) -> bool:
+        """是否还能提交新任务"""
+        return cls.pending_count() < settings.job_max_pending
+
+    @classmethod
+    def submit(cls, session: Session, message: str, message_id: str) -> ChatJob:
+        """
+        提交后台分析任务（需要在事件循环中调用）
+
+        Args:
+            session: 会话
+            message: 用户消息
+            message_id: 任务结果写入的 AI 消息ID
+
+        Returns:
+            任务信息
+
+        Raises:
+            JobQueueFullError: 排队与执行中的任务数达到上限
+        """
+        if not cls.has_capacity():
+            raise JobQueueFullError(f"后台任务已达到上限 {settings.job_max_pending}")
+
+        now = datetime.now().isoformat()
+        info = ChatJob(
+            id=str(uuid.uuid4()),
+            session_id=session.id,
+            message_id=message_id,
+            status="queued",
+            created_at=now,
+            updated_at=now,
+        )
+        job = _Job(info, message, session)
+        cls._jobs[info.id] = job
+
+        task = asyncio.get_running_loop().create_task(cls._run(job))
+        cls._tasks.add(task)
+        task.add_done_callback(cls._tasks.discard)
+        logger.info(f"提交后台任务 {info.id}，会话ID: {session.id}")
+        return info
+
+    @classmethod
+    async def _run(cls, job: _Job) -> None:
+        """执行任务：转发工作流事件，同步更新会话中的 AI 消息"""
+        async with cls._get_semaphore():
+            job.info.status = "running"
+            job.touch()
+            logger.info(f"开始执行后台任务 {job.info.id}")
+            try:
+                async for event in ChatService.process_and_record(
+                    job.message, job.session, job.info.message_id, job.cancel_token
+                ):
+                    if event.type == "thinking" and event.content:
+                        job.info.thinking += event.content
+                    elif event.type == "response" and event.content:
+                        job.info.content += event.content
+                    elif event.type == "error":
+                        job.info.error = event.content
+                    job.append(event)
+                job.info.status = "failed" if job.info.error else "completed"
+            except Exception as e:
+                logger.error(f"后台任务 {job.info.id} 执行出错: {str(e)}", exc_info=True)
+                job.info.error = f"处理消息时出错：{str(e)}"
+                job.info.status = "failed"
+                job.append(ChatStreamEvent(type="error", content=job.info.error))
+            finally:
+                if not job.finished:
+                    # 任务被取消（如服务关闭）
+                    job.info.status = "failed"
+                    job.info.error = job.info.error or "任务已取消"
+                job.touch()
+                cls._persist(job)
+                job.buffer.close()
+                cls._evict_finished()
+                logger.info(f"后台任务 {job.info.id} 结束，状态: {job.info.status}")
+
+    @staticmethod
+    def _result_path(job_id: str) -> Optional[str]:
+        """任务结果文件路径；任务ID不是合法的 UUID 时为 None"""
+        try:
+            job_id = str(uuid.UUID(job_id))
+        except ValueError:
+            return None
+        return os.path.join(settings.job_results_dir, f"{job_id}.json")
+
+    @classmethod
+    def _persist(cls, job: _Job) -> None:
+        """保存已完成任务的结果和事件"""
+        path = cls._result_path(job.info.id)
+        if path is None:
+            logger.error(f"任务ID无效，无法保存后台任务结果: {job.info.id}")
+            return
+        data = {"job": job.info.model_dump(), "events": [event.model_dump() for event in job.buffer.events]}
+        try:
+            with open(path + ".tmp", "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False)
+            os.replace(path + ".tmp", path)
+        except OSError as e:
+            logger.error(f"保存后台任务结果失败: {str(e)}")
+
+    @classmethod
+    def _load(cls, job_id: str) -> Optional[Tuple[ChatJob, List[ChatStreamEvent]]]:
+        """读取已保存的任务结果"""
+        path = cls._result_path(job_id)
+        if path is None or not os.path.exists(path):
+            return None
+        try:
+            with open(path, encoding="utf-8") as f:
+                data = json.load(f)
+            return ChatJob(**data["job"]), [ChatStreamEvent(**event) for event in data["events"]]
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            logger.error(f"读取后台任务结果失败: {str(e)}")
+            return None
+
+    @classmethod
+    def _evict_finished(cls) -> None:
+        """内存中只保留最近完成的 job_memory_size 个任务（结果已保存）"""
+        finished = [job_id for job_id, job in cls._jobs.items() if job.finished]
+        for job_id in finished[:max(0, len(finished) - settings.job_memory_size)]:
+            del cls._jobs[job_id]
+
+    @classmethod
+    def get_job(cls, job_id: str) -> Optional[ChatJob]:
+        """获取任务信息（含目前为止的部分结果）"""
+        job = cls._jobs.get(job_id)
+        if job is not None:
+            return job.info
+        stored = cls._load(job_id)
+        return stored[0] if stored else None
+
+    @classmethod
+    async def shutdown(cls) -> None:
+        """取消执行中的任务（状态记为失败并保存）"""
+        for job in cls._jobs.values():
+            if not job.finished:
+                job.cancel_token.cancel("服务关闭")
+        tasks = list(cls._tasks)
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    @classmethod
+    async def stream_events(cls, job_id: str, after: int = 0) -> AsyncGenerator[Tuple[int, ChatStreamEvent], None]:
+        """
+        订阅任务事件
+
+        先按顺序返回序号大于 after 的已缓存事件，任务未完成时继续等待新事件，直到任务结束。
+
+        Args:
+            job_id: 任务ID
+            after: 客户端已收到的最后一个事件序号（从 1 开始，0 表示从头开始）
+
+        Yields:
+            (事件序号, 事件)
+        """
+        job = cls._jobs.get(job_id)
+        if job is None:
+            stored = cls._load(job_id)
+            events = stored[1] if stored else []
+            for index in range(after, len(events)):
+                yield index + 1, events[index]
+            return
+
+        async for event_id, event in job.buffer.subscribe(after):
+            yield event_id, event
@@ -0,0 +1,199 @@
+"""列概要服务
+
+上传文件时为每一列预先构建近似统计结构（去重计数、分位数）并抽取固定大小的行样本，
+保存在数据文件旁边。代码执行环境中的 profile 变量即为这里的 TableProfile，
+大表上的去重计数、中位数/分位数和典型值问题可以直接从中得到近似结果。
+"""
+import os
+import pickle
+import threading
+import numpy as np
+import pandas as pd
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional, Tuple
+from app.core.config import settings
+from app.services.file_service import FileService
+from app.services.sketches import HyperLogLog, TDigest
+
+# 概要文件的格式版本，结构变化时递增使旧文件失效
+PROFILE_VERSION = 1
+
+
+class ColumnProfile:
+    """单列概要"""
+
+    def __init__(self, name: str, series: pd.Series):
+        self.name = name
+        self.dtype = str(series.dtype)
+        self.count = int(series.notna().sum())
+        self.nulls = int(len(series) - self.count)
+        self.hll = HyperLogLog().add(series)
+        self.digest: Optional[TDigest] = None
+        if pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series):
+            self.digest = TDigest().add(series)
+        self.typical: List[Tuple[Any, int]] = []
+
+    def distinct(self) -> int:
+        """非空值的去重计数（近似）"""
+        return min(self.hll.count(), self.count)
+
+    def distinct_interval(self) -> Tuple[int, int]:
+        """去重计数的 95% 置信区间"""
+        estimate = self.distinct()
+        margin = 1.96 * self.hll.relative_error * estimate
+        return max(0, int(round(estimate - margin))), min(self.count, int(round(estimate + margin)))
+
+    def quantile(self, q: float) -> float:
+        """第 q 分位数（近似，仅数值列）"""
+        if self.digest is None:
+            raise TypeError(f"列 {self.name} 不是数值列，无法计算分位数")
+        return self.digest.quantile(q)
+
+    def quantile_interval(self, q: float) -> Tuple[float, float]:
+        """第 q 分位数的误差范围（按秩误差上界换算）"""
+        if self.digest is None:
+            raise TypeError(f"列 {self.name} 不是数值列，无法计算分位数")
+        return self.digest.quantile_interval(q)
+
+    def median(self) -> float:
+        """中位数（近似）"""
+        return self.quantile(0.5)
+
+    def typical_values(self, n: int = 5) -> List[Tuple[Any, int]]:
+        """行样本中最常见的取值及其在全表中的估计行数"""
+        return self.typical[:n]
+
+    def describe(self) -> Dict[str, Any]:
+        """概要信息，近似值均附带误差范围"""
+        low, high = self.distinct_interval()
+        info = {
+            "column": self.name,
+            "dtype": self.dtype,
+            "count": self.count,
+            "nulls": self.nulls,
+            "distinct": self.distinct(),
+            "distinct_95%": f"{low} ~ {high}（相对误差 ±{1.96 * self.hll.relative_error:.1%}）",
+        }
+        if self.digest is not None and self.count:
+            info["min"] = self.digest.min
+            info["max"] = self.digest.max
+            for q in (0.25, 0.5, 0.75):
+                low_value, high_value = self.quantile_interval(q)
+                info[f"p{int(q * 100)}"] = self.quantile(q)
+                info[f"p{int(q * 100)}_range"] = f"{low_value:.6g} ~ {high_value:.6g}"
+        info["typical"] = self.typical_values()
+        return info
+
+    def __repr__(self) -> str:
+        return f"ColumnProfile({self.name!r}, distinct≈{self.distinct()}, dtype={self.dtype})"
+
+
+class TableProfile:
+    """整表概要：各列概要与均匀行样本"""
+
+    def __init__(self, df: pd.DataFrame, sample_size: int, seed: int = 0):
+        self.version = PROFILE_VERSION
+        self.rows = len(df)
+        # 直接抽取行号，不为每一行生成对象，大表上内存占用只与样本大小有关
+        positions = np.random.default_rng(seed).choice(self.rows, min(sample_size, self.rows), replace=False)
+        self.sample = df.iloc[np.sort(positions)]
+        self.columns: Dict[str, ColumnProfile] = {}
+        scale = self.rows / len(self.sample) if len(self.sample) else 0
+        for column in df.columns:
+            profile = ColumnProfile(str(column), df[column])
+            counts = self.sample[column].value_counts().head(10)
+            profile.typical = [(value, int(round(count * scale))) for value, count in counts.items()]
+            self.columns[str(column)] = profile
+
+    def __getitem__(self, column: str) -> ColumnProfile:
+        return self.columns[str(column)]
+
+    def __contains__(self, column: str) -> bool:
+        return str(column) in self.columns
+
+    def describe(self) -> pd.DataFrame:
+        """全部列的概要信息"""
+        return pd.DataFrame([profile.describe() for profile in self.columns.values()]).set_index("column")
+
+    def __repr__(self) -> str:
+        return f"TableProfile(rows={self.rows}, columns={list(self.columns)}, sample={len(self.sample)})"
+
+
+class ProfileService:
+    """列概要的构建、持久化与缓存"""
+
+    # 文件路径 -> (数据文件修改时间, TableProfile)
+    _profiles: "OrderedDict[str, Tuple[float, TableProfile]]" = OrderedDict()
+    _lock = threading.Lock()
+
+    @staticmethod
+    def profile_path(filepath: str) -> str:
+        """概要文件路径（与数据文件放在一起）"""
+        return filepath + ".profile"
+
+    @staticmethod
+    def build_profile(df: pd.DataFrame) -> TableProfile:
+        """构建 DataFrame 的概要"""
+        return TableProfile(df, settings.profile_sample_size)
+
+    @classmethod
+    def _remember(cls, filepath: str, mtime: float, profile: TableProfile) -> None:
+        with cls._lock:
+            cls._profiles[filepath] = (mtime, profile)
+            cls._profiles.move_to_end(filepath)
+            while len(cls._profiles) > settings.dataframe_cache_size:
+                cls._profiles.popitem(last=False)
+
+    @classmethod
+    def save_profile(cls, filepath: str, df: pd.DataFrame) -> TableProfile:
+        """构建并保存数据文件的概要（上传时调用）"""
+        profile = cls.build_profile(df)
+        path = cls.profile_path(filepath)
+        with open(path + ".tmp", "wb") as f:
+            pickle.dump(profile, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(path + ".tmp", path)
+        cls._remember(filepath, os.path.getmtime(filepath), profile)
+        return profile
+
+    @classmethod
+    def _load_profile(cls, filepath: str, mtime: float) -> Optional[TableProfile]:
+        """读取概要文件，文件不存在、早于数据文件或版本不符时返回 None"""
+        path = cls.profile_path(filepath)
+        try:
+            if os.path.getmtime(path) < mtime:
+                return None
+            with open(path, "rb") as f:
+                profile = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError):
+            return None
+        return profile if getattr(profile, "version", None) == PROFILE_VERSION else None
+
+    @classmethod
+    def get_profile(cls, filepath: str) -> TableProfile:
+        """
+        获取数据文件的概要
+
+        依次查找内存缓存和概要文件；都没有（如升级前上传的文件）时读取数据重新构建并保存。
+        """
+        mtime = os.path.getmtime(filepath)
+        with cls._lock:
+            cached = cls._profiles.get(filepath)
+            if cached is not None and cached[0] == mtime:
+                cls._profiles.move_to_end(filepath)
+                return cached[1]
+
+        profile = cls._load_profile(filepath, mtime)
+        if profile is not None:
+            cls._remember(filepath, mtime, profile)
+            return profile
+        return cls.save_profile(filepath, FileService.get_cached_dataframe(filepath))
+
+    @classmethod
+    def evict(cls, filepath: str) -> None:
+        """移除缓存的概要并删除概要文件"""
+        with cls._lock:
+            cls._profiles.pop(filepath, None)
+        try:
+            os.remove(cls.profile_path(filepath))
+        except OSError:
+            pass
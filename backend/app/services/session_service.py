@@ -43,6 +43,29 @@ class SessionService:
         session.updated_at = datetime.now().isoformat()
         return True
     
+    @classmethod
+    def add_exchange(cls, session_id: str, content: str) -> Optional[Message]:
+        """添加用户消息和 AI 消息占位符，返回 AI 消息；会话不存在时返回 None"""
+        if session_id not in cls._sessions:
+            return None
+        
+        now = datetime.now().isoformat()
+        cls.add_message(session_id, Message(
+            id=str(uuid.uuid4()),
+            type="user",
+            content=content,
+            timestamp=now
+        ))
+        ai_message = Message(
+            id=str(uuid.uuid4()),
+            type="assistant",
+            content="",
+            thinking="",
+            timestamp=now
+        )
+        cls.add_message(session_id, ai_message)
+        return ai_message
+    
     @classmethod
     def update_last_message(
         cls, 
@@ -64,6 +87,30 @@ class SessionService:
         session.updated_at = datetime.now().isoformat()
         return True
     
+    @classmethod
+    def update_message(
+        cls,
+        session_id: str,
+        message_id: str,
+        content: Optional[str] = None,
+        thinking: Optional[str] = None
+    ) -> bool:
+        """按消息ID更新消息（后台任务写入结果时，该消息不一定是最后一条）"""
+        session = cls._sessions.get(session_id)
+        if not session:
+            return False
+        
+        message = next((m for m in reversed(session.messages) if m.id == message_id), None)
+        if message is None:
+            return False
+        if content is not None:
+            message.content = content
+        if thinking is not None:
+            message.thinking = thinking
+        
+        session.updated_at = datetime.now().isoformat()
+        return True
+    
     @classmethod
     def delete_session(cls, session_id: str) -> bool:
         """删除会话"""
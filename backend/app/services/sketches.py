@@ -0,0 +1,187 @@
+"""可合并的近似统计结构
+
+大表上的去重计数、分位数和「典型值」问题可以用固定大小的概要结构近似回答，
+不需要每次扫描全部数据：
+
+- HyperLogLog: 去重计数，相对标准误差 1.04 / sqrt(2^precision)
+- TDigest: 分位数，按秩的误差上界随分位点变化（两端更精确）
+- ReservoirSample: 固定大小的均匀随机样本
+
+三种结构都可以分块构建后合并（merge），合并结果与一次性构建的精度相同。
+"""
+import math
+import numpy as np
+import pandas as pd
+from typing import Any, Optional, Tuple
+
+
+def hash_values(values: Any) -> np.ndarray:
+    """将一列值哈希为 uint64（忽略空值）"""
+    series = pd.Series(values) if not isinstance(values, pd.Series) else values
+    series = series.dropna()
+    if series.empty:
+        return np.empty(0, dtype=np.uint64)
+    return pd.util.hash_pandas_object(series, index=False).to_numpy(dtype=np.uint64)
+
+
+def _bit_length(values: np.ndarray) -> np.ndarray:
+    """uint64 数组每个元素的二进制位数（0 的位数为 0）"""
+    high = (values >> np.uint64(32)).astype(np.float64)
+    low = (values & np.uint64(0xFFFFFFFF)).astype(np.float64)
+    # 小于 2^53 的整数转为浮点数后没有误差，frexp 的指数即为位数
+    return np.where(high > 0, np.frexp(high)[1] + 32, np.frexp(low)[1])
+
+
+class HyperLogLog:
+    """HyperLogLog 去重计数"""
+
+    def __init__(self, precision: int = 14):
+        if not 4 <= precision <= 18:
+            raise ValueError("precision 必须在 4 到 18 之间")
+        self.precision = precision
+        self.registers = np.zeros(1 << precision, dtype=np.uint8)
+
+    @property
+    def relative_error(self) -> float:
+        """估计值的相对标准误差"""
+        return 1.04 / math.sqrt(len(self.registers))
+
+    def add(self, values: Any) -> "HyperLogLog":
+        """加入一列值（空值不计数）"""
+        hashed = hash_values(values)
+        if len(hashed):
+            p = np.uint64(self.precision)
+            index = (hashed >> (np.uint64(64) - p)).astype(np.intp)
+            rest = hashed << p
+            # rest 中最高位 1 的位置（从 1 开始计），全 0 时为 64 - precision + 1
+            rank = np.where(rest == 0, 64 - self.precision + 1, 65 - _bit_length(rest)).astype(np.uint8)
+            np.maximum.at(self.registers, index, rank)
+        return self
+
+    def merge(self, other: "HyperLogLog") -> "HyperLogLog":
+        """合并另一个精度相同的 HyperLogLog"""
+        if other.precision != self.precision:
+            raise ValueError("只能合并精度相同的 HyperLogLog")
+        np.maximum(self.registers, other.registers, out=self.registers)
+        return self
+
+    def count(self) -> int:
+        """去重计数的估计值"""
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / np.sum(np.ldexp(1.0, -self.registers.astype(np.int32)))
+        zeros = int(np.count_nonzero(self.registers == 0))
+        if estimate <= 2.5 * m and zeros:
+            # 基数较小时改用线性计数
+            estimate = m * math.log(m / zeros)
+        return int(round(estimate))
+
+
+class TDigest:
+    """t-digest 分位数估计
+
+    按 k1 尺度函数合并相邻数据点：分位点 q 附近每个质心覆盖的秩宽度约为
+    2π·sqrt(q(1-q)) / compression，两端的质心很小，中位数附近最大。
+    """
+
+    def __init__(self, compression: float = 200):
+        self.compression = compression
+        self.means = np.empty(0, dtype=np.float64)
+        self.weights = np.empty(0, dtype=np.float64)
+        self.min = math.inf
+        self.max = -math.inf
+
+    @property
+    def count(self) -> int:
+        """已加入的数据点数"""
+        return int(self.weights.sum())
+
+    def add(self, values: Any) -> "TDigest":
+        """加入一列数值（空值和无穷值被忽略）"""
+        data = pd.to_numeric(pd.Series(values), errors="coerce").to_numpy(dtype=np.float64, na_value=np.nan)
+        data = data[np.isfinite(data)]
+        if len(data):
+            self.min = min(self.min, float(data.min()))
+            self.max = max(self.max, float(data.max()))
+            self._compress(np.concatenate([self.means, data]), np.concatenate([self.weights, np.ones(len(data))]))
+        return self
+
+    def merge(self, other: "TDigest") -> "TDigest":
+        """合并另一个 t-digest"""
+        if len(other.means):
+            self.min = min(self.min, other.min)
+            self.max = max(self.max, other.max)
+            self._compress(np.concatenate([self.means, other.means]), np.concatenate([self.weights, other.weights]))
+        return self
+
+    def _compress(self, means: np.ndarray, weights: np.ndarray) -> None:
+        order = np.argsort(means, kind="stable")
+        means, weights = means[order], weights[order]
+        total = weights.sum()
+        # 按每个点中间位置的 k 值分组，相邻且 k 值整数部分相同的点合并为一个质心
+        middle = (np.cumsum(weights) - weights / 2) / total
+        k = np.floor(self.compression * (np.arcsin(2 * middle - 1) / math.pi + 0.5))
+        starts = np.flatnonzero(np.r_[True, k[1:] != k[:-1]])
+        grouped = np.add.reduceat(weights, starts)
+        self.means = np.add.reduceat(means * weights, starts) / grouped
+        self.weights = grouped
+
+    def rank_error(self, q: float) -> float:
+        """分位点 q 的估计值按秩计算的误差上界（q 附近质心的完整秩宽度）"""
+        return math.pi * math.sqrt(q * (1 - q)) / self.compression
+
+    def quantile(self, q: float) -> float:
+        """估计第 q 分位数（0 <= q <= 1），没有数据时为 NaN"""
+        if not len(self.means):
+            return math.nan
+        if not 0 <= q <= 1:
+            raise ValueError("q 必须在 0 到 1 之间")
+        total = self.weights.sum()
+        centers = np.cumsum(self.weights) - self.weights / 2
+        positions = np.r_[0.0, centers, total]
+        values = np.r_[self.min, self.means, self.max]
+        return float(np.interp(q * total, positions, values))
+
+    def quantile_interval(self, q: float) -> Tuple[float, float]:
+        """第 q 分位数所在的区间（按秩误差上界换算为取值范围）"""
+        error = self.rank_error(q)
+        return self.quantile(max(0.0, q - error)), self.quantile(min(1.0, q + error))
+
+
+class ReservoirSample:
+    """蓄水池抽样
+
+    每个元素附带一个均匀随机键，保留键最小的 size 个元素（bottom-k 抽样），
+    因此合并两个样本后再取最小的 size 个仍是整体的均匀随机样本。
+    """
+
+    def __init__(self, size: int = 10000, seed: Optional[int] = None):
+        self.size = size
+        self.seen = 0
+        self.values = np.empty(0, dtype=object)
+        self.keys = np.empty(0, dtype=np.float64)
+        self._rng = np.random.default_rng(seed)
+
+    def add(self, values: Any) -> "ReservoirSample":
+        """加入一批元素"""
+        batch = np.asarray(values)
+        self.seen += len(batch)
+        self._keep(np.concatenate([self.values, batch.astype(object)]),
+                   np.concatenate([self.keys, self._rng.random(len(batch))]))
+        return self
+
+    def merge(self, other: "ReservoirSample") -> "ReservoirSample":
+        """合并另一个样本"""
+        self.seen += other.seen
+        self._keep(np.concatenate([self.values, other.values]), np.concatenate([self.keys, other.keys]))
+        return self
+
+    def _keep(self, values: np.ndarray, keys: np.ndarray) -> None:
+        if len(keys) > self.size:
+            chosen = np.argpartition(keys, self.size)[:self.size]
+            values, keys = values[chosen], keys[chosen]
+        self.values, self.keys = values, keys
+
+    def sample(self) -> list:
+        """样本中的元素"""
+        return self.values.tolist()
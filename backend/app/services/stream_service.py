@@ -0,0 +1,200 @@
+"""流式聊天的消息流管理
+
+每条 AI 消息的工作流在独立的 asyncio 任务中执行，事件写入该消息的有界重放缓冲区，
+HTTP 连接只是缓冲区的订阅者。连接断开后工作流继续执行，客户端带着 Last-Event-ID 重新连接后
+从断点继续接收，不会重新执行工作流；全部订阅者断开超过 stream_disconnect_grace 秒仍未重连时，
+通过取消令牌取消工作流，不再为无人接收的回答消耗 LLM 调用和代码执行资源。
+同一会话在 duplicate_submit_window 秒内重复提交的相同消息（如双击发送）直接订阅已有的消息流，不会再执行一次工作流。
+"""
+import time
+import asyncio
+from collections import OrderedDict
+from typing import AsyncGenerator, Optional, Set, Tuple
+from app.core.config import settings
+from app.models.schemas import ChatStreamEvent, Session
+from app.services.chat_service import ChatService
+from app.agents.cancellation import CancellationToken
+from app.agents.scheduler import RunTicket, agent_scheduler
+from app.services.session_service import SessionService
+from app.services.event_buffer import EventBuffer
+from app.core.logging_config import get_app_logger
+
+logger = get_app_logger('stream_service')
+
+
+class _MessageStream:
+    """一条 AI 消息的事件流"""
+
+    def __init__(self, session_id: str, message_id: str, message: str):
+        self.session_id = session_id
+        self.message_id = message_id
+        self.message = message.strip()
+        self.started_at = time.monotonic()
+        self.buffer = EventBuffer(maxlen=settings.stream_replay_size)
+        self.cancel_token = CancellationToken(f"消息 {message_id}")
+        self.subscribers = 0
+        # 全部订阅者断开后等待重连的定时器
+        self.abandon_timer: Optional[asyncio.TimerHandle] = None
+
+    def stop_abandon_timer(self) -> None:
+        if self.abandon_timer is not None:
+            self.abandon_timer.cancel()
+            self.abandon_timer = None
+
+
+class StreamService:
+    """消息流管理"""
+
+    # AI 消息ID -> 消息流（执行中的和最近结束的）
+    _streams: "OrderedDict[str, _MessageStream]" = OrderedDict()
+    # 执行中的 asyncio 任务（保持引用，避免被回收）
+    _tasks: Set[asyncio.Task] = set()
+
+    @classmethod
+    def start(cls, session: Session, message: str, message_id: str, ticket: Optional[RunTicket] = None) -> None:
+        """
+        开始处理消息（需要在事件循环中调用）
+
+        Args:
+            session: 会话
+            message: 用户消息
+            message_id: 回答写入的 AI 消息ID，同时作为消息流ID
+            ticket: 预先向调度器申请的执行名额
+        """
+        stream = _MessageStream(session.id, message_id, message)
+        cls._streams[message_id] = stream
+        task = asyncio.get_running_loop().create_task(cls._run(stream, session, message, ticket))
+        cls._tasks.add(task)
+        task.add_done_callback(cls._tasks.discard)
+
+    @classmethod
+    def open_turn(cls, session: Session, message: str) -> str:
+        """
+        开始一轮对话（需要在事件循环中调用）
+
+        短时间内重复提交的相同消息直接返回已有的消息流；否则申请执行名额，
+        添加用户消息和 AI 消息占位符并开始处理。
+
+        Returns:
+            AI 消息ID（消息流ID）
+
+        Raises:
+            SchedulerFullError: 调度器的等待队列已满
+        """
+        duplicate_id = cls.find_duplicate(session.id, message)
+        if duplicate_id:
+            logger.info(f"重复提交的消息，复用消息流 {duplicate_id}")
+            return duplicate_id
+
+        ticket = agent_scheduler.reserve(session.id)
+        ai_message = SessionService.add_exchange(session.id, message)
+        cls.start(session, message, ai_message.id, ticket)
+        return ai_message.id
+
+    @classmethod
+    def cancel(cls, message_id: str, reason: str) -> bool:
+        """取消消息流的工作流，消息流不存在或已结束时返回 False"""
+        stream = cls._streams.get(message_id)
+        if stream is None or stream.buffer.closed:
+            return False
+        return stream.cancel_token.cancel(reason)
+
+    @classmethod
+    async def _run(
+        cls, stream: _MessageStream, session: Session, message: str, ticket: Optional[RunTicket] = None
+    ) -> None:
+        """执行工作流，把事件写入消息流的缓冲区"""
+        try:
+            logger.debug(f"开始生成消息 {stream.message_id} 的流式响应")
+            async for event in ChatService.process_and_record(
+                message, session, stream.message_id, stream.cancel_token, ticket
+            ):
+                stream.buffer.append(event)
+            logger.info(f"消息 {stream.message_id} 的响应生成完成")
+        except Exception as e:
+            logger.error(f"生成聊天响应时出错: {str(e)}", exc_info=True)
+            stream.buffer.append(ChatStreamEvent(type="error", content=f"处理消息时出错：{str(e)}"))
+        finally:
+            stream.stop_abandon_timer()
+            stream.buffer.close()
+            cls._evict_finished()
+
+    @classmethod
+    def _evict_finished(cls) -> None:
+        """内存中只保留最近结束的 stream_memory_size 个消息流"""
+        finished = [message_id for message_id, stream in cls._streams.items() if stream.buffer.closed]
+        for message_id in finished[:max(0, len(finished) - settings.stream_memory_size)]:
+            del cls._streams[message_id]
+
+    @classmethod
+    def find_duplicate(cls, session_id: str, message: str) -> Optional[str]:
+        """
+        查找同一会话最近 duplicate_submit_window 秒内开始的相同消息的消息流
+
+        Returns:
+            已有消息流的 AI 消息ID，没有时为 None
+        """
+        window = settings.duplicate_submit_window
+        if window <= 0:
+            return None
+        message = message.strip()
+        now = time.monotonic()
+        # 消息流按开始时间顺序保存，从最新的往前找
+        for stream in reversed(list(cls._streams.values())):
+            if now - stream.started_at > window:
+                break
+            if (stream.session_id == session_id and stream.message == message
+                    and not stream.cancel_token.cancelled):
+                return stream.message_id
+        return None
+
+    @classmethod
+    def get_buffer(cls, message_id: str) -> Optional[EventBuffer]:
+        """消息流的事件缓冲区，消息流不存在或已移出内存时为 None"""
+        stream = cls._streams.get(message_id)
+        return stream.buffer if stream else None
+
+    @classmethod
+    async def subscribe(cls, message_id: str, after: int = 0) -> AsyncGenerator[Tuple[int, ChatStreamEvent], None]:
+        """
+        订阅消息流
+
+        Args:
+            message_id: AI 消息ID
+            after: 客户端已收到的最后一个事件序号（0 表示从头开始）
+
+        Yields:
+            (事件序号, 事件)
+
+        Raises:
+            EventGapError: 部分事件已移出重放缓冲区
+        """
+        stream = cls._streams.get(message_id)
+        if stream is None:
+            return
+        stream.subscribers += 1
+        stream.stop_abandon_timer()
+        try:
+            async for event_id, event in stream.buffer.subscribe(after):
+                yield event_id, event
+        finally:
+            stream.subscribers -= 1
+            if stream.subscribers == 0 and not stream.buffer.closed:
+                logger.info(f"消息 {message_id} 的订阅者已全部断开，{settings.stream_disconnect_grace} 秒内未重连将取消工作流")
+                stream.abandon_timer = asyncio.get_running_loop().call_later(
+                    settings.stream_disconnect_grace,
+                    stream.cancel_token.cancel,
+                    "客户端断开连接",
+                )
+
+    @classmethod
+    async def shutdown(cls) -> None:
+        """取消执行中的工作流"""
+        for stream in cls._streams.values():
+            if not stream.buffer.closed:
+                stream.cancel_token.cancel("服务关闭")
+        tasks = list(cls._tasks)
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""测试批量问题执行"""
+
+import os
+import sys
+# 添加项目根目录到 Python 路径
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '../..'))
+
+import asyncio
+import pandas as pd
+
+from app.models.schemas import ChatStreamEvent, FileInfo, Session
+from app.agents.execution import CodeExecutor
+from app.agents.nodes import AgentState, _build_execution_context
+from app.agents.scheduler import AgentScheduler
+from app.services import batch_service
+from app.services.batch_service import BatchService
+from app.services.chat_service import ChatService
+
+
+def test_batch_shares_context_and_limits_concurrency(monkeypatch):
+    """数据上下文只加载一次，问题并发执行且不超过并发上限，单个问题失败不影响其他问题"""
+    session = Session(id="batch-session", created_at="", updated_at="", status="active")
+    loads = []
+    monkeypatch.setattr(BatchService, "load_shared_context", staticmethod(
+        lambda session: loads.append(session.id) or {"data_context_ready": True}
+    ))
+    scheduler = AgentScheduler(max_running=8, max_per_session=1, max_queued=8, retry_after=1)
+    monkeypatch.setattr(batch_service, "agent_scheduler", scheduler)
+
+    async def scenario():
+        active = []
+        peak = []
+
+        async def process_message(message, session, cancel_token=None, ticket=None, initial_context=None):
+            assert initial_context == {"data_context_ready": True}
+            async for _ in scheduler.wait(ticket):
+                pass
+            active.append(message)
+            peak.append(len(active))
+            await asyncio.sleep(0.01)
+            active.remove(message)
+            scheduler.release(ticket)
+            if message == "坏问题":
+                yield ChatStreamEvent(type="error", content="分析失败")
+                return
+            yield ChatStreamEvent(type="response", content=f"{message}的")
+            yield ChatStreamEvent(type="response", content="回答")
+
+        monkeypatch.setattr(ChatService, "process_message", staticmethod(process_message))
+        questions = BatchService.normalize_questions(["销量", " 销量", "", "利润", "坏问题", "成本", "库存"])
+        results = [result async for result in BatchService.run(session, questions, concurrency=2)]
+        return questions, results, max(peak)
+
+    questions, results, peak = asyncio.run(scenario())
+
+    assert questions == ["销量", "利润", "坏问题", "成本", "库存"]
+    assert loads == ["batch-session"]
+    assert peak == 2
+    by_question = {result.question: result for result in results}
+    assert by_question["销量"].status == "completed" and by_question["销量"].answer == "销量的回答"
+    assert by_question["坏问题"].status == "failed" and by_question["坏问题"].error == "分析失败"
+    assert len(results) == 5
+
+
+def test_batch_questions_skip_session_kernel(tmp_path):
+    """批量问题的代码执行不使用会话内核，不会覆盖交互式对话的内核变量"""
+    path = tmp_path / "sales.csv"
+    pd.DataFrame({"region": ["a", "b"], "price": [1, 2]}).to_csv(path, index=False)
+    file_info = FileInfo(filename="sales.csv", filepath=str(path), rows=2, columns=2, size="1 KB", uploaded_at="")
+    session = Session(id="kernel-session", created_at="", updated_at="", status="active", file_info=file_info)
+
+    state = AgentState({"session_id": session.id, "file_info": file_info, **BatchService.load_shared_context(session)})
+    context = _build_execution_context(state, "pandas")
+    assert context.session_id is None and context.filepath == str(path)
+
+    executor = CodeExecutor(mode="inline")
+    executor.execute("batch_total = df['price'].sum()", context)
+    assert executor.get_kernel_variables(session.id) == []
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""测试后台分析任务"""
+
+import os
+import sys
+# 添加项目根目录到 Python 路径
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '../..'))
+
+import asyncio
+import pytest
+
+from app.core.config import settings
+from app.models.schemas import ChatJob, ChatStreamEvent, Message, Session
+from app.services import job_service
+from app.services.chat_service import ChatService
+from app.services.job_service import JobService, JobQueueFullError
+from app.services.session_service import SessionService
+
+
+@pytest.fixture
+def session(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "job_results_dir", str(tmp_path))
+    monkeypatch.setattr(JobService, "_jobs", job_service.OrderedDict())
+
+    session = Session(id="job-session", created_at="", updated_at="", status="active")
+    session.messages.append(Message(id="ai-1", type="assistant", content="", timestamp=""))
+    SessionService._sessions[session.id] = session
+    yield session
+    SessionService._sessions.pop(session.id, None)
+
+
+def fake_process(release: asyncio.Event):
+    async def process_message(message, session, cancel_token=None, ticket=None):
+        yield ChatStreamEvent(type="thinking", content="分析中\n")
+        await release.wait()
+        yield ChatStreamEvent(type="response", content=f"回答：{message}")
+        yield ChatStreamEvent(type="done")
+    return process_message
+
+
+def test_job_runs_in_background_and_resumes(session, monkeypatch):
+    """任务在后台执行，订阅者可以从任意序号继续，完成后结果写入会话并保存"""
+    async def scenario():
+        release = asyncio.Event()
+        monkeypatch.setattr(ChatService, "process_message", staticmethod(fake_process(release)))
+
+        job = JobService.submit(session, "销量", "ai-1")
+        assert job.status == "queued"
+        await asyncio.sleep(0.01)
+        assert JobService.get_job(job.id).status == "running"
+        assert JobService.get_job(job.id).thinking == "分析中\n"
+
+        received = []
+
+        async def subscribe():
+            async for event_id, event in JobService.stream_events(job.id, after=1):
+                received.append((event_id, event.type))
+
+        subscriber = asyncio.create_task(subscribe())
+        await asyncio.sleep(0.01)
+        release.set()
+        await asyncio.wait_for(subscriber, 1)
+        return job.id, received
+
+    job_id, received = asyncio.run(scenario())
+    assert received == [(2, "response"), (3, "done")]
+    assert session.messages[-1].content == "回答：销量"
+
+    # 移出内存后从保存的结果读取
+    JobService._jobs.clear()
+    assert JobService.get_job(job_id).status == "completed"
+
+    async def replay():
+        return [event.type async for _, event in JobService.stream_events(job_id)]
+    assert asyncio.run(replay()) == ["thinking", "response", "done"]
+
+
+def test_job_queue_limit(session, monkeypatch):
+    """排队与执行中的任务数达到上限时拒绝提交"""
+    monkeypatch.setattr(settings, "job_max_pending", 1)
+
+    async def scenario():
+        release = asyncio.Event()
+        monkeypatch.setattr(ChatService, "process_message", staticmethod(fake_process(release)))
+        JobService.submit(session, "a", "ai-1")
+        assert not JobService.has_capacity()
+        with pytest.raises(JobQueueFullError):
+            JobService.submit(session, "b", "ai-1")
+        release.set()
+        await asyncio.gather(*JobService._tasks)
+        assert JobService.has_capacity()
+
+    asyncio.run(scenario())
+    assert JobService.get_job("not-a-job") is None
+
+
+def test_persist_skips_invalid_job_id(session, tmp_path):
+    """任务ID不是合法的 UUID 时不保存结果"""
+    info = ChatJob(id="../escape", session_id=session.id, message_id="ai-1",
+                   status="completed", created_at="", updated_at="")
+    JobService._persist(job_service._Job(info, "销量", session))
+    assert os.listdir(tmp_path) == []
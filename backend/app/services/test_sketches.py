@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""测试近似统计结构与列概要"""
+
+import os
+import sys
+# 添加项目根目录到 Python 路径
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '../..'))
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from app.agents.execution.executor import CodeExecutor, ExecutionContext
+from app.services.profile_service import ProfileService
+from app.services.sketches import HyperLogLog, TDigest, ReservoirSample
+
+
+@pytest.fixture
+def df():
+    rng = np.random.default_rng(0)
+    rows = 200000
+    return pd.DataFrame({
+        "user": rng.integers(0, 50000, rows),
+        "amount": rng.lognormal(3, 1, rows),
+        "city": rng.choice(["北京", "上海", "广州", None], rows, p=[0.5, 0.3, 0.15, 0.05]),
+    })
+
+
+def test_hyperloglog_within_error(df):
+    """去重计数在 3 倍标准误差内，分块构建后合并与整体构建结果相同"""
+    exact = df["user"].nunique()
+    whole = HyperLogLog().add(df["user"])
+    assert abs(whole.count() - exact) / exact < 3 * whole.relative_error
+
+    merged = HyperLogLog().add(df["user"][:100000]).merge(HyperLogLog().add(df["user"][100000:]))
+    assert merged.count() == whole.count()
+    assert HyperLogLog().add(["a", "b", "a", None]).count() == 2
+
+
+def test_tdigest_quantiles_within_rank_error(df):
+    """分位数估计的秩误差不超过误差上界，合并后仍然成立"""
+    values = df["amount"].to_numpy()
+    digest = TDigest().add(values[:50000]).merge(TDigest().add(values[50000:]))
+    assert digest.count == len(values)
+    for q in (0.01, 0.25, 0.5, 0.9, 0.999):
+        rank = (values < digest.quantile(q)).mean()
+        assert abs(rank - q) <= digest.rank_error(q)
+        low, high = digest.quantile_interval(q)
+        assert low <= np.quantile(values, q) <= high
+    assert TDigest().add([1, 2, 3, 4]).quantile(0.5) == 2.5
+
+
+def test_reservoir_sample_is_uniform_after_merge():
+    """合并后的样本大小固定，元素来自各个部分"""
+    left = ReservoirSample(1000, seed=1).add(np.zeros(50000))
+    right = ReservoirSample(1000, seed=2).add(np.ones(50000))
+    sample = left.merge(right).sample()
+    assert len(sample) == 1000
+    assert 400 < sum(sample) < 600
+
+
+def test_profile_persisted_and_used_in_namespace(tmp_path, df):
+    """上传时保存的列概要在代码执行环境中以 profile 提供"""
+    path = tmp_path / "data.csv"
+    df.to_csv(path, index=False)
+    filepath = str(path)
+    ProfileService.save_profile(filepath, pd.read_csv(filepath))
+    ProfileService._profiles.clear()
+
+    profile = ProfileService.get_profile(filepath)
+    assert profile.rows == len(df)
+    assert profile["city"].nulls == df["city"].isna().sum()
+    assert profile["city"].distinct() == 3
+    low, high = profile["user"].distinct_interval()
+    assert low <= df["user"].nunique() <= high
+    with pytest.raises(TypeError):
+        profile["city"].median()
+
+    executor = CodeExecutor(mode="inline")
+    code = "print(profile['user'].distinct(), profile.rows)"
+    result = executor.execute(code, ExecutionContext(filepath=filepath, dataframe=df, columns=list(df.columns)))
+    assert result["success"]
+    assert result["output"].split() == [str(profile["user"].distinct()), str(len(df))]
+
+    ProfileService.evict(filepath)
+    assert not os.path.exists(ProfileService.profile_path(filepath))
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""测试流式响应的重放缓冲区与断线续传"""
+
+import os
+import sys
+# 添加项目根目录到 Python 路径
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '../..'))
+
+import asyncio
+import pytest
+
+from app.api.sse import HEARTBEAT, DONE, event_stream
+from app.models.schemas import ChatStreamEvent, Message, Session
+from app.services import stream_service
+from app.services.chat_service import ChatService
+from app.services.event_buffer import EventBuffer, EventGapError
+from app.services.session_service import SessionService
+from app.services.stream_service import StreamService
+
+
+def test_bounded_buffer_replay():
+    """有界缓冲区只能从仍在缓冲区中的事件之后继续"""
+    async def scenario():
+        buffer = EventBuffer(maxlen=3)
+        for index in range(5):
+            buffer.append(ChatStreamEvent(type="response", content=str(index)))
+        buffer.close()
+        assert buffer.first_id == 3
+        assert buffer.can_resume(2) and not buffer.can_resume(1)
+        replayed = [(event_id, event.content) async for event_id, event in buffer.subscribe(3)]
+        with pytest.raises(EventGapError):
+            async for _ in buffer.subscribe(0):
+                pass
+        return replayed
+
+    assert asyncio.run(scenario()) == [(4, "3"), (5, "4")]
+
+
+def test_stream_survives_disconnect_and_resumes(monkeypatch):
+    """连接断开后工作流继续执行，重连时从 Last-Event-ID 之后继续，空闲时发送心跳"""
+    session = Session(id="stream-session", created_at="", updated_at="", status="active")
+    session.messages.append(Message(id="ai-1", type="assistant", content="", timestamp=""))
+    SessionService._sessions[session.id] = session
+    monkeypatch.setattr(StreamService, "_streams", stream_service.OrderedDict())
+
+    async def scenario():
+        release = asyncio.Event()
+        runs = []
+
+        async def process_message(message, session, cancel_token=None, ticket=None):
+            runs.append(message)
+            yield ChatStreamEvent(type="thinking", content="分析中\n")
+            await release.wait()
+            yield ChatStreamEvent(type="response", content="回答")
+
+        monkeypatch.setattr(ChatService, "process_message", staticmethod(process_message))
+        StreamService.start(session, "销量", "ai-1")
+
+        # 第一个连接收到首个事件和一次心跳后断开
+        first = event_stream(StreamService.subscribe("ai-1"), heartbeat_interval=0.01)
+        received = [await first.__anext__(), await first.__anext__()]
+        await first.aclose()
+
+        release.set()
+        resumed = [chunk async for chunk in event_stream(StreamService.subscribe("ai-1", after=1))]
+        return runs, received, resumed
+
+    try:
+        runs, received, resumed = asyncio.run(scenario())
+    finally:
+        SessionService._sessions.pop(session.id, None)
+
+    assert runs == ["销量"]
+    assert received[0].startswith("id: 1\ndata: ") and received[1] == HEARTBEAT
+    assert resumed[0].startswith("id: 2\ndata: ") and "response" in resumed[0]
+    # 重放的事件与结束标记合并为一次输出
+    assert resumed[-1].endswith(DONE)
+    assert session.messages[-1].content == "回答"
+
+
+def test_buffered_events_are_coalesced():
+    """已在缓冲区中的事件合并为一次输出，窗口为 0 时逐个输出"""
+    async def scenario(window):
+        buffer = EventBuffer()
+        for content in ("分析中\n", "回答"):
+            buffer.append(ChatStreamEvent.model_construct(type="response", content=content))
+        buffer.close()
+        return [chunk async for chunk in event_stream(buffer.subscribe(0), coalesce_window=window)]
+
+    coalesced = asyncio.run(scenario(1.0))
+    assert coalesced == [
+        'id: 1\ndata: {"type":"response","content":"分析中\\n"}\n\n'
+        'id: 2\ndata: {"type":"response","content":"回答"}\n\n' + DONE
+    ]
+    assert len(asyncio.run(scenario(0))) == 3
+
+
+def test_duplicate_submission_reuses_stream(monkeypatch):
+    """短时间内重复提交的相同消息复用已有的消息流"""
+    monkeypatch.setattr(StreamService, "_streams", stream_service.OrderedDict())
+    session = Session(id="dup-session", created_at="", updated_at="", status="active")
+
+    async def scenario():
+        runs = []
+
+        async def process_message(message, session, cancel_token=None, ticket=None):
+            runs.append(message)
+            yield ChatStreamEvent(type="response", content="回答")
+
+        monkeypatch.setattr(ChatService, "process_message", staticmethod(process_message))
+        StreamService.start(session, "销量 ", "ai-1")
+        assert StreamService.find_duplicate("dup-session", "销量") == "ai-1"
+        assert StreamService.find_duplicate("other-session", "销量") is None
+        assert StreamService.find_duplicate("dup-session", "利润") is None
+        await asyncio.gather(*StreamService._tasks)
+
+        # 超过合并时间窗口后视为新的提交
+        monkeypatch.setattr(stream_service.settings, "duplicate_submit_window", 0)
+        assert StreamService.find_duplicate("dup-session", "销量") is None
+        return runs
+
+    assert asyncio.run(scenario()) == ["销量 "]
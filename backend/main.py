@@ -6,6 +6,9 @@ from fastapi.responses import StreamingResponse
 from app.api.routes import router
 from app.core.config import settings
 from app.core.logging_config import LoggingConfig, get_app_logger
+from app.agents.execution import code_executor
+from app.services.job_service import JobService
+from app.services.stream_service import StreamService
 
 # 初始化日志系统
 LoggingConfig.setup_logging()
@@ -26,6 +29,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Message-Id"],
 )
 
 logger.info("CORS 中间件配置完成")
@@ -34,6 +38,19 @@ logger.info("CORS 中间件配置完成")
 app.include_router(router, prefix="/api")
 logger.info("API 路由注册完成")
 
+@app.on_event("startup")
+async def start_code_executor():
+    # 预先创建代码执行进程，避免首次执行时的启动开销
+    code_executor.start()
+    logger.info("代码执行器启动完成")
+
+@app.on_event("shutdown")
+async def stop_code_executor():
+    await JobService.shutdown()
+    await StreamService.shutdown()
+    code_executor.shutdown()
+    logger.info("代码执行器已关闭")
+
 @app.get("/")
 async def root():
     logger.info("健康检查请求")